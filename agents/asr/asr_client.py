@@ -1,22 +1,46 @@
-import sys
-import json
-from dataclasses import asdict
-from messages import Data, Message, Msg
+from messages import Data, EmotionData, Message, Msg
+from publisher import Publisher, StdoutSink
 
 
 class ASRClient(object):
     def __init__(
         self,
         participant_id=None,
+        publisher=None,
     ):
         self.participant_id = participant_id
 
+        # By default, messages are written to standard output as soon as they
+        # are published. A publisher can be shared among clients to publish
+        # to a single sink.
+        self.publisher = (
+            publisher if publisher is not None else Publisher(StdoutSink())
+        )
+
     def publish_transcript(self, transcript: str, is_final: bool, asr_system: str):
         ta3_data = Data(transcript, is_final, asr_system, self.participant_id)
-        json_message_str = json.dumps(
-            asdict(Message(ta3_data, Msg()))
+        self.publisher.publish(
+            Message(ta3_data, Msg()), is_final, self.participant_id
+        )
+
+    def publish_emotion(
+        self,
+        transcript: str,
+        emotion: str,
+        confidence: float,
+        start_time: int,
+        end_time: int,
+    ):
+        emotion_data = EmotionData(
+            transcript,
+            emotion,
+            confidence,
+            start_time,
+            end_time,
+            self.participant_id,
+        )
+        self.publisher.publish(
+            Message(emotion_data, Msg(sub_type="speech_emotion")),
+            True,
+            self.participant_id,
         )
-        print(json_message_str)
-        # We call sys.stdout.flush() to make this program work with piping,
-        # for example, through the jq program.
-        sys.stdout.flush()
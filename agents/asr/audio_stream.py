@@ -1,24 +1,62 @@
 import queue
+from logging import warning
 from utils import get_current_time
+from ring_buffer import AudioRingBuffer
 
-GOOGLE_STREAMING_LIMIT = 240000  # 4 minutes
 
 class AudioStream(object):
     """Opens a stream as a generator that yields audio chunks."""
 
-    def __init__(self):
-        # Create a thread-safe buffer of audio data
-        self._buff = queue.Queue()
+    def __init__(
+        self,
+        sample_rate: int,
+        vad=None,
+        idle_timeout=None,
+        retention: float = 30.0,
+        max_lag: float = 10.0,
+        overflow: str = "drop_oldest",
+    ):
+        """
+        sample_rate: sample rate in Hertz of the (16-bit, mono) audio.
+        vad: optional VoiceActivityDetector. If it is given, only the speech
+            segments it detects are put into the buffer.
+        idle_timeout: optional number of seconds after which the generator
+            stops if no audio has arrived, ending the current request.
+        retention: number of seconds of already consumed audio to keep around
+            for bridging between requests.
+        max_lag: number of seconds of audio the consumer can lag behind before
+            the overflow policy kicks in.
+        overflow: overflow policy of the buffer (see AudioRingBuffer).
+        """
+        self.sample_rate = sample_rate
+
+        # Create a thread-safe, fixed-size buffer of audio data
+        self._buff = AudioRingBuffer(
+            self.ms_to_samples(1000 * (retention + max_lag)),
+            max_unread=self.ms_to_samples(1000 * max_lag),
+            overflow=overflow,
+        )
         self.closed = True
         self.start_time = get_current_time()
-        self.audio_input = []
-        self.last_audio_input = []
         self.result_end_time = 0
         self.is_final_end_time = 0
         self.final_request_end_time = 0
         self.bridging_offset = 0
         self.new_stream = True
         self.restart_counter = 0
+        self.vad = vad
+        self.idle_timeout = idle_timeout
+        self.timed_out = False
+
+        # Buffer positions (in samples) at which the audio of the current
+        # request starts, without and with the bridged audio respectively.
+        # The latter corresponds to time 0 of the recognizer's results.
+        self.stream_start_sample = 0
+        self.request_origin = 0
+
+        # Time 0 of the previous request, or None if there is nothing to
+        # bridge from it.
+        self.last_request_origin = None
 
     def __enter__(self):
         self.closed = False
@@ -28,76 +66,90 @@ class AudioStream(object):
         self.closed = True
         # Signal the generator to terminate so that the client's
         # streaming_recognize method will not block the process termination.
-        self._buff.put(None)
+        self._buff.close()
+
+    def ms_to_samples(self, ms: float) -> int:
+        return int(round(ms * self.sample_rate / 1000))
+
+    def samples_to_ms(self, samples: int) -> int:
+        return int(round(samples * 1000 / self.sample_rate))
+
+    @property
+    def write_pos(self) -> int:
+        """Number of samples put into the buffer so far."""
+        return self._buff.write_pos
+
+    @property
+    def oldest_pos(self) -> int:
+        """Position of the oldest sample still held in the buffer."""
+        return self._buff.oldest
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """Returns the audio between two buffer positions, without consuming
+        it."""
+        return self._buff.read_range(start, end)
 
     def fill_buffer(self, in_data):
         """Continuously collect data from the audio stream, into the buffer."""
-        self._buff.put(in_data)
+        if self.vad is not None:
+            in_data = self.vad.process(in_data)
+            if not in_data:
+                return
+        dropped = self._buff.write(in_data)
+        if dropped:
+            warning(
+                f"ASR consumer is lagging, dropped {self.samples_to_ms(dropped)} "
+                "ms of audio."
+            )
+
+    def wait_for_audio(self) -> bool:
+        """Blocks until there is audio in the buffer. Returns False if the
+        stream was closed instead."""
+        return self._buff.wait()
+
+    def _start_request(self) -> bytes:
+        """Marks the start of a new request and returns the audio to bridge
+        from the previous one."""
+        self.stream_start_sample = self._buff.read_pos
+
+        # If the time limit was reached in the previous request, we prepend
+        # the audio that came after its last final result to the new request,
+        # as long as it is still retained in the buffer.
+        bridge = b""
+        if self.last_request_origin is not None:
+            bridge = self._buff.read_range(
+                self.last_request_origin
+                + self.ms_to_samples(self.final_request_end_time),
+                self.stream_start_sample,
+            )
+
+        self.bridging_offset = self.samples_to_ms(len(bridge) // 2)
+        self.request_origin = self.stream_start_sample - len(bridge) // 2
+        self.new_stream = False
+        return bridge
 
     def generator(self):
         while not self.closed:
 
             data = []
 
-            # If the time limit was reached in the previous iteration of this
-            # loop, then the new_stream property will be true. In this case, we
-            # try to prepend the audio chunks that were missed in between the
-            # requests to the list of chunks for the new request.
-            if self.new_stream and self.last_audio_input:
-
-                chunk_time = GOOGLE_STREAMING_LIMIT / len(
-                    self.last_audio_input
-                )
-
-                if chunk_time != 0:
-                    # We constrain the bridging offset to be between 0 and
-                    # self.final_request_end_time.
-                    self.bridging_offset = min(
-                        self.final_request_end_time,
-                        max(0, self.bridging_offset),
-                    )
-
-                    # Calculate the number of chunks (to use as a starting
-                    # index offset)
-                    chunks_from_ms = round(
-                        (self.final_request_end_time - self.bridging_offset)
-                        / chunk_time
-                    )
-
-                    # Set the new bridging offset
-                    self.bridging_offset = round(
-                        (len(self.last_audio_input) - chunks_from_ms)
-                        * chunk_time
-                    )
-
-                    for i in range(chunks_from_ms, len(self.last_audio_input)):
-                        data.append(self.last_audio_input[i])
-
-                self.new_stream = False
-
-            # Use a blocking get() to ensure there's at least one chunk of
+            if self.new_stream:
+                data.append(self._start_request())
+
+            # Use a blocking read to ensure there's at least one chunk of
             # data, and stop iteration if the chunk is None, indicating the
-            # end of the audio stream.
-            chunk = self._buff.get()
-            self.audio_input.append(chunk)
+            # end of the audio stream. The read returns everything that is
+            # buffered at that point. If an idle timeout is set and no audio
+            # arrives in time, we end the request as well.
+            try:
+                chunk = self._buff.read(timeout=self.idle_timeout)
+            except queue.Empty:
+                self.timed_out = True
+                return
 
             if chunk is None:
                 return
 
             data.append(chunk)
 
-            # Now consume whatever other data's still buffered.
-            while True:
-                try:
-                    chunk = self._buff.get(block=False)
-
-                    if chunk is None:
-                        return
-
-                    data.append(chunk)
-                    self.audio_input.append(chunk)
-
-                except queue.Empty:
-                    break
-
             yield b"".join(data)
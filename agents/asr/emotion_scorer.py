@@ -0,0 +1,143 @@
+"""Module containing the EmotionModel and EmotionScorer classes, which
+estimate the emotion of each final transcript in real time.
+
+The IS10 low-level descriptors of the audio are computed incrementally as
+the audio arrives in a participant's buffer. When a final transcript comes
+in, the descriptors are averaged over its time span and fed, along with the
+transcript, to the multimodal emotion model that is otherwise run offline by
+scripts/run_asist_analysis.
+
+This requires the tomcat_speech package (pip install -e . at the root of the
+repository) and PyTorch.
+"""
+
+import threading
+from logging import debug, warning
+from typing import Optional, Tuple
+import numpy as np
+
+
+class EmotionModel(object):
+    """Pretrained EarlyFusionMultimodalModel along with its GloVe embeddings
+    and preprocessing artifacts, run by the same AsistPredictor as
+    scripts/run_asist_analysis. A single instance can be shared by all
+    participants."""
+
+    def __init__(
+        self,
+        model_path: str,
+        glove_path: str,
+        preprocessing_path: Optional[str] = None,
+    ):
+        try:
+            import pandas as pd
+            from tomcat_speech.data_prep.asist_data.asist_predictor import (
+                AsistPredictor,
+            )
+            from tomcat_speech.data_prep.is10_features import IS10_COLUMNS
+        except ImportError:
+            raise ImportError(
+                "Emotion scoring requires PyTorch and the tomcat_speech "
+                "package (pip install -e . at the root of the repository)."
+            )
+
+        self.pd = pd
+        self.columns = IS10_COLUMNS
+        self.predictor = AsistPredictor(
+            glove_path, model_path, preprocessing=preprocessing_path
+        )
+
+        # The model is not meant to be run by several threads at once.
+        self._lock = threading.Lock()
+
+    def predict(
+        self, features: np.ndarray, transcript: str
+    ) -> Tuple[str, float]:
+        """Returns the most likely emotion of an utterance and its
+        probability, given its transcript and its averaged IS10 descriptors
+        (in the order of IS10_COLUMNS)."""
+
+        utterance = self.pd.DataFrame([features], columns=self.columns)
+        utterance["utt"] = transcript
+        # We do not know who the speaker is.
+        utterance["speaker"] = ""
+        with self._lock:
+            return self.predictor.predict(utterance)[0]
+
+
+class EmotionScorer(object):
+    """Computes the IS10 descriptors of the audio of a stream as it arrives
+    in its buffer, and scores the emotion of utterances.
+
+    Positions are absolute sample positions in the stream's buffer, i.e. on
+    the same timeline as the audio sent to the ASR engine. Descriptors are
+    only kept for the audio that has not been scored yet.
+    """
+
+    def __init__(self, model: EmotionModel, audio_stream, sample_rate: int):
+        self.model = model
+        self.stream = audio_stream
+        self.sample_rate = sample_rate
+        self._reset(0)
+
+    def _reset(self, position: int):
+        """Starts extracting descriptors from a given position."""
+        from tomcat_speech.data_prep.is10_features import (
+            IS10_COLUMNS,
+            IS10Extractor,
+        )
+
+        self._extractor = IS10Extractor(self.sample_rate)
+        self._origin = position
+        self.position = position
+
+        # Descriptors of the frames not scored yet, starting at frame
+        # _first_frame (counted from _origin).
+        self._features = np.zeros((0, len(IS10_COLUMNS)))
+        self._first_frame = 0
+
+    def update(self):
+        """Computes the descriptors of the audio that arrived in the buffer
+        since the last update."""
+        end = self.stream.write_pos
+        start = max(self.position, self.stream.oldest_pos)
+        if start > self.position:
+            warning(
+                "Emotion scoring fell behind the audio buffer, skipping "
+                f"{self.stream.samples_to_ms(start - self.position)} ms."
+            )
+            self._reset(start)
+
+        if end > start:
+            rows = self._extractor.process(self.stream.read_range(start, end))
+            self._features = np.concatenate([self._features, rows])
+            self.position = end
+
+    def score(
+        self, start: int, end: int, transcript: str
+    ) -> Optional[Tuple[str, float]]:
+        """Returns the emotion of the utterance between two positions and its
+        probability, or None if no descriptors are available for it."""
+
+        self.update()
+
+        # Like scripts/align_text_and_acoustic_data, we average the frames
+        # that start within the utterance.
+        step = self._extractor.frame_step
+        frame_positions = (
+            self._origin
+            + (self._first_frame + np.arange(len(self._features))) * step
+        )
+        in_utterance = (frame_positions >= start) & (frame_positions <= end)
+
+        # Frames up to the end of the utterance are no longer needed.
+        features = self._features[in_utterance]
+        done = int(np.count_nonzero(frame_positions <= end))
+        self._features = self._features[done:]
+        self._first_frame += done
+
+        if len(features) == 0:
+            debug(f"No acoustic features for utterance '{transcript}'.")
+            return None
+
+        return self.model.predict(features.mean(axis=0), transcript)
@@ -4,12 +4,13 @@ Parts of this code are taken from the example provided by Google at
 https://github.com/googleapis/python-speech/blob/master/samples/microphone/transcribe_streaming_infinite.py
 """
 
-import json
 import asyncio
 from typing import Optional
 from logging import info
 from utils import get_current_time
 from asr_client import ASRClient
+from publisher import dumps
+from result_shaper import ResultShaper
 import google.cloud.speech
 
 
@@ -21,9 +22,13 @@ class GoogleASRClient(ASRClient):
         chunk_size: Optional[int] = None,
         participant_id=None,
         websocket=None,
+        publisher=None,
+        result_shaper=None,
+        emotion_model=None,
     ):
         super().__init__(
             participant_id=participant_id,
+            publisher=publisher,
         )
         self.chunk_size = int(rate / 10) if chunk_size is None else chunk_size
         self.language_code = "en_US"
@@ -33,6 +38,22 @@ class GoogleASRClient(ASRClient):
         # Enable publishing to websocket.
         self.websocket = websocket
 
+        # Decides which results get published, on both the websocket and the
+        # publisher. By default, only duplicate interim results are dropped.
+        self.result_shaper = (
+            result_shaper if result_shaper is not None else ResultShaper()
+        )
+
+        # If an emotion model is given, the emotion of each final result is
+        # scored from its transcript and audio.
+        self.emotion_scorer = None
+        if emotion_model is not None:
+            from emotion_scorer import EmotionScorer
+
+            self.emotion_scorer = EmotionScorer(
+                emotion_model, audiostream, rate
+            )
+
         # Google Cloud Speech has a limit of 5 minutes for streaming recognition
         # requests (https://cloud.google.com/speech-to-text/quotas)
         # We set a streaming limit of 4 minutes just to be on the safe side.
@@ -60,7 +81,16 @@ class GoogleASRClient(ASRClient):
         with self.stream as stream:
             while not stream.closed:
 
-                stream.audio_input = []
+                if stream.vad is not None:
+                    # With voice activity detection, nothing reaches the
+                    # buffer during silence, so we only open a new request
+                    # once there is speech to transcribe. Otherwise, the
+                    # recognizer would close the request for lack of audio.
+                    if not stream.wait_for_audio():
+                        break
+                    stream.start_time = get_current_time()
+
+                stream.is_final_end_time = 0
 
                 audio_generator = stream.generator()
 
@@ -77,15 +107,41 @@ class GoogleASRClient(ASRClient):
 
                 self.listen_print_loop(responses)
 
-                if stream.result_end_time > 0:
-                    stream.final_request_end_time = stream.is_final_end_time
+                # If the request had no final result, all of its audio is
+                # bridged to the next one.
+                stream.final_request_end_time = stream.is_final_end_time
 
                 stream.result_end_time = 0
-                stream.last_audio_input = stream.audio_input
-                stream.audio_input = []
+                if stream.timed_out:
+                    # The request ended because the audio stopped arriving,
+                    # so the recognizer has already finalized everything it
+                    # received and there is nothing to bridge.
+                    stream.timed_out = False
+                    stream.last_request_origin = None
+                else:
+                    stream.last_request_origin = stream.request_origin
                 stream.restart_counter = stream.restart_counter + 1
                 stream.new_stream = True
 
+    def score_emotion(self, transcript: str, end_time: int):
+        """Scores the emotion of the final result that just came in, whose
+        audio spans from the end of the previous final result of the request
+        to the end of this one."""
+        start = self.stream.request_origin + self.stream.ms_to_samples(
+            self.stream.is_final_end_time
+        )
+        end = self.stream.request_origin + self.stream.ms_to_samples(
+            self.stream.result_end_time
+        )
+        emotion = self.emotion_scorer.score(start, end, transcript)
+        if emotion is None:
+            return
+
+        start_time = self.stream.samples_to_ms(start)
+        if self.stream.vad is not None:
+            start_time = self.stream.vad.input_time_ms(start_time)
+        self.publish_emotion(transcript, *emotion, start_time, end_time)
+
     async def publish_to_websocket(self, message: str):
         await self.websocket.send(message)
 
@@ -140,21 +196,45 @@ class GoogleASRClient(ASRClient):
                 (result_seconds * 1000) + (result_micros / 1000)
             )
 
+            # The buffer is addressed by sample time, so the result end time
+            # is exactly offset by the buffer position at which the audio of
+            # this request (bridged audio included) starts.
             corrected_time = (
-                self.stream.result_end_time
-                - self.stream.bridging_offset
-                + (self.streaming_limit * self.stream.restart_counter)
+                self.stream.samples_to_ms(self.stream.request_origin)
+                + self.stream.result_end_time
             )
 
-            if self.websocket is not None:
-                message = json.dumps(
-                    {"transcript": transcript, "is_final": result.is_final}
-                )
-                asyncio.run(self.publish_to_websocket(message))
-
-            self.publish_transcript(transcript, result.is_final, "Google")
+            if self.stream.vad is not None:
+                # The recognizer only receives the speech segments forwarded
+                # by the voice activity detector, so we map the time back onto
+                # the timeline of the incoming audio.
+                corrected_time = self.stream.vad.input_time_ms(corrected_time)
+
+            if self.emotion_scorer is not None:
+                # Keep the acoustic features up to date with the audio sent
+                # to the recognizer.
+                self.emotion_scorer.update()
+
+            update = self.result_shaper.shape(transcript, result.is_final)
+
+            if update is not None:
+                if self.websocket is not None:
+                    # We only send the part of the transcript that changed
+                    # since the last result sent to the browser.
+                    message = dumps(
+                        {
+                            "prefix_length": update.prefix_length,
+                            "suffix": update.suffix,
+                            "is_final": update.is_final,
+                        }
+                    ).decode()
+                    asyncio.run(self.publish_to_websocket(message))
+
+                self.publish_transcript(transcript, result.is_final, "Google")
 
             if result.is_final:
+                if self.emotion_scorer is not None:
+                    self.score_emotion(transcript, corrected_time)
                 self.stream.is_final_end_time = self.stream.result_end_time
 
             self.stream.last_transcript_was_final = result.is_final
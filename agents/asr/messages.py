@@ -1,6 +1,6 @@
 import datetime
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Optional, Union
 
 
 @dataclass(frozen=True)
@@ -35,11 +35,21 @@ class Data(object):
     participant_id: Optional[str] = None
 
 
+@dataclass(frozen=True)
+class EmotionData(object):
+    text: str
+    emotion_detected: str
+    confidence_level: float
+    start_time: int
+    end_time: int
+    participant_id: Optional[str] = None
+
+
 @dataclass
 class Message(object):
     """Class to represent a testbed message."""
 
-    data: Data
+    data: Union[Data, EmotionData]
     msg: Msg
     header: Header = field(init=False)
 
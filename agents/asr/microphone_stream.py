@@ -2,8 +2,8 @@ import pyaudio
 from audio_stream import AudioStream
 
 class MicrophoneStream(AudioStream):
-    def __init__(self, sample_rate: int = 44100):
-        super().__init__()
+    def __init__(self, sample_rate: int = 44100, **kwargs):
+        super().__init__(sample_rate, **kwargs)
         self._rate = sample_rate
         self.chunk_size = int(self._rate / 10)
         self._audio_interface = pyaudio.PyAudio()
@@ -26,11 +26,11 @@ class MicrophoneStream(AudioStream):
 
         # Signal the generator to terminate so that the client's
         # streaming_recognize method will not block the process termination.
-        self._buff.put(None)
+        self._buff.close()
         self._audio_interface.terminate()
 
     def _fill_buffer(self, in_data, *args, **kwargs):
         """Continuously collect data from the audio stream, into the buffer."""
 
-        self._buff.put(in_data)
+        self.fill_buffer(in_data)
         return None, pyaudio.paContinue
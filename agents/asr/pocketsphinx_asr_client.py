@@ -3,8 +3,8 @@ from asr_client import ASRClient
 import speech_recognition as sr
 
 class PocketSphinxASRClient(ASRClient):
-    def __init__(self, rate, chunk_size):
-        super().__init__()
+    def __init__(self, rate, chunk_size, publisher=None):
+        super().__init__(publisher=publisher)
         self.recognizer = sr.Recognizer()
         self.source = sr.Microphone(
             sample_rate=rate, chunk_size=chunk_size
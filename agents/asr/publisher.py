@@ -0,0 +1,240 @@
+"""Module containing the Publisher class and the sinks it can publish to.
+
+Messages are serialized to newline-delimited JSON and written to a sink
+(standard output, a file, a TCP socket or an MQTT message bus) over a single
+persistent connection. Optionally, messages are collected for a short window
+and written in batches, with interim ASR results coalesced so that only the
+latest hypothesis per participant is published.
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import socket
+import threading
+from dataclasses import asdict, is_dataclass
+from logging import info, warning
+from typing import Optional
+from urllib.parse import urlparse
+
+try:
+    import orjson
+
+    def dumps(obj) -> bytes:
+        """Serializes a message (dataclass or dict) to JSON bytes."""
+        return orjson.dumps(obj)
+
+except ImportError:
+
+    def dumps(obj) -> bytes:
+        """Serializes a message (dataclass or dict) to JSON bytes."""
+        if is_dataclass(obj):
+            obj = asdict(obj)
+        return json.dumps(obj).encode()
+
+
+def write_lines(fd: int, lines: list):
+    """Writes lines to a file descriptor, grouping them into unbuffered writes
+    of at most PIPE_BUF bytes when possible. Such writes to a pipe are atomic,
+    so the output of several processes sharing the same pipe (e.g. the worker
+    processes of the agent) does not get interleaved within a line."""
+
+    batch = b""
+    for line in lines:
+        line = line + b"\n"
+        if batch and len(batch) + len(line) > select.PIPE_BUF:
+            os.write(fd, batch)
+            batch = b""
+        batch += line
+    if batch:
+        os.write(fd, batch)
+
+
+class StdoutSink(object):
+    """Writes messages to standard output."""
+
+    def write(self, lines: list):
+        # We write to the file descriptor directly, bypassing Python's
+        # buffering, to make this program work with piping, for example,
+        # through the jq program.
+        sys.stdout.flush()
+        write_lines(sys.stdout.fileno(), lines)
+
+    def close(self):
+        sys.stdout.flush()
+
+
+class FileSink(object):
+    """Appends messages to a file."""
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def write(self, lines: list):
+        write_lines(self.fd, lines)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SocketSink(object):
+    """Sends messages over a persistent TCP connection, reconnecting once if
+    the connection was lost."""
+
+    def __init__(self, host: str, port: int):
+        self.address = (host, port)
+        self.socket = None
+
+    def _connect(self):
+        self.socket = socket.create_connection(self.address)
+        info(f"Connected to {self.address[0]}:{self.address[1]}.")
+
+    def write(self, lines: list):
+        data = b"".join(line + b"\n" for line in lines)
+        for attempt in range(2):
+            try:
+                if self.socket is None:
+                    self._connect()
+                self.socket.sendall(data)
+                return
+            except OSError as e:
+                warning(f"Could not send messages to {self.address}: {e}")
+                self.close()
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+class MQTTSink(object):
+    """Publishes each message to a topic on an MQTT message bus, using a
+    single client connection with a background network loop."""
+
+    def __init__(self, host: str, port: int = 1883, topic: str = "agents/asr"):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise ImportError(
+                "Publishing to MQTT requires the paho-mqtt package "
+                "(pip install paho-mqtt)."
+            )
+
+        self.topic = topic
+        self.client = mqtt.Client()
+        self.client.connect(host, port)
+        self.client.loop_start()
+
+    def write(self, lines: list):
+        for line in lines:
+            self.client.publish(self.topic, line)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def make_sink(destination: str):
+    """Creates a sink from a destination string, which can be one of:
+    stdout
+    file:<path>
+    tcp://<host>:<port>
+    mqtt://<host>[:<port>][/<topic>]
+    """
+
+    if destination == "stdout":
+        return StdoutSink()
+
+    if destination.startswith("file:"):
+        return FileSink(destination[len("file:") :])
+
+    url = urlparse(destination)
+    if url.scheme == "tcp":
+        return SocketSink(url.hostname, url.port)
+    if url.scheme == "mqtt":
+        topic = url.path.lstrip("/") or "agents/asr"
+        return MQTTSink(url.hostname, url.port or 1883, topic)
+
+    raise ValueError(f"Unsupported publishing destination: {destination}")
+
+
+class Publisher(object):
+    """Publishes messages to a sink.
+
+    If window is 0, every message is serialized and written as soon as it is
+    published. Otherwise, messages are collected by a background thread and
+    written every `window` seconds. Within a window, an interim result
+    replaces the previous pending interim result of the same participant, and
+    a final result replaces it as well, so the amount of serialization and
+    I/O does not grow with the rate of interim results. Messages of a given
+    participant are always written in the order they were published.
+    """
+
+    def __init__(self, sink, window: float = 0.0):
+        self.sink = sink
+        self.window = window
+        self.closed = False
+
+        self._lock = threading.Condition()
+
+        # List of pending messages, and the index in that list of the pending
+        # interim result of each participant.
+        self._pending = []
+        self._interim_index = {}
+
+        if self.window > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def publish(
+        self,
+        message,
+        is_final: bool = True,
+        participant_id: Optional[str] = None,
+    ):
+        if self.window <= 0:
+            self.sink.write([dumps(message)])
+            return
+
+        with self._lock:
+            index = self._interim_index.pop(participant_id, None)
+            if index is not None:
+                self._pending[index] = message
+            else:
+                index = len(self._pending)
+                self._pending.append(message)
+
+            if not is_final:
+                self._interim_index[participant_id] = index
+
+            self._lock.notify()
+
+    def flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._interim_index = {}
+
+        if pending:
+            self.sink.write([dumps(message) for message in pending])
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._pending or self.closed)
+                if self.closed:
+                    return
+            # Give later messages a chance to coalesce with the pending ones.
+            time.sleep(self.window)
+            self.flush()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._lock.notify()
+        if self.window > 0:
+            self._thread.join()
+        self.flush()
+        self.sink.close()
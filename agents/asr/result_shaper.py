@@ -0,0 +1,68 @@
+"""Module containing the ResultShaper class."""
+
+import time
+from dataclasses import dataclass
+from os.path import commonprefix
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ResultUpdate(object):
+    """A result to publish, along with its difference to the previously
+    published result of the same utterance: the receiver obtains the full
+    transcript by keeping the first `prefix_length` characters of the previous
+    transcript and appending `suffix` to them."""
+
+    transcript: str
+    is_final: bool
+    prefix_length: int
+    suffix: str
+
+
+class ResultShaper(object):
+    """Decides which results of a participant get published.
+
+    Final results are always published. Interim results are dropped if they
+    are identical to the last published result, or if they come less than
+    `min_interval` seconds after the last published interim result. Since
+    every interim result carries the full transcript so far, the next one
+    that gets through supersedes the ones that were dropped.
+    """
+
+    def __init__(self, min_interval: float = 0.0):
+        self.min_interval = min_interval
+
+        # Transcript of the last published result of the current utterance,
+        # and the time at which the last interim result was published.
+        self._last_transcript = ""
+        self._last_interim_time = None
+
+    def shape(self, transcript: str, is_final: bool) -> Optional[ResultUpdate]:
+        """Returns the update to publish for a result, or None if the result
+        should not be published."""
+
+        now = time.monotonic()
+
+        if not is_final:
+            if transcript == self._last_transcript:
+                return None
+            if (
+                self._last_interim_time is not None
+                and now - self._last_interim_time < self.min_interval
+            ):
+                return None
+            self._last_interim_time = now
+
+        prefix_length = len(commonprefix((self._last_transcript, transcript)))
+        update = ResultUpdate(
+            transcript, is_final, prefix_length, transcript[prefix_length:]
+        )
+
+        if is_final:
+            # The next result belongs to a new utterance.
+            self._last_transcript = ""
+            self._last_interim_time = None
+        else:
+            self._last_transcript = transcript
+
+        return update
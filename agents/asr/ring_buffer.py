@@ -0,0 +1,164 @@
+"""Module containing the AudioRingBuffer class."""
+
+import queue
+import threading
+from typing import Optional
+import numpy as np
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class AudioRingBuffer(object):
+    """Preallocated, thread-safe ring buffer of 16-bit audio samples.
+
+    Samples are addressed by their absolute position in the stream (i.e. the
+    number of samples written before them), so that a range of audio can be
+    retrieved by sample time as long as it is still held in the buffer. The
+    buffer always holds the last `capacity` samples written.
+
+    Samples that have been written but not read yet are limited to
+    `max_unread`. When a write would exceed that limit (i.e. the consumer is
+    lagging), the overflow policy decides what happens:
+        drop_oldest: the oldest unread samples are skipped by the reader.
+        drop_newest: the samples that do not fit are discarded.
+        block: the writer waits for the reader to catch up (for at most
+            `block_timeout` seconds, after which the oldest unread samples
+            are skipped).
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        max_unread: Optional[int] = None,
+        overflow: str = "drop_oldest",
+        block_timeout: Optional[float] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy {overflow}. "
+                f"Choose one of {OVERFLOW_POLICIES}."
+            )
+        self.capacity = capacity
+        self.max_unread = (
+            capacity if max_unread is None else min(max_unread, capacity)
+        )
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self._cond = threading.Condition()
+
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped = 0
+        self.closed = False
+
+    @property
+    def unread(self) -> int:
+        return self.write_pos - self.read_pos
+
+    @property
+    def oldest(self) -> int:
+        """Position of the oldest sample still held in the buffer."""
+        return max(0, self.write_pos - self.capacity)
+
+    def write(self, chunk: bytes) -> int:
+        """Writes a chunk of 16-bit audio to the buffer and returns the number
+        of samples dropped because of the overflow policy."""
+
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        dropped = 0
+
+        with self._cond:
+            if self.overflow == "block":
+                self._cond.wait_for(
+                    lambda: self.closed
+                    or self.unread + len(samples) <= self.max_unread,
+                    self.block_timeout,
+                )
+            elif self.overflow == "drop_newest":
+                space = max(0, self.max_unread - self.unread)
+                dropped = max(0, len(samples) - space)
+                samples = samples[:space]
+
+            self._store(samples)
+
+            # With drop_oldest (or after a blocking write timed out), the
+            # reader skips ahead to the oldest sample it is allowed to lag.
+            if self.unread > self.max_unread:
+                dropped += self.unread - self.max_unread
+                self.read_pos = self.write_pos - self.max_unread
+
+            self.dropped += dropped
+            self._cond.notify_all()
+
+        return dropped
+
+    def _store(self, samples: np.ndarray):
+        n = len(samples)
+        self.write_pos += n
+
+        # Only the last `capacity` samples of a large chunk can be kept.
+        samples = samples[-self.capacity :]
+        start = (self.write_pos - len(samples)) % self.capacity
+        end = start + len(samples)
+
+        if end <= self.capacity:
+            self._data[start:end] = samples
+        else:
+            split = self.capacity - start
+            self._data[start:] = samples[:split]
+            self._data[: end - self.capacity] = samples[split:]
+
+    def _slice(self, start: int, end: int) -> bytes:
+        if end <= start:
+            return b""
+        i, j = start % self.capacity, end % self.capacity
+        if i < j or j == 0:
+            return self._data[i : j or self.capacity].tobytes()
+        return self._data[i:].tobytes() + self._data[:j].tobytes()
+
+    def read(self, block: bool = True, timeout: Optional[float] = None):
+        """Returns all unread samples as bytes, or None if the buffer was
+        closed and everything has been read. Like queue.Queue.get, raises
+        queue.Empty if no samples are available (in time)."""
+
+        with self._cond:
+            if block:
+                self._cond.wait_for(
+                    lambda: self.unread > 0 or self.closed, timeout
+                )
+            if self.unread == 0:
+                if self.closed:
+                    return None
+                raise queue.Empty
+
+            data = self._slice(self.read_pos, self.write_pos)
+            self.read_pos = self.write_pos
+            self._cond.notify_all()
+            return data
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """Returns the samples between two absolute positions as bytes,
+        without moving the read position. The range is clipped to the samples
+        still held in the buffer."""
+
+        with self._cond:
+            start = max(start, self.oldest)
+            end = min(end, self.write_pos)
+            return self._slice(start, end)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until there are unread samples and returns True, or returns
+        False if the buffer was closed (or the timeout expired) instead."""
+
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self.unread > 0 or self.closed, timeout
+            )
+            return self.unread > 0
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
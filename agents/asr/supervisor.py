@@ -0,0 +1,256 @@
+"""Module containing the Supervisor class, which runs the websockets mode of
+the agent on several worker processes behind a single listening port."""
+
+import os
+import json
+import time
+import asyncio
+import tempfile
+import multiprocessing
+from logging import info, warning
+from websocket_server import run_worker
+
+
+class Worker(object):
+    """Handle on a worker process, as seen from the supervisor.
+
+    Messages on the control connection are (kind, request_id, payload)
+    tuples. The worker sends ("ready", None, None) once it listens on its
+    socket, and answers each ("metrics", request_id) request with
+    ("metrics", request_id, metrics), so that answers that come in after
+    their request timed out are told apart from the answer to the current
+    one.
+    """
+
+    def __init__(self, worker_id: int, socket_path: str):
+        self.worker_id = worker_id
+        self.socket_path = socket_path
+        self.process = None
+        self.conn = None
+
+        # Number of connections currently relayed to the worker, and the last
+        # metrics reported by it.
+        self.active = 0
+        self.metrics = {}
+        self.healthy = False
+
+        # Whether the worker said it was ready, when it was started, and the
+        # id of the last request sent to it.
+        self.ready = False
+        self.start_time = None
+        self.request_id = 0
+
+    def start(self, args, timeout: float = 30.0):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=run_worker,
+            args=(self.worker_id, self.socket_path, args, child_conn),
+            daemon=True,
+        )
+        self.process.start()
+        self.ready = False
+        self.start_time = time.monotonic()
+        self.metrics = {}
+
+        # Wait for the worker to listen on its socket. Loading the emotion
+        # model can take longer, in which case the worker is marked ready
+        # when its message comes in.
+        self.healthy = self.receive(None, timeout)
+        if not self.healthy:
+            warning(f"Worker {self.worker_id} is still starting.")
+
+    def receive(self, request_id, timeout: float) -> bool:
+        """Reads the messages of the worker until the answer to a request
+        (or until it is ready, if request_id is None) for at most `timeout`
+        seconds, and returns whether it came in time. Late answers to
+        earlier requests are dropped. This is a blocking call."""
+        deadline = time.monotonic() + timeout
+        try:
+            while self.conn.poll(max(deadline - time.monotonic(), 0)):
+                kind, reply_id, payload = self.conn.recv()
+                if kind == "ready":
+                    self.ready = True
+                    if request_id is None:
+                        return True
+                elif kind == "metrics" and reply_id == request_id:
+                    self.metrics = payload
+                    return True
+        except (OSError, EOFError):
+            pass
+        return False
+
+    def query_metrics(self, timeout: float) -> bool:
+        """Asks the worker for its metrics, and returns whether it answered
+        in time. This is a blocking call."""
+        if not self.ready:
+            return self.receive(None, timeout)
+        self.request_id += 1
+        try:
+            self.conn.send(("metrics", self.request_id))
+        except (OSError, EOFError):
+            return False
+        return self.receive(self.request_id, timeout)
+
+    def is_starting(self, startup_timeout: float) -> bool:
+        """Returns whether the worker is alive and still getting ready, for
+        less than `startup_timeout` seconds."""
+        return (
+            not self.ready
+            and self.process.is_alive()
+            and time.monotonic() - self.start_time < startup_timeout
+        )
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(("stop", None))
+        except (OSError, EOFError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def restart(self, args):
+        self.stop()
+        self.start(args)
+
+
+class Supervisor(object):
+    """Listens on the websocket port and relays each incoming connection to
+    the worker process with the fewest active connections. Each worker runs
+    the websocket server of the agent on its own Unix domain socket, so the
+    audio conversion, recording and ASR client threads of its participants do
+    not compete with other workers for the GIL. If SSL is enabled, it is
+    terminated by the supervisor.
+
+    The supervisor checks the health of the workers through a control
+    connection every `health_interval` seconds, restarting the ones that died
+    or stopped answering. Workers are given `startup_timeout` seconds to get
+    ready before that. If a metrics port is given, connecting to it returns
+    the state of all workers as a JSON object.
+    """
+
+    def __init__(
+        self,
+        args,
+        ssl_context=None,
+        health_interval: float = 5.0,
+        startup_timeout: float = 300.0,
+    ):
+        self.args = args
+        self.ssl_context = ssl_context
+        self.health_interval = health_interval
+        self.startup_timeout = startup_timeout
+        self.socket_dir = tempfile.mkdtemp(prefix="tomcat_asr_agent_")
+        self.workers = [
+            Worker(i, os.path.join(self.socket_dir, f"worker_{i}.sock"))
+            for i in range(args.workers)
+        ]
+
+    def pick_worker(self) -> Worker:
+        candidates = [w for w in self.workers if w.healthy] or self.workers
+        return min(candidates, key=lambda w: w.active)
+
+    async def relay(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_connection(self, client_reader, client_writer):
+        worker = self.pick_worker()
+        worker.active += 1
+        try:
+            worker_reader, worker_writer = await asyncio.open_unix_connection(
+                worker.socket_path
+            )
+            await asyncio.gather(
+                self.relay(client_reader, worker_writer),
+                self.relay(worker_reader, client_writer),
+            )
+        except OSError as e:
+            warning(
+                f"Could not relay connection to worker {worker.worker_id}: "
+                f"{e}"
+            )
+            client_writer.close()
+        finally:
+            worker.active -= 1
+
+    def get_metrics(self) -> dict:
+        return {
+            "workers": [
+                {
+                    "worker": w.worker_id,
+                    "healthy": w.healthy,
+                    "active": w.active,
+                    **w.metrics,
+                }
+                for w in self.workers
+            ]
+        }
+
+    async def handle_metrics_request(self, reader, writer):
+        writer.write(json.dumps(self.get_metrics()).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+
+    async def monitor(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for worker in self.workers:
+                worker.healthy = worker.process.is_alive() and (
+                    await loop.run_in_executor(
+                        None, worker.query_metrics, self.health_interval
+                    )
+                )
+                if not worker.healthy and worker.is_starting(
+                    self.startup_timeout
+                ):
+                    continue
+                if not worker.healthy:
+                    warning(
+                        f"Worker {worker.worker_id} is unhealthy, "
+                        "restarting it."
+                    )
+                    await loop.run_in_executor(None, worker.restart, self.args)
+
+    async def serve(self):
+        for worker in self.workers:
+            worker.start(self.args)
+
+        await asyncio.start_server(
+            self.handle_connection,
+            self.args.ws_host,
+            self.args.ws_port,
+            ssl=self.ssl_context,
+        )
+
+        if self.args.metrics_port is not None:
+            await asyncio.start_server(
+                self.handle_metrics_request,
+                self.args.ws_host,
+                self.args.metrics_port,
+            )
+
+        info(
+            f"Supervisor listening on {self.args.ws_host}:{self.args.ws_port} "
+            f"with {len(self.workers)} workers."
+        )
+        await self.monitor()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            for worker in self.workers:
+                worker.stop()
@@ -0,0 +1,132 @@
+"""Module containing the VoiceActivityDetector class."""
+
+import math
+from bisect import bisect_right
+from collections import deque
+import numpy as np
+
+
+class VoiceActivityDetector(object):
+    """Energy-based streaming voice activity detector.
+
+    Audio is processed in fixed-length frames of 16-bit linear PCM. A frame is
+    considered to contain speech if its RMS level (in dBFS) is at or above a
+    threshold. Once speech has been detected, frames keep being forwarded for
+    a hangover period after the level drops below the threshold, so that word
+    endings and short pauses are not clipped. While no speech is detected, the
+    most recent frames are held in a pre-roll buffer and forwarded ahead of the
+    first speech frame, so that word onsets are not clipped either.
+
+    Since silent audio is dropped, the timeline of the forwarded audio differs
+    from that of the incoming audio. The detector keeps a list of anchors
+    (one per speech segment) that map sample offsets in the forwarded audio to
+    sample offsets in the incoming audio, which can be used to translate the
+    recognizer's timestamps back to the incoming timeline.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: int = 30,
+        threshold_db: float = -45.0,
+        hangover_ms: int = 300,
+        preroll_ms: int = 300,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_size = max(1, int(sample_rate * frame_ms / 1000))
+        self.threshold_db = threshold_db
+        self.hangover_frames = math.ceil(hangover_ms / frame_ms)
+
+        # Each entry is a (input sample offset, frame bytes) tuple.
+        self._preroll = deque(maxlen=math.ceil(preroll_ms / frame_ms))
+
+        # Bytes left over from the previous chunk that did not fill a frame.
+        self._remainder = b""
+        self._hangover = 0
+        self.in_speech = False
+
+        # Number of samples received and forwarded so far.
+        self.samples_in = 0
+        self.samples_out = 0
+
+        # Parallel lists of the forwarded and incoming sample offsets at which
+        # each speech segment starts.
+        self._output_anchors = [0]
+        self._input_anchors = [0]
+
+    def frame_levels(self, frames: np.ndarray) -> np.ndarray:
+        """Returns the RMS level in dBFS of each row of a 2D array of int16
+        samples."""
+
+        rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+        return 20 * np.log10(np.maximum(rms, 1.0) / 32768)
+
+    def process(self, chunk: bytes) -> bytes:
+        """Takes a chunk of 16-bit linear PCM audio and returns the portion of
+        it (possibly preceded by pre-roll audio) that should be forwarded to
+        the recognizer. An empty bytes object is returned during silence."""
+
+        data = self._remainder + chunk
+        frame_bytes = 2 * self.frame_size
+        n_frames = len(data) // frame_bytes
+        self._remainder = data[n_frames * frame_bytes :]
+
+        if n_frames == 0:
+            return b""
+
+        frames = np.frombuffer(
+            data, dtype=np.int16, count=n_frames * self.frame_size
+        ).reshape(n_frames, self.frame_size)
+        is_speech = self.frame_levels(frames) >= self.threshold_db
+
+        output = []
+        for i in range(n_frames):
+            frame = data[i * frame_bytes : (i + 1) * frame_bytes]
+
+            if is_speech[i]:
+                if not self.in_speech:
+                    self._start_segment(output)
+                self._hangover = self.hangover_frames
+                output.append(frame)
+            elif self.in_speech and self._hangover > 0:
+                self._hangover -= 1
+                output.append(frame)
+                if self._hangover == 0:
+                    self.in_speech = False
+            else:
+                self.in_speech = False
+                self._preroll.append((self.samples_in, frame))
+
+            self.samples_in += self.frame_size
+
+        forwarded = b"".join(output)
+        self.samples_out += len(forwarded) // 2
+        return forwarded
+
+    def _start_segment(self, output: list):
+        """Starts a new speech segment, flushing the pre-roll buffer into the
+        output and recording the anchor for the segment."""
+
+        if self._preroll:
+            segment_start = self._preroll[0][0]
+        else:
+            segment_start = self.samples_in
+
+        output_start = self.samples_out + sum(len(x) for x in output) // 2
+        self._output_anchors.append(output_start)
+        self._input_anchors.append(segment_start)
+
+        output.extend(frame for _, frame in self._preroll)
+        self._preroll.clear()
+        self.in_speech = True
+
+    def input_time_ms(self, output_time_ms: float) -> int:
+        """Maps a time (in milliseconds) on the timeline of the forwarded audio
+        to the corresponding time on the timeline of the incoming audio."""
+
+        output_sample = output_time_ms * self.sample_rate / 1000
+        i = bisect_right(self._output_anchors, output_sample) - 1
+        input_sample = self._input_anchors[i] + (
+            output_sample - self._output_anchors[i]
+        )
+        return int(round(input_sample * 1000 / self.sample_rate))
@@ -0,0 +1,203 @@
+"""Module containing the websocket message handler of the ASR agent, and the
+entry point of the worker processes used in multi-process websockets mode."""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import datetime
+import threading
+from uuid import uuid4
+from logging import debug, info
+from urllib.parse import urlparse, parse_qs
+from utils import float32_array_to_int16_array
+from audio_stream import AudioStream
+from publisher import Publisher, make_sink
+from result_shaper import ResultShaper
+from vad import VoiceActivityDetector
+from google_asr_client import GoogleASRClient
+from soundfile import SoundFile
+import numpy as np
+
+# This mutable global variable should be encapsulated in a class in the future.
+# It can be set by listening for a message on the message bus, in order to
+# synchronize recording start and stop timestamps.
+RECORDING_IN_PROGRESS = True
+
+
+def make_audio_stream_kwargs(args, sample_rate: int) -> dict:
+    """Returns the buffering and voice activity detection keyword arguments
+    for an AudioStream, based on the command line arguments."""
+
+    if args is None:
+        return {}
+
+    kwargs = {
+        "retention": args.buffer_retention,
+        "max_lag": args.buffer_max_lag,
+        "overflow": args.buffer_overflow,
+    }
+
+    if args.vad:
+        kwargs["vad"] = VoiceActivityDetector(
+            sample_rate,
+            threshold_db=args.vad_threshold,
+            hangover_ms=args.vad_hangover,
+            preroll_ms=args.vad_preroll,
+        )
+        kwargs["idle_timeout"] = args.vad_idle_timeout
+
+    return kwargs
+
+
+def make_emotion_model(args):
+    """Returns the emotion model given by the command line arguments, or
+    None if emotion scoring is disabled."""
+
+    if args is None or args.emotion_model is None:
+        return None
+
+    from emotion_scorer import EmotionModel
+
+    return EmotionModel(
+        args.emotion_model, args.glove_file, args.emotion_preprocessing
+    )
+
+
+async def message_handler(
+    websocket,
+    path,
+    args=None,
+    publisher=None,
+    emotion_model=None,
+):
+    query_params = parse_qs(urlparse(websocket.path).query)
+
+    participant_id = query_params["id"][0]
+    if participant_id == "null":
+        participant_id = str(uuid4())
+
+    sample_rate = int(query_params["sampleRate"][0])
+
+    await websocket.send(json.dumps({"participantId": participant_id}))
+
+    info(f"Participant {participant_id} is now connected.")
+
+    # Start the audio stream and ASR client.
+    audio_stream = AudioStream(
+        sample_rate, **make_audio_stream_kwargs(args, sample_rate)
+    )
+    asr_client = GoogleASRClient(
+        audio_stream,
+        sample_rate,
+        participant_id=participant_id,
+        websocket=websocket,
+        publisher=publisher,
+        result_shaper=ResultShaper(
+            args.interim_interval if args is not None else 0.0
+        ),
+        emotion_model=emotion_model,
+    )
+    threading.Thread(target=asr_client.run, daemon=True).start()
+
+    # We save the start time of the recording in a JSON metadata file.
+    with open(f"participant_{participant_id}_metadata.json", "w") as f:
+        f.write(
+            json.dumps(
+                {
+                    "recording_start_timestamp": datetime.datetime.utcnow().isoformat()
+                    + "Z",
+                }
+            )
+        )
+
+    # Number of channels. Currently we expect only one channel.
+    n_channels = 1
+
+    with SoundFile(
+        f"participant_{participant_id}.wav",
+        "w",
+        sample_rate,
+        n_channels,
+        "FLOAT",
+    ) as f:
+        async for data in websocket:
+            debug(
+                f"Received chunk of size {len(data)} bytes from browser at "
+                f"{datetime.datetime.utcnow().isoformat()}Z"
+            )
+            if RECORDING_IN_PROGRESS:
+                f.write(np.frombuffer(data, dtype=np.float32))
+
+            chunk = float32_array_to_int16_array(data)
+            audio_stream.fill_buffer(chunk)
+
+
+def run_worker(worker_id: int, socket_path: str, args, conn):
+    """Entry point of a worker process in multi-process websockets mode.
+
+    The worker serves websocket connections relayed by the supervisor on a
+    Unix domain socket, and answers the supervisor's requests on the control
+    connection `conn` (see supervisor.Worker): a ("metrics", request_id)
+    request is answered with a dict of metrics, and ("stop", None) stops
+    the worker.
+    """
+    import websockets
+
+    logging.basicConfig(level=logging.WARNING)
+
+    # Each worker publishes messages over its own connection.
+    publisher = Publisher(make_sink(args.publish_to), args.publish_window)
+    emotion_model = make_emotion_model(args)
+
+    start_time = time.time()
+    metrics = {"participants": 0, "connections": 0}
+
+    async def handler(websocket, path):
+        metrics["participants"] += 1
+        metrics["connections"] += 1
+        try:
+            await message_handler(
+                websocket,
+                path,
+                args=args,
+                publisher=publisher,
+                emotion_model=emotion_model,
+            )
+        finally:
+            metrics["participants"] -= 1
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        server = await websockets.unix_serve(handler, socket_path)
+        conn.send(("ready", None, None))
+
+        while True:
+            kind, request_id = await loop.run_in_executor(None, conn.recv)
+            if kind == "stop":
+                break
+            conn.send(
+                (
+                    "metrics",
+                    request_id,
+                    {
+                        "worker": worker_id,
+                        "pid": os.getpid(),
+                        "uptime": time.time() - start_time,
+                        "cpu_time": time.process_time(),
+                        "threads": threading.active_count(),
+                        **metrics,
+                    },
+                )
+            )
+
+        server.close()
+        await server.wait_closed()
+
+    try:
+        asyncio.run(serve())
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        publisher.close()
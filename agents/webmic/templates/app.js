@@ -5,6 +5,11 @@
 
 let connectedAtLeastOnce = false;
 
+// The ASR agent sends transcripts as differences to the previous one: the
+// first prefix_length characters of the previous transcript are kept, and the
+// suffix is appended to them.
+let currentTranscript = "";
+
 
 var processWebSocketMessage = function(event) {
     var data = JSON.parse(event.data);
@@ -12,6 +17,15 @@ var processWebSocketMessage = function(event) {
         document.getElementById("participantId").innerHTML = data["participantId"];
     }
 
+    if ("suffix" in data) {
+        currentTranscript =
+            currentTranscript.slice(0, data["prefix_length"]) + data["suffix"];
+        data["transcript"] = currentTranscript;
+        if (data["is_final"]) {
+            currentTranscript = "";
+        }
+    }
+
     if ("transcript" in data) {
         let transcriptDiv = document.getElementById("transcript")
         transcriptDiv.innerHTML = data["transcript"];
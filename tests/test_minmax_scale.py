@@ -0,0 +1,68 @@
+# test minmax scaling of the acoustic features of the ASIST and LIvES datasets
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from tomcat_speech.data_prep.asist_data.asist_dataset_creation import (
+    AsistDataset,
+)
+from tomcat_speech.data_prep.data_prep_helpers import MinMaxScaler
+from tomcat_speech.data_prep.lives_data.lives_prep import ClinicalDataset
+
+
+def make_dataset(cls, cols_to_skip, acoustic_dict):
+    # only set what minmax scaling uses
+    dataset = cls.__new__(cls)
+    dataset.cols_to_skip = cols_to_skip
+    dataset.acoustic_dict = OrderedDict(acoustic_dict)
+    dataset.min_max_scaler = MinMaxScaler()
+    dataset.get_min_max_scales()
+    dataset.minmax_scale()
+    return dataset
+
+
+def test_asist_minmax_scale_int_features():
+    df = pd.DataFrame(
+        {
+            "speaker": ["a", "b", "a"],
+            "utt": ["hi", "hello there", "bye"],
+            "pcm_loudness_sma": np.array([0, 5, 10], dtype=np.int64),
+            "F0finEnv_sma": [1.0, 2.0, 3.0],
+        }
+    )
+    dataset = make_dataset(AsistDataset, 2, {("s1", "1"): df})
+
+    scaled = dataset.acoustic_dict[("s1", "1")]
+    assert scaled["pcm_loudness_sma"].tolist() == [0.0, 0.5, 1.0]
+    assert scaled["F0finEnv_sma"].tolist() == [0.0, 0.5, 1.0]
+    assert scaled["speaker"].tolist() == ["a", "b", "a"]
+    # the input is left as it was
+    assert df["pcm_loudness_sma"].dtype == np.int64
+
+
+def test_lives_minmax_scale_int_features():
+    calls = {
+        ("s1", 1): pd.DataFrame(
+            {
+                "speaker": [1, 2],
+                "utt_num": [0, 1],
+                "word": ["yes", "no"],
+                "feat": np.array([2, 4], dtype=np.int64),
+            }
+        ),
+        ("s2", 1): pd.DataFrame(
+            {
+                "speaker": [1],
+                "utt_num": [0],
+                "word": ["ok"],
+                "feat": np.array([6], dtype=np.int64),
+            }
+        ),
+    }
+    dataset = make_dataset(ClinicalDataset, 3, calls)
+
+    assert dataset.acoustic_dict[("s1", 1)]["feat"].tolist() == [0.0, 0.5]
+    assert dataset.acoustic_dict[("s2", 1)]["feat"].tolist() == [1.0]
+    assert dataset.acoustic_dict[("s1", 1)]["utt_num"].tolist() == [0, 1]
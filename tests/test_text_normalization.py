@@ -0,0 +1,25 @@
+# test the normalization and encoding of utterances
+
+import numpy as np
+
+from tomcat_speech.data_prep.text_normalization import get_word_indices
+
+WD2IDX = {"<UNK>": 0, "hi": 1, "there": 2, "bye": 3}
+
+
+def test_get_word_indices():
+    indices, lengths = get_word_indices(
+        ["Hi there!", "bye", "hi there"], WD2IDX
+    )
+    assert indices.tolist() == [[1, 2], [3, 0], [1, 2]]
+    assert lengths.tolist() == [2, 1, 2]
+
+
+def test_get_word_indices_missing_utterance():
+    indices, lengths = get_word_indices(
+        ["hi there", np.nan, "bye", None], WD2IDX
+    )
+    # missing utterances are encoded as empty ones (a single <UNK>), not as
+    # another utterance
+    assert indices.tolist() == [[1, 2], [0, 0], [3, 0], [0, 0]]
+    assert lengths.tolist() == [2, 1, 1, 1]
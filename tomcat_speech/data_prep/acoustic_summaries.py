@@ -0,0 +1,101 @@
+# summary statistics (functionals) of the acoustic frames of utterances
+# the statistics of all utterances are computed at once over a single array
+# of frames
+
+import numpy as np
+
+STATS = ("mean", "std", "min", "max")
+
+
+def summarize_frame_ranges(features, first, last, stats=STATS):
+    """
+    Get summary statistics of the rows of a 2D array of features within
+    ranges of rows
+    Range i covers rows first[i] (inclusive) to last[i] (exclusive); ranges
+    may overlap. NaNs are skipped (as in pandas), and empty ranges get NaN.
+    std is the population standard deviation.
+    Returns a dict of stat: (num_ranges, num_features) array
+    """
+    features = np.asarray(features, dtype=np.float64)
+    first = np.asarray(first, dtype=np.int64)
+    last = np.maximum(np.asarray(last, dtype=np.int64), first)
+
+    # each range is reduced on its own with reduceat, on (first, last)
+    # pairs; a row of NaNs at the end makes last valid for all ranges
+    padded = np.vstack([features, np.full((1, features.shape[1]), np.nan)])
+    bounds = np.stack([first, last], axis=1).ravel()
+
+    def reduce(ufunc, values):
+        if len(bounds) == 0:
+            return np.zeros((0, features.shape[1]))
+        return ufunc.reduceat(values, bounds, axis=0)[::2]
+
+    present = ~np.isnan(padded)
+    values = np.where(present, padded, 0.0)
+    counts = reduce(np.add, present.astype(np.float64))
+    # reduceat gives the first row for empty ranges
+    counts[last == first] = 0
+    empty = counts == 0
+
+    summaries = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(empty, np.nan, reduce(np.add, values) / counts)
+        if "mean" in stats:
+            summaries["mean"] = means
+        if "std" in stats:
+            sq_means = reduce(np.add, values**2) / counts
+            summaries["std"] = np.sqrt(np.maximum(sq_means - means**2, 0.0))
+    if "min" in stats:
+        summaries["min"] = np.where(empty, np.nan, reduce(np.fmin, padded))
+    if "max" in stats:
+        summaries["max"] = np.where(empty, np.nan, reduce(np.fmax, padded))
+    return summaries
+
+
+class AcousticSummaries:
+    """
+    Summary statistics of the frames of each item (e.g. utterance) of a
+    dataset
+    keys : the key of each item
+    counts : the number of frames of each item
+    stats : dict of stat: (num_items, num_features) array
+    """
+
+    def __init__(self, keys, counts, stats):
+        self.keys = list(keys)
+        self.counts = np.asarray(counts)
+        self.stats = stats
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+    @classmethod
+    def from_frames(cls, frames_by_key, stats=STATS):
+        """
+        Summarize the frames of all items at once
+        frames_by_key : dict of key: frames of the item (a 2D list, array or
+            dataframe of shape (num_frames, num_features))
+        """
+        keys = list(frames_by_key.keys())
+        frames = [
+            np.asarray(frames_by_key[key], dtype=np.float64) for key in keys
+        ]
+        num_feats = max(
+            (item.shape[-1] for item in frames if item.size), default=0
+        )
+        frames = [item.reshape(-1, num_feats) for item in frames]
+
+        counts = np.array([len(item) for item in frames], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        all_frames = (
+            np.concatenate(frames) if frames else np.zeros((0, num_feats))
+        )
+        summaries = summarize_frame_ranges(
+            all_frames, offsets[:-1], offsets[1:], stats
+        )
+        return cls(keys, counts, summaries)
+
+    def get(self, key, stat="mean"):
+        return self.stats[stat][self.index[key]]
+
+    @property
+    def num_feats(self):
+        return next(iter(self.stats.values())).shape[-1]
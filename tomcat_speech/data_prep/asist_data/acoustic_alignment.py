@@ -0,0 +1,87 @@
+# align utterances from Zoom transcripts with the acoustic features
+# (openSMILE low-level descriptors) of the same recording
+
+import numpy as np
+import pandas as pd
+
+from tomcat_speech.data_prep.acoustic_summaries import summarize_frame_ranges
+
+
+def split_zoom_time(timestamp):
+    """
+    split the hh:mm:ss.sss zoom timestamps to seconds + ms
+    used to calculate start and end of acoustic features
+    """
+    h, m, s = timestamp.split(":")
+    return (float(h) * 60 + float(m)) * 60 + float(s)
+
+
+def summarize_frames(frame_times, features, starts, ends, stats=("mean",)):
+    """
+    Get summary statistics (see acoustic_summaries.STATS) of the feature
+    vectors of the frames whose time is between the start and end of each
+    utterance (both inclusive)
+    frame_times: (num_frames,) array; features: (num_frames, num_features)
+    starts, ends: (num_utterances,) arrays, in the same unit as frame_times
+    Returns a dict of stat: (num_utterances, num_features) array, with NaN
+    for the utterances that contain no frames (as pandas' mean would)
+
+    Frames are sorted once, the boundaries of all utterances are found by
+    binary search, and all utterances are reduced at once, so utterances
+    may overlap and the cost is O((frames + utterances) log frames)
+    instead of O(frames * utterances)
+    """
+    order = np.argsort(frame_times, kind="stable")
+    frame_times = np.asarray(frame_times, dtype=np.float64)[order]
+    features = np.asarray(features, dtype=np.float64)[order]
+
+    lo = np.searchsorted(frame_times, starts, side="left")
+    hi = np.searchsorted(frame_times, ends, side="right")
+    return summarize_frame_ranges(features, lo, hi, stats)
+
+
+def average_frames(frame_times, features, starts, ends):
+    """
+    Average the feature vectors of the frames of each utterance (see
+    summarize_frames)
+    """
+    return summarize_frames(frame_times, features, starts, ends)["mean"]
+
+
+def align_utterances(utt_df, acoustic_df, stats=("mean",)):
+    """
+    Add the averaged acoustic features of each utterance to a dataframe of
+    utterances (with Zoom timestamps in its timestart and timeend columns)
+    acoustic_df: dataframe of openSMILE low-level descriptors, with a
+        frameTime column in seconds
+    stats: the summary statistics to add (see acoustic_summaries.STATS)
+    Returns the utterances with one column per acoustic feature and
+    statistic; the means keep the names of the features, and the columns
+    of other statistics end in _<stat> (e.g. F0final_sma_std)
+    """
+    acoustic_df = acoustic_df.drop(columns=["name"], errors="ignore")
+    col_names = acoustic_df.columns.tolist()
+
+    starts = np.array([split_zoom_time(t) for t in utt_df["timestart"]])
+    ends = np.array([split_zoom_time(t) for t in utt_df["timeend"]])
+
+    summaries = summarize_frames(
+        acoustic_df["frameTime"].to_numpy(),
+        acoustic_df.to_numpy(dtype=np.float64),
+        starts,
+        ends,
+        stats,
+    )
+    acoustic = [
+        pd.DataFrame(
+            summaries[stat],
+            columns=[
+                name if stat == "mean" else f"{name}_{stat}"
+                for name in col_names
+            ],
+            index=utt_df.index,
+        )
+        for stat in stats
+    ]
+
+    return pd.concat([utt_df] + acoustic, axis=1)
@@ -5,15 +5,16 @@ from torch.utils.data import Dataset
 from collections import OrderedDict
 import pandas as pd
 import numpy as np
-import functools
-import operator
 import random
 
+from tomcat_speech.data_prep.cv_folds import CVFolds
 from tomcat_speech.data_prep.data_prep_helpers import (
-    MinMaxScaleRange,
-    clean_up_word,
-    get_avg_vec,
-    scale_feature,
+    MinMaxScaler,
+)
+from tomcat_speech.data_prep.text_normalization import (
+    get_word_indices,
+    get_words,
+    normalize_column,
 )
 
 
@@ -28,7 +29,9 @@ class AsistDataset(Dataset):
         sequence_prep=None,
         truncate_from="start",
         add_avging=False,
-        transcript_type="zoom"
+        transcript_type="zoom",
+        min_max_scaler=None,
+        fold_by=None,
     ):
         """
         :param acoustic_dict: dict of {(sid, call) : data}
@@ -38,10 +41,18 @@ class AsistDataset(Dataset):
         :param norm: the type of data normalization
         :param sequence_prep: the way sequences are handled, options: truncate, pad, None
         :param truncate_from: whether to truncate from start or end of file
+        :param min_max_scaler: a fitted MinMaxScaler to use with minmax norm
+            (e.g. fit on the training data); fit on this data if None
+        :param fold_by: how to make the CV folds: None (randomly), label
+            (stratified) or speaker (all utterances of a speaker together)
         """
-        self.cols_to_skip = 2 if transcript_type.lower() == "zoom" else 4
-        self.acoustic_dict = OrderedDict({key: df[["speaker",
-                "utt",
+        # zoom transcripts have one row per utterance, others one per word
+        if transcript_type.lower() == "zoom":
+            text_cols = ["speaker", "utt"]
+        else:
+            text_cols = ["speaker", "utt_num", "wd_num", "word"]
+        self.cols_to_skip = len(text_cols)
+        self.acoustic_dict = OrderedDict({key: df[text_cols + [
                 "pcm_loudness_sma",
                 "F0finEnv_sma",
                 "voicingFinalUnclipped_sma",
@@ -66,10 +77,11 @@ class AsistDataset(Dataset):
         self.add_avging = add_avging
 
         if norm == "minmax":
-            # currently uses index-keyed min-max for features
-            # should we change it later?
-            self.min_max_scaler = MinMaxScaleRange()
-            self.get_min_max_scales()
+            self.min_max_scaler = min_max_scaler
+            if self.min_max_scaler is None:
+                self.min_max_scaler = MinMaxScaler()
+                self.get_min_max_scales()
+            self.minmax_scale()
 
         self.skipped_files = []
         #Tests gender classifier:print('start')
@@ -87,6 +99,78 @@ class AsistDataset(Dataset):
                 #self.x_speaker_gender, #sa
             ) = self.combine_acoustic_and_glove_wd_level()
 
+        self.make_data(splits, fold_by)
+
+    @classmethod
+    def from_store(
+        cls,
+        store,
+        ys_path=None,
+        splits=3,
+        norm="minmax",
+        sequence_prep=None,
+        min_max_scaler=None,
+        fold_by=None,
+    ):
+        """
+        Make a dataset from the trials in an AsistStore (utterance-level
+        zoom data), without reading or encoding them again
+        Speakers are numbered in the order the store first saw them
+        :param store: an AsistStore
+        :param min_max_scaler: a fitted MinMaxScaler to use with minmax
+            norm; that of the store if None
+        see __init__ for the other params
+        """
+        if sequence_prep == "truncate":
+            raise ValueError("Data from a store cannot be truncated")
+
+        self = cls.__new__(cls)
+        self.glove = store.glove
+        if ys_path is not None:
+            self.ys_df = pd.read_csv(ys_path)
+            self.valid_files = self.ys_df["sid"].tolist()
+        else:
+            self.ys_df = None
+            self.valid_files = None
+        self.norm = norm
+        self.sequence_prep = sequence_prep
+        self.truncate_from = "start"
+        self.add_avging = False
+        self.cols_to_skip = 0
+        self.skipped_files = []
+
+        data = store.load(self.valid_files)
+        # only the keys of the trials are needed
+        self.acoustic_dict = OrderedDict((key, None) for key in data["keys"])
+        if self.valid_files is None:
+            self.valid_files = [key[0] for key in self.acoustic_dict.keys()]
+
+        acoustic = data["acoustic"]
+        if norm == "minmax":
+            self.min_max_scaler = min_max_scaler
+            if self.min_max_scaler is None:
+                self.min_max_scaler = store.min_max_scaler
+            acoustic = self.min_max_scaler.transform(acoustic).astype(
+                np.float32
+            )
+
+        # trim the padding of the words to the longest of these utterances
+        ordered_words = data["words"][:, : data["utt_lengths"].max(initial=0)]
+        self.x_acoustic, self.x_glove = self.prepare_sequences(
+            acoustic, np.ascontiguousarray(ordered_words)
+        )
+        self.x_speaker = data["speakers"].tolist()
+        self.speakers = list(store.speakers)
+        self.x_utt_lengths = data["utt_lengths"].tolist()
+        self.print_sizes(
+            self.x_acoustic, self.x_glove, self.x_speaker, self.x_utt_lengths
+        )
+
+        self.make_data(splits, fold_by)
+        return self
+
+    def make_data(self, splits, fold_by):
+        # combine the inputs with the ys and split the data into folds
         # todo: we should get gender info on participants OR predict it
         # add call to wrapper function that calls the gender classifier
         self.speaker_gender_data = 0
@@ -97,25 +181,30 @@ class AsistDataset(Dataset):
             )
         self.data = self.combine_data()
         self.splits = splits
-        self.data_for_model_input = self.get_data_splits()
+        self.fold_by = fold_by
+        self.folds = self.get_data_splits()
 
         # for working with an individual split
-        self.current_split = []
-        self.current_split_num = 0
-        self.val_split = []
-        self.remaining_splits = []
-
         self.set_split(0)
 
     def get_min_max_scales(self):
+        # get mins and maxes of the acoustic features across all files
         for df in self.acoustic_dict.values():
+            self.min_max_scaler.partial_fit(
+                df.iloc[:, self.cols_to_skip :].to_numpy(dtype=np.float64)
+            )
 
-            for row in df_subset.itertuples():
-                for i, wd in enumerate(row):
-                    if i >= self.cols_to_skip + 1:
-                        self.min_max_scaler.update(
-                            (i - (self.cols_to_skip + 1)), wd
-                        )
+    def minmax_scale(self):
+        # scale the acoustic features of each file in a single pass
+        for key, df in self.acoustic_dict.items():
+            # the scaled features are floats even where the raw ones are ints
+            df = df.astype(
+                {col: np.float64 for col in df.columns[self.cols_to_skip :]}
+            )
+            df.iloc[:, self.cols_to_skip :] = self.min_max_scaler.transform(
+                df.iloc[:, self.cols_to_skip :]
+            )
+            self.acoustic_dict[key] = df
 
     def __len__(self):
         return len(self.current_split)
@@ -125,49 +214,20 @@ class AsistDataset(Dataset):
 
     def set_split(self, n):
         # set the split; n is the TEST split, n-1 is DEV split
-        self.current_split = self.data_for_model_input[n]
+        (
+            self.remaining_splits,
+            self.val_split,
+            self.current_split,
+        ) = self.folds.subsets(self.data, n)
         self.current_split_num = n
-        if n - 1 >= 0:
-            prev = n - 1
-        else:
-            prev = max(self.data_for_model_input.keys())
-        self.val_split = self.data_for_model_input[prev]
-        remaining_splits = [
-            val
-            for key, val in self.data_for_model_input.items()
-            if (key != n and key != prev)
-        ]
-        self.remaining_splits = functools.reduce(
-            operator.iconcat, remaining_splits, []
-        )
 
     def get_data_splits(self):
-        data_dict = {}
-        # calculate length of data
-        total_len = len(self.data)
-        # calculate length of each split based on number
-        split_len = int(total_len / self.splits)
-        # random permutation of indices
-        indices = np.random.permutation(total_len)
-        # get split indices
-        c = 0
-        # for all but final split
-        for split in range(self.splits - 1):
-            split_data = []
-            split_idx = indices[split_len * c : split_len * (c + 1)]
-            # get data for each of the indices
-            for i in split_idx:
-                split_data.append(self.data[i])
-            # add to dict of splits
-            data_dict[c] = split_data
-            c += 1
-        # for final split do the same
-        split_idx = indices[split_len * c :]
-        split_data = []
-        for i in split_idx:
-            split_data.append(self.data[i])
-        data_dict[c] = split_data
-        return data_dict
+        # split the indices of the data into folds
+        labels = None
+        if self.fold_by == "label" and self.ys_df is not None:
+            labels = self.y_data
+        groups = self.x_speaker if self.fold_by == "speaker" else None
+        return CVFolds(len(self.data), self.splits, labels, groups)
 
     def combine_acoustic_and_glove_utt_level(self):
         """
@@ -178,107 +238,39 @@ class AsistDataset(Dataset):
         """
         print("Data prep and normalization starting")
 
-        # set holders for acoustic, words, and speakers
-        acoustic_data = []
-        ordered_words = []
-        ordered_speakers = []
-
-        utt_lengths = []
-
         # skip the the first cols_to_skip columns
         start_idx = self.cols_to_skip
 
         # counter for smallest dataframe for truncation
         # get skipped files based on number of items
         #   e.g. too few utts
+        smallest = None
         if self.sequence_prep == "truncate":
             smallest = self.truncate_seq()
 
-        # get the longest utterance
-
-        longest_utt = get_longest_utterance_asist(
-            [
-                item
-                for key, item in self.acoustic_dict.items()
-                if key[0] in self.valid_files
-            ]
-        )
-
-        speaker_list = []
-        for key, item in self.acoustic_dict.items():
-            if key[0] in self.valid_files:
-                speakers = set(item["speaker"])
-                speaker_list.extend([str(item) for item in speakers])
-
-        all_speakers = sorted(list(set(speaker_list)))
-
-        # iterate through items in the acoustic dict
-        for key, item in self.acoustic_dict.items():
-            # if the item has gold data
-            if key[0] in self.valid_files:
-
-                # for each row in that item's dataframe
-                for idx, row in item.iterrows():
-                    # get the speaker
-                    spkr = str(row["speaker"])
-
-                    # todo: this also includes all researchers
-                    #   should we remove them later?
-                    ordered_speakers.append(all_speakers.index(spkr))
-
-                    # get the word
-                    utt = clean_up_word(row["utt"]).lower()
-                    utt_wds = [0] * longest_utt
-                    wds = [wd for wd in utt.strip().split(" ")]
-                    utt_lengths.append(len(wds))
-                    for i, wd in enumerate(wds):
-                        # save that word's index
-                        if wd in self.glove.wd2idx.keys():
-                            utt_wds[i] = self.glove.wd2idx[wd]
-                        else:
-                            utt_wds[i] = self.glove.wd2idx["<UNK>"]
-
-                    # save the acoustic information in remaining columns
-                    row_vals = row.values[start_idx:].tolist()
-
-                    if self.sequence_prep == "truncate":
-                        ordered_words.append(utt_wds)
-                        acoustic_data.append(row_vals)
-                    else:
-                        ordered_words.append(torch.tensor(utt_wds))
-                        acoustic_data.append(torch.tensor(row_vals))
-
-                    # if using min-max scaling, scale the data
-                    if self.norm == "minmax":
-                        self.minmax_scale(row_vals, lower=0, upper=1)
-
-        # use zero-padding to make all sequences the same length
-        # if we need to pad, we MUST pack
-        if self.sequence_prep == "pad":
-            acoustic_data = nn.utils.rnn.pad_sequence(acoustic_data)
-            ordered_words = nn.utils.rnn.pad_sequence(ordered_words)
+        # all rows of the files with gold data, in order
+        data = pd.concat(self.get_valid_dfs(), ignore_index=True)
 
-            # swap axes to get (total_inputs, length_of_sequence, length_of_vector)
-            acoustic_data = acoustic_data.transpose(0, 1)
-            ordered_words = ordered_words.transpose(0, 1)
+        ordered_speakers = self.get_speaker_codes(data["speaker"])
 
-        elif self.sequence_prep == "truncate":
-            if self.truncate_from == "start":
-                acoustic_data = [item[-smallest:] for item in acoustic_data]
-                ordered_words = [item[-smallest:] for item in ordered_words]
-            else:
-                acoustic_data = [item[:smallest] for item in acoustic_data]
-                ordered_words = [item[:smallest] for item in ordered_words]
+        # get the word indices, padded to the longest utterance
+        ordered_words, utt_lengths = get_word_indices(
+            data["utt"], self.glove.wd2idx
+        )
 
-            acoustic_data = torch.tensor(acoustic_data)
-            ordered_words = torch.tensor(ordered_words)
+        # the acoustic information is in the remaining columns
+        acoustic_data = data.iloc[:, start_idx:].to_numpy(
+            dtype=np.float32, copy=True
+        )
 
-        print("Acoustic data size is: " + str(acoustic_data.shape))
-        print("Ordered words is: " + str(ordered_words.shape))
-        print("Ordered speakers size is: " + str(len(ordered_speakers)))
-        print("Utterance lengths size is: " + str(len(utt_lengths)))
+        acoustic_data, ordered_words = self.prepare_sequences(
+            acoustic_data, ordered_words, smallest
+        )
 
-        print("Data prep and normalization complete")
+        utt_lengths = utt_lengths.tolist()
+        self.print_sizes(
+            acoustic_data, ordered_words, ordered_speakers, utt_lengths
+        )
 
         # return acoustic info, words indices, speaker
         return acoustic_data, ordered_words, ordered_speakers, utt_lengths
@@ -286,141 +278,143 @@ class AsistDataset(Dataset):
     def combine_acoustic_and_glove_wd_level(self):
         """
         Prepare the data when it is word-level aligned
+        Consecutive rows of a file with the same utt_num are an utterance
         """
         print("Data prep and normalization starting")
 
-        # set holders for acoustic, words, and speakers
-        acoustic_data = []
-        ordered_words = []
-        ordered_speakers = []
-
-        utt_lengths = []
-
         # skip the the first cols_to_skip columns
         start_idx = self.cols_to_skip
 
         # counter for smallest dataframe for truncation
         # get skipped files based on number of items
         #   e.g. too few utts
+        smallest = None
         if self.sequence_prep == "truncate":
             smallest = self.truncate_seq()
 
-        # get the longest utterance
-        longest_utt = get_longest_aws_utterance_asist(
-            [
-                item
-                for key, item in self.acoustic_dict.items()
-                if key[0] in self.valid_files
-            ]
-        )
+        dfs = self.get_valid_dfs()
+        data = pd.concat(dfs, ignore_index=True)
 
-        speaker_list = []
-        for key, item in self.acoustic_dict.items():
-            if key[0] in self.valid_files:
-                speakers = set(item["speaker"])
-                speaker_list.extend([str(item) for item in speakers])
+        # find where each utterance starts
+        file_nums = np.repeat(np.arange(len(dfs)), [len(df) for df in dfs])
+        utt_nums = data["utt_num"].to_numpy()
+        new_utt = np.ones(len(data), dtype=bool)
+        new_utt[1:] = (file_nums[1:] != file_nums[:-1]) | (
+            utt_nums[1:] != utt_nums[:-1]
+        )
+        starts = np.flatnonzero(new_utt)
+        utt_ids = np.cumsum(new_utt) - 1
+        utt_lengths = np.diff(np.append(starts, len(data)))
+
+        # the speaker of an utterance is that of its first word
+        ordered_speakers = self.get_speaker_codes(data["speaker"])
+        ordered_speakers = [ordered_speakers[i] for i in starts]
+
+        # put the index of each word at its position in its utterance
+        wds = normalize_column(data["word"].astype(str), lower=True)
+        wd_idxs = wds.map(self.glove.wd2idx)
+        wd_idxs = wd_idxs.fillna(self.glove.wd2idx["<UNK>"]).to_numpy()
+        ordered_words = np.zeros(
+            (len(starts), utt_lengths.max(initial=0)), dtype=np.int64
+        )
+        positions = np.arange(len(data)) - starts[utt_ids]
+        ordered_words[utt_ids, positions] = wd_idxs
+
+        # the acoustic information is in the remaining columns
+        acoustic = data.iloc[:, start_idx:].to_numpy(dtype=np.float64)
+        if self.add_avging:
+            # average acoustic data over the words of each utterance
+            acoustic_data = (
+                np.add.reduceat(acoustic, starts, axis=0)
+                / utt_lengths[:, None]
+            ).astype(np.float32)
+        else:
+            acoustic_data = np.split(acoustic.astype(np.float32), starts[1:])
 
-        all_speakers = sorted(list(set(speaker_list)))
+        acoustic_data, ordered_words = self.prepare_sequences(
+            acoustic_data, ordered_words, smallest
+        )
 
-        print(self.valid_files)
-        # iterate through items in the acoustic dict
-        for key, item in self.acoustic_dict.items():
-            print(f"key is: {key}")
-            # if the item has gold data
-            if key[0] in self.valid_files:
-                # set holders
-                utt_wds = [0] * longest_utt
-                utt_acoustic = []
+        utt_lengths = utt_lengths.tolist()
+        self.print_sizes(
+            acoustic_data, ordered_words, ordered_speakers, utt_lengths
+        )
 
-                utt_num = 0
-                wd_in_utt = 0
-                spkr = None
+        # return acoustic info, words indices, speaker
+        return acoustic_data, ordered_words, ordered_speakers, utt_lengths
 
-                # for each row in that item's dataframe
-                for idx, row in item.iterrows():
-                    # get acoustic data
-                    row_vals = row.values[start_idx:].tolist()
+    def get_valid_dfs(self):
+        # get the dataframes of the files with gold data
+        return [
+            item
+            for key, item in self.acoustic_dict.items()
+            if key[0] in self.valid_files
+        ]
 
-                    # get the word
-                    wd = clean_up_word(row["word"]).lower()
-                    if wd in self.glove.wd2idx.keys():
-                        wd_idx = self.glove.wd2idx[wd]
-                    else:
-                        wd_idx = self.glove.wd2idx["<UNK>"]
-                    # if we are still in the same utterance
-                    if utt_num == row["utt_num"]:
-                        # add the word
-                        utt_wds[wd_in_utt] = wd_idx
-                        wd_in_utt += 1
-                        # get the speaker
-                        spkr = str(row["speaker"])
-                        # add acoustic features to holder
-                        utt_acoustic.append(row_vals)
-                    else:
-                        # reset the holder
-                        if self.sequence_prep == "truncate":
-                            ordered_words.append(utt_wds)
-                        else:
-                            ordered_words.append(torch.tensor(utt_wds))
-                        # average acoustic data, if needed
-                        if self.add_avging:
-                            try:
-                                utt_acoustic = get_avg_vec(utt_acoustic)
-                            except TypeError:
-                                # just keep it the same if it's a flat list
-                                utt_acoustic = utt_acoustic
-                        # add aoustic data to list
-                        if self.sequence_prep == "truncate":
-                            acoustic_data.append(utt_acoustic)
-                        else:
-                            acoustic_data.append(torch.tensor(utt_acoustic))
-                        utt_wds = [0] * longest_utt
-                        # get the length of the utterance
-                        utt_lengths.append(wd_in_utt + 1)
-                        wd_in_utt = 0
-                        # add the new word
-                        utt_wds[0] = wd_idx
-                        # append the speaker
-                        ordered_speakers.append(all_speakers.index(spkr))
-                        # update speaker
-                        spkr = str(row["speaker"])
-
-                    # # if using min-max scaling, scale the data
-                    # todo: reimplement me
-                    # if self.norm == "minmax":
-                    #     self.minmax_scale(row_vals, lower=0, upper=1)
+    def get_speaker_codes(self, speakers):
+        # get the index of each speaker among all (sorted) speakers
+        # todo: this also includes all researchers
+        #   should we remove them later?
+        speakers = speakers.astype(str)
+        all_speakers = sorted(speakers.unique())
+        self.speakers = all_speakers
+        codes = pd.Categorical(speakers, categories=all_speakers).codes
+        return codes.astype(np.int64).tolist()
+
+    def prepare_sequences(self, acoustic_data, ordered_words, smallest=None):
+        """
+        Put the acoustic data and word indices in the form given by
+        sequence_prep
+        :param acoustic_data: a (num_utts, num_feats) array, or a list of
+            (num_wds, num_feats) arrays
+        :param ordered_words: a (num_utts, longest_utt) array
+        :param smallest: the size to truncate to
+        """
+        ordered_words = torch.from_numpy(ordered_words)
 
         # use zero-padding to make all sequences the same length
         # if we need to pad, we MUST pack
         if self.sequence_prep == "pad":
-            acoustic_data = nn.utils.rnn.pad_sequence(acoustic_data)
-            ordered_words = nn.utils.rnn.pad_sequence(ordered_words)
-
-            # swap axes to get (total_inputs, length_of_sequence, length_of_vector)
-            acoustic_data = acoustic_data.transpose(0, 1)
-            ordered_words = ordered_words.transpose(0, 1)
+            if isinstance(acoustic_data, np.ndarray):
+                acoustic_data = torch.from_numpy(acoustic_data)
+            else:
+                # (total_inputs, length_of_sequence, length_of_vector)
+                acoustic_data = nn.utils.rnn.pad_sequence(
+                    [torch.from_numpy(item) for item in acoustic_data],
+                    batch_first=True,
+                )
 
         elif self.sequence_prep == "truncate":
             if self.truncate_from == "start":
-                acoustic_data = [item[-smallest:] for item in acoustic_data]
-                ordered_words = [item[-smallest:] for item in ordered_words]
+                kept = slice(-smallest, None)
             else:
-                acoustic_data = [item[:smallest] for item in acoustic_data]
-                ordered_words = [item[:smallest] for item in ordered_words]
+                kept = slice(None, smallest)
+            acoustic_data = torch.from_numpy(
+                np.stack([item[kept] for item in acoustic_data])
+            )
+            ordered_words = ordered_words[:, kept]
 
-            acoustic_data = torch.tensor(acoustic_data)
-            ordered_words = torch.tensor(ordered_words)
+        else:
+            acoustic_data = [torch.from_numpy(item) for item in acoustic_data]
+            ordered_words = list(ordered_words)
 
-        print("Acoustic data size is: " + str(acoustic_data.shape))
-        print("Ordered words is: " + str(ordered_words.shape))
+        return acoustic_data, ordered_words
+
+    @staticmethod
+    def print_sizes(
+        acoustic_data, ordered_words, ordered_speakers, utt_lengths
+    ):
+        sizes = [
+            getattr(item, "shape", len(item))
+            for item in (acoustic_data, ordered_words)
+        ]
+        print("Acoustic data size is: " + str(sizes[0]))
+        print("Ordered words is: " + str(sizes[1]))
         print("Ordered speakers size is: " + str(len(ordered_speakers)))
         print("Utterance lengths size is: " + str(len(utt_lengths)))
 
         print("Data prep and normalization complete")
 
-        # return acoustic info, words indices, speaker
-        return acoustic_data, ordered_words, ordered_speakers, utt_lengths
-
     def combine_acoustic_and_glove(self):
         """
         Combine acoustic feats + glove indices (speaker info, too)
@@ -487,9 +481,8 @@ class AsistDataset(Dataset):
                     # sys.exit()
 
                     # get the word
-                    utt = clean_up_word(row["utt"]).lower()
                     utt_wds = [0] * longest_utt
-                    wds = [wd for wd in utt.strip().split(" ")]
+                    wds = get_words(row["utt"])
                     intermediate_utt_lengths.append(len(wds))
                     # wds = [clean_up_word(wd) for wd in utt.strip().split(" ")]
                     for i, wd in enumerate(wds):
@@ -505,9 +498,6 @@ class AsistDataset(Dataset):
                     # save the acoustic information in remaining columns
                     row_vals = row.values[start_idx:].tolist()
 
-                    # if using min-max scaling, scale the data
-                    if self.norm == "minmax":
-                        self.minmax_scale(row_vals, lower=0, upper=1)
                     # add acoustic information to intermediate holder
                     intermediate_acoustic.append(row_vals)
                     # print(row_vals)
@@ -606,7 +596,7 @@ class AsistDataset(Dataset):
         # if no gold labels, only combine x data
         all_data = []
 
-        if self.ys_df:
+        if self.ys_df is not None:
             for i, item in enumerate(self.x_acoustic):
                 # todo: this should be fixed earlier in code
                 acoustic_length = len(item)
@@ -637,19 +627,6 @@ class AsistDataset(Dataset):
 
         return all_data
 
-    def minmax_scale(self, df, lower=0, upper=1):
-        # perform min-max scaling
-        for i, val in enumerate(df):
-            new_val = scale_feature(
-                val,
-                self.min_max_scaler.min(i),
-                self.min_max_scaler.max(i),
-                lower,
-                upper,
-            )
-            df[i] = new_val
-        return df
-
     def truncate_seq(self, starting_size=1e10, minimum=1000):
         """
         truncate the sequence of data
@@ -679,13 +656,10 @@ def get_longest_utterance_asist(pd_dataframes):
     """
     max_length = 0
     for item in pd_dataframes:
-        utts = item["utt"]
-        for item in utts:
-            item = clean_up_word(item.lower())
-            item = [wd for wd in item.strip().split(" ")]
-            item_length = len(item)
-            if item_length > max_length:
-                max_length = item_length
+        utts = normalize_column(item["utt"], lower=True)
+        item_length = utts.str.strip().str.split(" ").str.len().max()
+        if item_length > max_length:
+            max_length = item_length
     return max_length
 
 
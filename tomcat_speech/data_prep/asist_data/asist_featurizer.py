@@ -0,0 +1,86 @@
+# encode new ASIST utterances for a trained model with the preprocessing
+# artifacts saved when it was trained, without building a dataset or
+# looking at any other data
+
+import numpy as np
+import torch
+from torch.utils.data import TensorDataset
+
+from tomcat_speech.data_prep.preprocessing_artifacts import GENDERS
+from tomcat_speech.data_prep.text_normalization import get_word_indices
+
+
+class AsistFeaturizer:
+    """
+    artifacts : the PreprocessingArtifacts of the model
+    norm : how to normalize the acoustic features: zscore (with the means
+        and stds of the gender of each speaker, or of all the training data
+        if it is unknown), minmax or None
+    unk_speaker : the index of the speakers the model was not trained on
+    """
+
+    def __init__(self, artifacts, norm="zscore", unk_speaker=0):
+        self.artifacts = artifacts
+        self.norm = norm
+        self.unk_speaker = unk_speaker
+
+        if norm == "zscore":
+            # one row of stats per gender
+            self.means = np.stack(
+                [artifacts.means.get(g, artifacts.means[0]) for g in GENDERS]
+            )
+            stds = np.stack(
+                [artifacts.stds.get(g, artifacts.stds[0]) for g in GENDERS]
+            )
+            # features that never varied are only centered
+            self.stds = np.where(stds == 0, 1.0, stds)
+        elif norm == "minmax" and artifacts.min_max_scaler is None:
+            raise ValueError("The artifacts have no min-max statistics")
+
+    def normalize(self, acoustic, genders):
+        if self.norm == "zscore":
+            return (acoustic - self.means[genders]) / self.stds[genders]
+        elif self.norm == "minmax":
+            return self.artifacts.min_max_scaler.transform(acoustic)
+        return acoustic
+
+    def encode(self, utt_df):
+        """
+        Get the inputs of the model for a dataframe of utterances, with
+        speaker and utt columns and the acoustic features
+        Returns a TensorDataset of (acoustic, words, speaker, gender,
+        utt_length, acoustic_length) items, as in AsistDataset
+        """
+        words, utt_lengths = get_word_indices(
+            utt_df["utt"].astype(str), self.artifacts.wd2idx
+        )
+
+        speakers = [str(spkr) for spkr in utt_df["speaker"]]
+        speaker_idxs = np.array(
+            [
+                self.artifacts.speaker2idx.get(spkr, self.unk_speaker)
+                for spkr in speakers
+            ],
+            dtype=np.int64,
+        )
+        genders = np.array(
+            [self.artifacts.speaker2gender.get(spkr, 0) for spkr in speakers],
+            dtype=np.int64,
+        )
+
+        acoustic = utt_df[self.artifacts.acoustic_columns].to_numpy(
+            dtype=np.float64
+        )
+        acoustic = self.normalize(acoustic, genders).astype(np.float32)
+        # AsistDataset gives the length of averaged features as that of
+        # the feature vector
+        acoustic_lengths = np.full(len(acoustic), acoustic.shape[1])
+
+        return TensorDataset(
+            torch.from_numpy(acoustic),
+            torch.from_numpy(words),
+            torch.from_numpy(speaker_idxs),
+            torch.from_numpy(genders),
+            torch.from_numpy(utt_lengths),
+            torch.from_numpy(acoustic_lengths),
+        )
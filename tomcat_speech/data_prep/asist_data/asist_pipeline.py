@@ -0,0 +1,531 @@
+# run the chain of the Makefile (vtt_to_tsv, ffmpeg, SMILExtract,
+# align_text_and_acoustic_data and run_asist_analysis) on all the missions
+# of a study directory, in a single pool of worker processes
+#
+# Every intermediate file is cached under the name of a hash of the
+# contents of its inputs and of the settings of the stage that produced it,
+# and is written atomically, so an interrupted run picks up where it left
+# off and files are only recomputed when something they depend on changed.
+# The stages of different missions run concurrently, and each worker loads
+# GloVe and the model at most once.
+
+import os
+import re
+import sys
+import gzip
+import json
+import glob
+import hashlib
+import logging
+import subprocess as sp
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+
+from tomcat_speech.data_prep.asist_data.acoustic_alignment import (
+    align_utterances,
+)
+from tomcat_speech.data_prep.asist_data.asist_predictor import (
+    EMOTIONS,
+    AsistPredictor,
+)
+from tomcat_speech.data_prep.audio_io import decode_to_wav
+from tomcat_speech.data_prep.is10_features import save_is10_csv
+
+try:
+    import orjson
+
+    def dumps_line(obj):
+        # numpy scalars are written as numbers
+        return orjson.dumps(
+            obj,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE,
+        )
+
+except ImportError:
+
+    def dumps_line(obj):
+        # written as orjson would; NaN has no JSON form, so it is an error
+        # here as well
+        text = json.dumps(
+            obj, allow_nan=False, ensure_ascii=False, separators=(",", ":")
+        )
+        return (text + "\n").encode()
+
+
+# columns of the acoustic features used by the model
+ACOUSTIC_COLUMNS = [
+    "pcm_loudness_sma",
+    "F0finEnv_sma",
+    "voicingFinalUnclipped_sma",
+    "jitterLocal_sma",
+    "shimmerLocal_sma",
+    "pcm_loudness_sma_de",
+    "F0finEnv_sma_de",
+    "voicingFinalUnclipped_sma_de",
+    "jitterLocal_sma_de",
+    "shimmerLocal_sma_de",
+]
+
+# bump the version of a stage to invalidate its cached outputs when the way
+# they are computed changes
+STAGE_VERSIONS = {
+    "transcript": 1,
+    "audio": 1,
+    "features": 1,
+    "aligned": 1,
+    "predictions": 2,
+}
+
+# a mission is a pair of a Zoom transcript and a recording, named
+# HSRData_AudioTranscript_<name>.vtt and HSRData_Audio_<name>.<media type>
+Mission = namedtuple("Mission", ["name", "vtt_file", "media_file"])
+
+
+def find_missions(data_dir, media_type="m4a"):
+    """
+    Get the missions of a study directory, sorted by name
+    Transcripts without a recording are skipped
+    """
+    missions = []
+    prefix = "HSRData_AudioTranscript_"
+    for vtt_file in sorted(glob.glob(f"{data_dir}/{prefix}*.vtt")):
+        name = os.path.basename(vtt_file)[len(prefix) : -len(".vtt")]
+        media_file = f"{data_dir}/HSRData_Audio_{name}.{media_type}"
+        if os.path.exists(media_file):
+            missions.append(Mission(name, vtt_file, media_file))
+        else:
+            logging.warning(f"No recording found for {vtt_file}, skipping")
+    return missions
+
+
+def read_zoom_vtt(vtt_file):
+    """
+    Get the utterances of a Zoom transcript in vtt format as a dataframe
+    with speaker, timestart, timeend, utt and utt_num columns
+    """
+    import webvtt
+
+    records = []
+    for i, caption in enumerate(webvtt.read(vtt_file)):
+        # If a speaker is identified, extract the speaker.
+        text_components = caption.text.rsplit(": ", 1)
+        speaker = text_components[0] if len(text_components) > 1 else None
+
+        # Extract the text
+        text = (
+            text_components[1]
+            if len(text_components) > 1
+            else text_components[0]
+        )
+
+        records.append(
+            {
+                "speaker": speaker,
+                "timestart": caption.start,
+                "timeend": caption.end,
+                "utt": text,
+                "utt_num": i + 1,
+            }
+        )
+    return pd.DataFrame(records)
+
+
+def get_metadata(filename):
+    """
+    Get the member id and version of a mission from the name of its file
+    Returns member id, version, base name of the file
+    """
+    nm = re.split(r"\s|/", filename)[-1]
+    w = re.split(r"(\..+|_)", nm)
+    p, q = None, None
+    for e in w:
+        member = re.match("[Mm]em.*", e)
+        version = re.match("[Vv]ers.*", e)
+        if member:
+            p = e
+        elif version:
+            # regex to find version number, based on present data
+            numbers = re.findall(r"[0-9]", e)
+            q = numbers[0] if numbers else e
+    return p, q, nm
+
+
+def make_prediction_message(filename, row, emotion, confidence, metadata=None):
+    """
+    Create the message output by run_asist_analysis for an utterance
+    metadata : get_metadata(filename), if it was already computed
+    """
+    mem, vers, filen = metadata or get_metadata(filename)
+    return {
+        "header": {
+            "timestamp": row["timestart"],
+            "message_type": "event",
+            "version": vers,
+        },
+        "msg": {
+            "source": "TomcatSpeechAnalyzer",
+            "experiment_id": mem,
+            "timestamp": row["timestart"],
+            "sub_type": "Event:speech_feature",
+            "version": vers,
+            "filename": filen,
+        },
+        "data": {
+            "speaker": row["speaker"],
+            "utterance": row["utt"],
+            "emotion_detected": emotion,
+            "confidence_level": confidence,
+        },
+    }
+
+
+class PredictionWriter(object):
+    """
+    Write the messages of the predictions of run_asist_analysis, one JSON
+    line per utterance, as the predictions of each file are made
+    path : the output file; it is gzipped if it ends in .gz, and "-" is
+        stdout
+    """
+
+    def __init__(self, path):
+        # stdout is only borrowed, and left open
+        self.owns_file = path != "-"
+        if path == "-":
+            self.file = sys.stdout.buffer
+        elif path.endswith(".gz"):
+            self.file = gzip.open(path, "wb")
+        else:
+            self.file = open(path, "wb")
+
+    def write(self, filename, utt_df, predictions):
+        """
+        Write the messages of the utterances of a file
+        utt_df : dataframe with the timestart, speaker and utt of each
+            utterance
+        predictions : (emotion, confidence) of each utterance
+        """
+        # the metadata only depends on the file
+        metadata = get_metadata(filename)
+        # missing values are written as null, whichever encoder is used
+        columns = utt_df[["timestart", "speaker", "utt"]].astype(object)
+        rows = columns.where(columns.notna(), None).itertuples(
+            index=False, name=None
+        )
+        self.file.write(
+            b"".join(
+                dumps_line(
+                    make_prediction_message(
+                        filename,
+                        {"timestart": time, "speaker": spkr, "utt": utt},
+                        emotion,
+                        None if pd.isna(confidence) else confidence,
+                        metadata,
+                    )
+                )
+                for (time, spkr, utt), (emotion, confidence) in zip(
+                    rows, predictions
+                )
+            )
+        )
+        self.file.flush()
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def file_digest(path):
+    """
+    Get the sha256 hash of the contents of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomically(path, write):
+    """
+    Call write with a temporary path and move the result to path, so that
+    path only exists once it is complete
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # keep the extension, from which some tools infer the format
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}.tmp{ext}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# stages, each taking its input paths, its settings and its output path
+# they run in the worker processes
+
+
+def make_transcript(inputs, settings, output):
+    (vtt_file,) = inputs
+    write_atomically(
+        output,
+        lambda tmp: read_zoom_vtt(vtt_file).to_csv(tmp, index=False, sep="\t"),
+    )
+
+
+def make_audio(inputs, settings, output):
+    (media_file,) = inputs
+    write_atomically(
+        output, lambda tmp: decode_to_wav(media_file, tmp, channels=1)
+    )
+
+
+def make_features(inputs, settings, output):
+    (audio_file,) = inputs
+
+    if settings["feature_extractor"] == "numpy":
+
+        def extract(tmp):
+            save_is10_csv(audio_file, tmp)
+
+    else:
+        opensmile_dir = settings["opensmile_dir"]
+
+        def extract(tmp):
+            sp.run(
+                [
+                    f"{opensmile_dir}/bin/SMILExtract",
+                    "-C",
+                    f"{opensmile_dir}/config/{settings['opensmile_config']}",
+                    "-I",
+                    audio_file,
+                    "-lldcsvoutput",
+                    tmp,
+                ],
+                check=True,
+                stdout=sp.DEVNULL,
+            )
+
+    write_atomically(output, extract)
+
+
+def make_aligned(inputs, settings, output):
+    tsv_file, csv_file = inputs
+    df = align_utterances(
+        pd.read_table(tsv_file), pd.read_csv(csv_file, sep=";")
+    )
+    write_atomically(output, lambda tmp: df.to_csv(tmp, index=False, sep="\t"))
+
+
+# the predictor of each worker process, loaded the first time it is needed
+_predictor = None
+
+
+def make_predictions(inputs, settings, output):
+    global _predictor
+    aligned_file, glove_file, emotion_model = inputs[:3]
+    preprocessing = inputs[3] if len(inputs) > 3 else None
+    if _predictor is None:
+        import torch
+
+        # the workers already use all cores
+        torch.set_num_threads(1)
+        _predictor = AsistPredictor(
+            glove_file, emotion_model, preprocessing, settings["norm"]
+        )
+
+    df = pd.read_table(aligned_file)
+    predictions = _predictor.predict(df)
+
+    def write(tmp):
+        with PredictionWriter(tmp) as writer:
+            writer.write(settings["filename"], df, predictions)
+
+    write_atomically(output, write)
+
+
+STAGES = {
+    "transcript": (make_transcript, "tsv"),
+    "audio": (make_audio, "wav"),
+    "features": (make_features, "csv"),
+    "aligned": (make_aligned, "tsv"),
+    "predictions": (make_predictions, "jsonl"),
+}
+
+
+class AsistPipeline(object):
+    """
+    Runs the stages of all missions in a pool of worker processes, starting
+    each stage of a mission as soon as its inputs are ready
+
+    Cached outputs are stored in build_dir/<stage>/<hash>.<extension>, where
+    the hash covers the contents of the inputs of the stage, its settings
+    and its version
+    preprocessing, norm : the preprocessing artifacts saved with the model
+        and the normalization of the acoustic features (see AsistPredictor)
+    """
+
+    def __init__(
+        self,
+        glove_file,
+        emotion_model,
+        build_dir="build/pipeline",
+        feature_extractor="opensmile",
+        opensmile_dir="external/opensmile-3.0",
+        opensmile_config="is09-13/IS10_paraling.conf",
+        workers=None,
+        preprocessing=None,
+        norm="zscore",
+    ):
+        self.glove_file = glove_file
+        self.emotion_model = emotion_model
+        self.preprocessing = preprocessing
+        self.norm = norm
+        self.build_dir = build_dir
+        self.feature_extractor = feature_extractor
+        self.opensmile_dir = opensmile_dir
+        self.opensmile_config = opensmile_config
+        self.workers = workers or os.cpu_count()
+
+        # hashes of the contents of the files seen so far
+        self._digests = {}
+        # directory: extension of the cached outputs of each stage
+        self._stage_dirs = {
+            os.path.abspath(os.path.join(build_dir, stage)): extension
+            for stage, (_, extension) in STAGES.items()
+        }
+
+    def digest(self, path):
+        # cached outputs are named after the hash of everything they were
+        # computed from, which stands in for the hash of their contents
+        path = os.path.abspath(path)
+        name, _, extension = os.path.basename(path).partition(".")
+        if self._stage_dirs.get(os.path.dirname(path)) == extension and (
+            re.fullmatch("[0-9a-f]{64}", name)
+        ):
+            return name
+        if path not in self._digests:
+            self._digests[path] = file_digest(path)
+        return self._digests[path]
+
+    def output_path(self, stage, inputs, settings):
+        key = hashlib.sha256(
+            json.dumps(
+                [
+                    stage,
+                    STAGE_VERSIONS[stage],
+                    [self.digest(path) for path in inputs],
+                    settings,
+                ],
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+        return f"{self.build_dir}/{stage}/{key}.{STAGES[stage][1]}"
+
+    def next_stage(self, mission, outputs):
+        """
+        Get the next stage of a mission that can run given the outputs of
+        its finished stages, as (stage, inputs, settings), or None
+        """
+        if "transcript" not in outputs:
+            return "transcript", [mission.vtt_file], {}
+        if self.feature_extractor == "numpy":
+            # the recording is decoded straight into the feature extractor
+            if "features" not in outputs:
+                settings = {"feature_extractor": self.feature_extractor}
+                return "features", [mission.media_file], settings
+        else:
+            if "audio" not in outputs:
+                return "audio", [mission.media_file], {}
+            if "features" not in outputs:
+                settings = {
+                    "feature_extractor": self.feature_extractor,
+                    "opensmile_dir": self.opensmile_dir,
+                    "opensmile_config": self.opensmile_config,
+                }
+                return "features", [outputs["audio"]], settings
+        if "aligned" not in outputs:
+            return (
+                "aligned",
+                [outputs["transcript"], outputs["features"]],
+                {},
+            )
+        if "predictions" not in outputs:
+            # the name of the file the messages refer to is the one the
+            # Makefile gives to the aligned file of the mission
+            inputs = [outputs["aligned"], self.glove_file, self.emotion_model]
+            if self.preprocessing is not None:
+                inputs.append(self.preprocessing)
+            return (
+                "predictions",
+                inputs,
+                {"filename": f"{mission.name}.tsv", "norm": self.norm},
+            )
+        return None
+
+    def run(self, missions, output_file):
+        """
+        Process all missions and write the messages of their utterances to
+        output_file, in the order of the missions
+        Returns the list of missions that failed
+        """
+        outputs = {mission: {} for mission in missions}
+        failed = []
+        running = {}
+
+        with ProcessPoolExecutor(self.workers) as pool:
+
+            def schedule(mission):
+                # skip the stages whose output is already cached
+                while True:
+                    step = self.next_stage(mission, outputs[mission])
+                    if step is None:
+                        return
+                    stage, inputs, settings = step
+                    output = self.output_path(stage, inputs, settings)
+                    if not os.path.exists(output):
+                        break
+                    outputs[mission][stage] = output
+
+                logging.info(f"{mission.name}: {stage}")
+                future = pool.submit(
+                    STAGES[stage][0], inputs, settings, output
+                )
+                running[future] = (mission, stage, output)
+
+            for mission in missions:
+                schedule(mission)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    mission, stage, output = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logging.error(f"{mission.name}: {stage} failed: {e}")
+                        failed.append(mission)
+                        continue
+                    outputs[mission][stage] = output
+                    schedule(mission)
+
+        def write(tmp):
+            with open(tmp, "w") as f:
+                for mission in missions:
+                    if mission in failed:
+                        continue
+                    with open(outputs[mission]["predictions"]) as p:
+                        f.write(p.read())
+
+        write_atomically(os.path.abspath(output_file), write)
+        return failed
@@ -0,0 +1,140 @@
+# predict the emotion of ASIST utterances with a trained
+# EarlyFusionMultimodalModel, encoding them with AsistFeaturizer
+# this is shared by run_asist_analysis, the ASIST pipeline and the ASR
+# agent, so that the same input gets the same prediction everywhere
+# torch and the model are only imported when a predictor is made
+
+EMOTIONS = [
+    "anger",
+    "disgust",
+    "fear",
+    "joy",
+    "neutral",
+    "sadness",
+    "surprise",
+]
+
+
+class AsistPredictor(object):
+    """
+    The emotion model along with its GloVe embeddings and preprocessing
+    artifacts, predicting the emotion of the utterances of a dataframe in
+    the order of its rows
+    glove_file, emotion_model : paths of the GloVe file and the saved model
+    preprocessing : path of the PreprocessingArtifacts saved with the model;
+        without them, the features are used as they are and all speakers
+        are unknown
+    norm : the normalization of the acoustic features (see AsistFeaturizer)
+    """
+
+    def __init__(
+        self,
+        glove_file,
+        emotion_model,
+        preprocessing=None,
+        norm="zscore",
+        batch_size=100,
+        device="cpu",
+    ):
+        import torch
+        from tomcat_speech.data_prep.asist_data.asist_featurizer import (
+            AsistFeaturizer,
+        )
+        from tomcat_speech.data_prep.asist_data.asist_pipeline import (
+            ACOUSTIC_COLUMNS,
+        )
+        from tomcat_speech.data_prep.data_prep_helpers import (
+            Glove,
+            make_glove_dict,
+        )
+        from tomcat_speech.data_prep.preprocessing_artifacts import (
+            PreprocessingArtifacts,
+        )
+        from tomcat_speech.models.input_models import (
+            EarlyFusionMultimodalModel,
+        )
+        from tomcat_speech.models.parameters.multitask_params import params
+
+        self.torch = torch
+        self.params = params
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.glove = Glove(make_glove_dict(glove_file))
+
+        if preprocessing is not None:
+            artifacts = PreprocessingArtifacts.load(preprocessing)
+            if len(artifacts.wd2idx) != len(self.glove.wd2idx):
+                raise ValueError(
+                    f"{preprocessing} was made with another glove"
+                )
+        else:
+            artifacts = PreprocessingArtifacts(
+                self.glove.wd2idx, ACOUSTIC_COLUMNS
+            )
+            norm = None
+        self.featurizer = AsistFeaturizer(artifacts, norm=norm)
+
+        self.classifier = EarlyFusionMultimodalModel(
+            params=params,
+            num_embeddings=self.glove.data.size()[0],
+            pretrained_embeddings=self.glove.data,
+        )
+        self.classifier.load_state_dict(
+            torch.load(emotion_model, map_location=self.device)
+        )
+        self.classifier.to(self.device)
+        self.classifier.eval()
+
+    def predict(self, utt_df):
+        """
+        Get the predicted emotion and its probability for each row of a
+        dataframe of utterances, with speaker and utt columns and the
+        averaged acoustic features
+        """
+        torch = self.torch
+        params = self.params
+
+        # the model applies dropout even in evaluation mode, so reset the
+        # seed to get the same predictions for the same input every time
+        torch.manual_seed(params.seed)
+
+        data = self.featurizer.encode(utt_df)
+
+        predictions = []
+        with torch.no_grad():
+            for start in range(0, len(data), self.batch_size):
+                (
+                    acoustic,
+                    words,
+                    speakers,
+                    genders,
+                    lengths,
+                    _,
+                ) = (
+                    tensor[start : start + self.batch_size]
+                    for tensor in data.tensors
+                )
+
+                speaker_input, gender_input = None, None
+                if params.use_speaker:
+                    speaker_input = speakers.to(self.device)
+                elif params.use_gender:
+                    gender_input = genders.to(self.device)
+
+                probs = self.classifier(
+                    acoustic_input=acoustic.to(self.device),
+                    text_input=words.to(self.device),
+                    speaker_input=speaker_input,
+                    # packing needs the lengths on the cpu
+                    length_input=lengths,
+                    gender_input=gender_input,
+                    get_prob_dist=True,
+                )
+                confidences, best = probs.max(dim=1)
+                predictions.extend(
+                    (EMOTIONS[idx], confidence)
+                    for idx, confidence in zip(
+                        best.tolist(), confidences.tolist()
+                    )
+                )
+        return predictions
@@ -0,0 +1,269 @@
+# an append-only store of encoded ASIST trials, so that new trials can be
+# added to the data without reading and encoding the old ones again
+# each trial (an _avgd.csv file of utterances with averaged acoustic
+# features) is encoded once and saved on its own; the speakers, vocabulary,
+# longest utterance and min-max statistics of all the trials are kept in
+# the store and updated with each new trial (or trial that changed, whose
+# old version is taken out of them first)
+
+import os
+import json
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from tomcat_speech.data_prep.asist_data.asist_pipeline import ACOUSTIC_COLUMNS
+from tomcat_speech.data_prep.data_prep_helpers import (
+    MinMaxScaler,
+    get_asist_file_key,
+    read_files_concurrently,
+)
+from tomcat_speech.data_prep.text_normalization import (
+    get_word_indices,
+    get_words,
+)
+
+
+class AsistStore:
+    """
+    A directory of encoded ASIST trials
+    store_dir : the directory of the store (created if needed)
+    glove : the Glove the words are encoded with; a store must always be
+        used with the same glove
+    Speakers are numbered in the order the store first sees them, so the
+    codes of the trials already in the store never change (and speakers
+    are kept when the trials they were in change)
+    """
+
+    def __init__(self, store_dir, glove):
+        self.store_dir = store_dir
+        self.glove = glove
+        self.manifest_path = os.path.join(store_dir, "manifest.json")
+        self.scaler_path = os.path.join(store_dir, "scaler.npz")
+        os.makedirs(os.path.join(store_dir, "trials"), exist_ok=True)
+
+        manifest = {
+            "glove_size": len(glove.wd2idx),
+            "trials": {},
+            "speakers": [],
+            "vocab": {},
+            "longest_utt": 0,
+        }
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest["glove_size"] != len(glove.wd2idx):
+                raise ValueError(
+                    f"{store_dir} was encoded with a different glove"
+                )
+
+        # file name: key, size, mtime and number of utterances of a trial
+        self.trials = manifest["trials"]
+        self.speakers = manifest["speakers"]
+        self.speaker2idx = {spkr: i for i, spkr in enumerate(self.speakers)}
+        # how many times each (normalized) word was seen
+        self.vocab = Counter(manifest["vocab"])
+        self.longest_utt = manifest["longest_utt"]
+
+        if os.path.exists(self.scaler_path):
+            self.min_max_scaler = MinMaxScaler.load(self.scaler_path)
+        else:
+            self.min_max_scaler = MinMaxScaler()
+
+    def __len__(self):
+        return len(self.trials)
+
+    def update(self, input_dir, f_end="_avgd.csv", num_workers=None):
+        """
+        Add the trials in input_dir that are not in the store yet (or whose
+        file changed since it was added)
+        Returns the names of the files that were added
+        """
+        new_files = []
+        for f in sorted(os.listdir(input_dir)):
+            if f.endswith(f_end):
+                stat = os.stat(os.path.join(input_dir, f))
+                saved = self.trials.get(f)
+                if (
+                    saved is None
+                    or saved["size"] != stat.st_size
+                    or saved["mtime"] != stat.st_mtime
+                ):
+                    new_files.append(f)
+
+        paths = [os.path.join(input_dir, f) for f in new_files]
+        for path, df in read_files_concurrently(
+            paths, pd.read_csv, num_workers
+        ):
+            self.add_trial(path, df)
+
+        if new_files:
+            self.save()
+        return new_files
+
+    def add_trial(self, path, df):
+        """
+        Encode the utterances of a trial, update the statistics of the
+        store with them and save them
+        """
+        f = os.path.basename(path)
+        stat = os.stat(path)
+        if f in self.trials:
+            self.remove_trial(f)
+
+        utts = df["utt"].astype(str)
+        words, utt_lengths = get_word_indices(utts, self.glove.wd2idx)
+        speakers = np.array(
+            [self.get_speaker_idx(str(spkr)) for spkr in df["speaker"]],
+            dtype=np.int64,
+        )
+        acoustic = df[ACOUSTIC_COLUMNS].to_numpy(dtype=np.float32)
+
+        # update the statistics of the store
+        self.min_max_scaler.partial_fit(acoustic)
+        vocab = Counter()
+        for utt in utts:
+            vocab.update(get_words(utt))
+        self.vocab.update(vocab)
+        self.longest_utt = max(
+            self.longest_utt, int(utt_lengths.max(initial=0))
+        )
+
+        # unscaled, so that the trial never needs encoding again
+        trial_path = self.get_trial_path(f)
+        np.savez(
+            trial_path + ".tmp.npz",
+            acoustic=acoustic,
+            words=words,
+            utt_lengths=utt_lengths,
+            speakers=speakers,
+            vocab_words=np.array(list(vocab.keys()), dtype=str),
+            vocab_counts=np.array(list(vocab.values()), dtype=np.int64),
+        )
+        os.replace(trial_path + ".tmp.npz", trial_path)
+
+        self.trials[f] = {
+            "key": list(get_asist_file_key(f)),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "num_utts": len(df),
+        }
+
+    def remove_trial(self, f):
+        """
+        Take a trial out of the store and its statistics
+        """
+        with np.load(self.get_trial_path(f)) as trial:
+            acoustic = trial["acoustic"]
+            longest_utt = int(trial["utt_lengths"].max(initial=0))
+            vocab = Counter(
+                dict(
+                    zip(
+                        trial["vocab_words"].tolist(),
+                        trial["vocab_counts"].tolist(),
+                    )
+                )
+            )
+        del self.trials[f]
+
+        self.vocab.subtract(vocab)
+        self.vocab = +self.vocab
+
+        # mins, maxes and the longest utterance cannot be taken back, so
+        # they are computed again from the other trials if the trial
+        # reached them
+        trial_scaler = MinMaxScaler().partial_fit(acoustic)
+        if longest_utt >= self.longest_utt or (
+            trial_scaler.mins is not None
+            and (
+                np.any(trial_scaler.mins <= self.min_max_scaler.mins)
+                or np.any(trial_scaler.maxes >= self.min_max_scaler.maxes)
+            )
+        ):
+            self.refit()
+
+    def refit(self):
+        """
+        Compute the min-max statistics and longest utterance of the store
+        again from its trials
+        """
+        self.min_max_scaler = MinMaxScaler(
+            self.min_max_scaler.lower, self.min_max_scaler.upper
+        )
+        self.longest_utt = 0
+        for f in self.trials:
+            with np.load(self.get_trial_path(f)) as trial:
+                self.min_max_scaler.partial_fit(trial["acoustic"])
+                self.longest_utt = max(
+                    self.longest_utt, int(trial["utt_lengths"].max(initial=0))
+                )
+
+    def get_speaker_idx(self, speaker):
+        if speaker not in self.speaker2idx:
+            self.speaker2idx[speaker] = len(self.speakers)
+            self.speakers.append(speaker)
+        return self.speaker2idx[speaker]
+
+    def get_trial_path(self, f):
+        return os.path.join(
+            self.store_dir, "trials", os.path.splitext(f)[0] + ".npz"
+        )
+
+    def save(self):
+        # the scaler is saved first: if the manifest is not saved, the
+        # trials are added again, which only widens its bounds
+        self.min_max_scaler.save(self.scaler_path + ".tmp.npz")
+        os.replace(self.scaler_path + ".tmp.npz", self.scaler_path)
+
+        manifest = {
+            "glove_size": len(self.glove.wd2idx),
+            "trials": self.trials,
+            "speakers": self.speakers,
+            "vocab": dict(self.vocab),
+            "longest_utt": self.longest_utt,
+        }
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def load(self, sids=None):
+        """
+        Get the utterances of the trials of the given sids (all if None),
+        in the order the trials were added
+        Returns a dict with the keys of the trials, and the acoustic
+        features (unscaled), word indices (padded to the longest utterance
+        in the store), utterance lengths and speaker codes of all their
+        utterances
+        """
+        files = [
+            f
+            for f, trial in self.trials.items()
+            if sids is None or trial["key"][0] in sids
+        ]
+        num_utts = sum(self.trials[f]["num_utts"] for f in files)
+
+        acoustic = np.zeros(
+            (num_utts, len(ACOUSTIC_COLUMNS)), dtype=np.float32
+        )
+        words = np.zeros((num_utts, self.longest_utt), dtype=np.int64)
+        utt_lengths = np.zeros(num_utts, dtype=np.int64)
+        speakers = np.zeros(num_utts, dtype=np.int64)
+
+        start = 0
+        for f in files:
+            with np.load(self.get_trial_path(f)) as trial:
+                end = start + len(trial["utt_lengths"])
+                acoustic[start:end] = trial["acoustic"]
+                words[start:end, : trial["words"].shape[1]] = trial["words"]
+                utt_lengths[start:end] = trial["utt_lengths"]
+                speakers[start:end] = trial["speakers"]
+            start = end
+
+        return {
+            "keys": [tuple(self.trials[f]["key"]) for f in files],
+            "acoustic": acoustic,
+            "words": words,
+            "utt_lengths": utt_lengths,
+            "speakers": speakers,
+        }
@@ -8,8 +8,17 @@ import re
 from pprint import pprint
 import subprocess as sp
 
+import numpy as np
 import pandas as pd
 
+from tomcat_speech.data_prep.acoustic_summaries import summarize_frame_ranges
+from tomcat_speech.data_prep.audio_io import (
+    PCMAudio,
+    decode_to_wav,
+    open_audio,
+    write_wav,
+)
+
 
 class TRSToCSV:
     """
@@ -125,7 +134,7 @@ class ExtractAudio:
 
 
 class AudioSplit:
-    """Takes audio, can split and join using ffmpeg"""
+    """Takes audio, can split and join it in-process"""
 
     def __init__(self, path, pathext, audio_name, diarized_csv):
         self.path = path
@@ -148,27 +157,19 @@ class AudioSplit:
 
         os.makedirs(self.fullp, exist_ok=True)
 
+        # decode the recording once, then cut all turns out of it
+        audio = PCMAudio.open(self.afile)
+
         with open(self.cfile, "r") as csvfile:
+            segments = []
             for n, line in enumerate(csvfile):
                 speaker, timestart, timeend = line.strip().split(",")[:3]
                 os.makedirs(f"{self.fullp}/{speaker}", exist_ok=True)
-                sp.run(
-                    [
-                        "ffmpeg",
-                        "-i",
-                        self.afile,
-                        "-ss",
-                        str(timestart),
-                        "-to",
-                        str(timeend),
-                        f"{self.fullp}/{speaker}/{n}",
-                        "-loglevel",
-                        "quiet",
-                    ]
+                segments.append(
+                    (timestart, timeend, f"{self.fullp}/{speaker}/{n}.wav")
                 )
-                # Consider using a tqdm progress bar here - Adarsh
-                if n % 1000 == 0:
-                    print(f"Completed {n+1} lines")
+            audio.write_segments(segments)
+            print(f"Completed {len(segments)} lines")
 
     def make_textfile(self, audiodir, speaker):
         """
@@ -189,22 +190,22 @@ class AudioSplit:
 
         outputname = f"{self.ext}-{speaker}.wav"
 
-        sp.run(
-            [
-                "ffmpeg",
-                "-f",
-                "concat",
-                "-safe",
-                "0",
-                "-i",
-                f"{self.fullp}/{speaker}/{txtfile}",
-                "-c",
-                "copy",
-                f"{self.path}/output/{outputname}",
-                "-loglevel",
-                "quiet",
+        # read the list of files in the format of ffmpeg's concat demuxer
+        audiodir = f"{self.fullp}/{speaker}"
+        with open(f"{audiodir}/{txtfile}", "r") as tfile:
+            items = [
+                line.strip()[len("file ") :].strip("'")
+                for line in tfile
+                if line.startswith("file ")
             ]
-        )
+
+        pieces = [PCMAudio.open(f"{audiodir}/{item}") for item in items]
+        if pieces:
+            write_wav(
+                f"{self.path}/output/{outputname}",
+                np.concatenate([piece.samples for piece in pieces]),
+                pieces[0].sample_rate,
+            )
         print(f"Concatenation completed for {self.fullp}")
 
 
@@ -268,6 +269,7 @@ def expand_words(trscsv, file_to_save):
     Expands transcription file to include values at every 10ms
     Used to combine word, speaker, utt information with features
     extracted from OpenSMILE
+    NOTE: avg_feats_per_word does the same without the expanded file
     :param trscsv: the transcription tsv
     :param file_to_save:
     :return:
@@ -310,6 +312,45 @@ def avg_feats_across_words(feature_df):
     return feature_df
 
 
+def avg_feats_per_word(feature_df, trscsv, frame_step=0.01):
+    """
+    Average acoustic feats across words, like avg_feats_across_words on
+    the merge of feature_df with the output of expand_words, but without
+    the expanded file
+    Frames are mapped to words on integer frame indices, so the frames
+    whose frameTime is between the start and end of a word (inclusive) are
+    all counted, without float mismatches
+    :param feature_df: pandas df of features output by OpenSMILE
+    :param trscsv: the transcription tsv
+    :param frame_step: the step between frames, in seconds
+    :return: a new pandas df with one row per word that contains frames
+    """
+    words = pd.read_csv(trscsv, sep="\t")
+    feature_df = feature_df.select_dtypes(include="number")
+
+    # integer index of each frame and of the first and last frames of
+    # each word (rounding away float errors)
+    frames = np.rint(feature_df["frameTime"].to_numpy() / frame_step)
+    order = np.argsort(frames, kind="stable")
+    frames = frames[order]
+    first_frame = np.ceil(np.round(words["timestart"] / frame_step, 6))
+    last_frame = np.floor(np.round(words["timeend"] / frame_step, 6))
+
+    first = np.searchsorted(frames, first_frame, side="left")
+    last = np.searchsorted(frames, last_frame, side="right")
+
+    means = summarize_frame_ranges(
+        feature_df.to_numpy()[order], first, last, stats=("mean",)
+    )["mean"]
+    word_feats = pd.DataFrame(means, columns=feature_df.columns)
+
+    word_df = pd.concat(
+        [words[["word", "speaker", "utt_num", "word_num"]], word_feats],
+        axis=1,
+    )
+    return word_df[last > first].reset_index(drop=True)
+
+
 class GetFeatures:
     """
     Takes input files and gets acoustic features
@@ -363,7 +404,7 @@ def convert_mp4_to_wav(mp4_file):
     wav_name = f"{file_name}.wav"
     # check if the file already exists
     if not os.path.exists(wav_name):
-        os.system("ffmpeg -i {0} -ac 1 {1}".format(mp4_file, wav_name))
+        decode_to_wav(mp4_file, wav_name, channels=1)
     # otherwise, print that it exists
     else:
         print(f"{wav_name} already exists")
@@ -379,7 +420,7 @@ def convert_m4a_to_wav(m4a_file):
     wav_name = "{}.wav".format(file_name)
     # check if the file already exists
     if not os.path.exists(wav_name):
-        os.system("ffmpeg -i {0} -ac 1 {1}".format(m4a_file, wav_name))
+        decode_to_wav(m4a_file, wav_name, channels=1)
     # otherwise, print that it exists
     else:
         print("{} already exists".format(wav_name))
@@ -395,7 +436,7 @@ def convert_mp3_to_wav(mp3_file):
     wav_name = "{}.wav".format(file_name)
     # check if the file already exists
     if not os.path.exists(wav_name):
-        os.system("ffmpeg -i {0} -ac 1 {1}".format(mp3_file, wav_name))
+        decode_to_wav(mp3_file, wav_name, channels=1)
     # otherwise, print that it exists
     else:
         print("{} already exists".format(wav_name))
@@ -442,15 +483,6 @@ def extract_portions_of_mp4_or_wav(
         save_name = path_to_sound_file + "/" + short_file_name
 
     # get shortened version of file
-    sp.run(
-        [
-            "ffmpeg",
-            "-i",
-            full_sound_path,
-            "-ss",
-            str(start_time),
-            "-to",
-            str(end_time),
-            str(save_name),
-        ]
-    )
+    # the recording is only opened once for all its segments
+    audio = open_audio(full_sound_path)
+    write_wav(save_name, audio.slice(start_time, end_time), audio.sample_rate)
@@ -0,0 +1,362 @@
+# read, slice and write audio in-process
+# each source file is decoded to 16-bit PCM WAVE at most once (with a single
+# ffmpeg call when it is in another format, into a cache directory), and then
+# memory-mapped, so segments are cut by sample offsets without re-reading
+# the recording
+# PCMStream decodes a file through a pipe instead, for consumers that only
+# go through the audio once and do not need a WAVE file on disk
+
+import os
+import wave
+import struct
+import hashlib
+import subprocess as sp
+from functools import lru_cache
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# where PCMAudio.open keeps decoded audio by default
+AUDIO_CACHE_DIR = os.environ.get(
+    "TOMCAT_AUDIO_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "tomcat_speech", "audio"),
+)
+
+
+def to_seconds(timestamp):
+    """
+    Convert a time in seconds or in [hh:]mm:ss.sss format to seconds
+    """
+    if isinstance(timestamp, str) and ":" in timestamp:
+        seconds = 0.0
+        for part in timestamp.split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    return float(timestamp)
+
+
+def decode_to_wav(source, wav_file, channels=None):
+    """
+    Decode any audio or video file ffmpeg can read to a 16-bit PCM WAVE file
+    channels : the number of channels to keep (all of them if None)
+    The audio is decoded to a temporary file first, so wav_file only exists
+    once it is complete
+    """
+    root, ext = os.path.splitext(wav_file)
+    tmp_file = f"{root}.{os.getpid()}.tmp{ext}"
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", source]
+    try:
+        sp.run(
+            command + ffmpeg_pcm_args(channels=channels) + [tmp_file],
+            check=True,
+        )
+        os.replace(tmp_file, wav_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return wav_file
+
+
+def ffmpeg_pcm_args(sample_rate=None, channels=None):
+    """
+    ffmpeg output options to get 16-bit PCM, resampled and with its channels
+    mixed down as needed
+    """
+    args = ["-acodec", "pcm_s16le"]
+    if channels is not None:
+        args += ["-ac", str(channels)]
+    if sample_rate is not None:
+        args += ["-ar", str(sample_rate)]
+    return args
+
+
+def read_wav_header(wav_file):
+    """
+    Get the format of a WAVE file and the position of its samples
+    Returns (format tag, number of channels, sample rate, bits per sample,
+    offset of the data chunk, size of the data chunk in bytes)
+    """
+    with open(wav_file, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{wav_file} is not a WAVE file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{wav_file} has no data chunk")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                data = f.read(size)
+                tag, channels, rate = struct.unpack("<HHI", data[:8])
+                bits = struct.unpack("<H", data[14:16])[0]
+                if tag == WAVE_FORMAT_EXTENSIBLE:
+                    tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (tag, channels, rate, bits)
+                f.seek(size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{wav_file} has no fmt chunk")
+                # the size may be wrong in files that were being streamed
+                size = min(size, os.path.getsize(wav_file) - f.tell())
+                return fmt + (f.tell(), size)
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+
+class PCMAudio:
+    """
+    16-bit PCM audio, memory-mapped from a WAVE file
+    samples : array of shape (num_frames, num_channels)
+    """
+
+    def __init__(self, samples, sample_rate):
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def open(cls, audio_file, wav_file=None, channels=None, cache_dir=None):
+        """
+        Open an audio file, decoding it first with ffmpeg (once, to wav_file)
+        if it is not a 16-bit PCM WAVE file
+        wav_file : where to save the decoded audio (by default, a file in
+            cache_dir named after the path, size and modification time of
+            audio_file and channels)
+        channels : the number of channels to keep when decoding
+        cache_dir : the directory of decoded audio (AUDIO_CACHE_DIR if None)
+        The decoded audio is reused if it is newer than audio_file and has
+        the requested number of channels, and decoded again otherwise
+        """
+        if not cls.is_pcm16_wav(audio_file):
+            if wav_file is None:
+                wav_file = get_cached_wav_path(audio_file, channels, cache_dir)
+            if not cls.is_decoded(audio_file, wav_file, channels):
+                os.makedirs(
+                    os.path.dirname(os.path.abspath(wav_file)), exist_ok=True
+                )
+                decode_to_wav(audio_file, wav_file, channels)
+            audio_file = wav_file
+
+        _, channels, rate, _, offset, size = read_wav_header(audio_file)
+        num_frames = size // (2 * channels)
+        if num_frames == 0:
+            return cls(np.zeros((0, channels), dtype=np.int16), rate)
+        samples = np.memmap(
+            audio_file,
+            dtype="<i2",
+            mode="r",
+            offset=offset,
+            shape=(num_frames, channels),
+        )
+        return cls(samples, rate)
+
+    @staticmethod
+    def is_pcm16_wav(audio_file):
+        try:
+            tag, _, _, bits, _, _ = read_wav_header(audio_file)
+        except (ValueError, struct.error):
+            return False
+        return tag == WAVE_FORMAT_PCM and bits == 16
+
+    @classmethod
+    def is_decoded(cls, audio_file, wav_file, channels=None):
+        # whether wav_file holds the decoded audio of audio_file
+        if not os.path.exists(wav_file) or not cls.is_pcm16_wav(wav_file):
+            return False
+        if os.path.getmtime(wav_file) < os.path.getmtime(audio_file):
+            return False
+        return channels is None or read_wav_header(wav_file)[1] == channels
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def to_frame(self, timestamp):
+        frame = int(round(to_seconds(timestamp) * self.sample_rate))
+        return min(max(frame, 0), len(self.samples))
+
+    def slice(self, start_time, end_time=None):
+        """
+        Get the samples between two times (in seconds or [hh:]mm:ss.sss)
+        without copying them
+        """
+        start = self.to_frame(start_time)
+        end = (
+            len(self.samples) if end_time is None else self.to_frame(end_time)
+        )
+        return self.samples[start : max(start, end)]
+
+    def write_segments(self, segments):
+        """
+        Write several segments of the audio
+        segments : iterable of (start time, end time, output WAVE file)
+        """
+        for start_time, end_time, wav_file in segments:
+            write_wav(
+                wav_file, self.slice(start_time, end_time), self.sample_rate
+            )
+
+
+def get_cached_wav_path(audio_file, channels=None, cache_dir=None):
+    """
+    Get the path of the decoded audio of a file in the audio cache
+    """
+    stat = os.stat(audio_file)
+    key = hashlib.sha256(
+        repr(
+            (
+                os.path.abspath(audio_file),
+                stat.st_size,
+                stat.st_mtime_ns,
+                channels,
+            )
+        ).encode()
+    ).hexdigest()
+    name = os.path.splitext(os.path.basename(audio_file))[0]
+    return os.path.join(cache_dir or AUDIO_CACHE_DIR, f"{name}.{key[:16]}.wav")
+
+
+@lru_cache(maxsize=8)
+def _open_cached(audio_file, mtime, channels):
+    return PCMAudio.open(audio_file, channels=channels)
+
+
+def open_audio(audio_file, channels=None):
+    """
+    Open an audio file with PCMAudio.open, reusing the audio already opened
+    for the same file, so that cutting many segments out of a recording in
+    separate calls only opens it once
+    """
+    return _open_cached(audio_file, os.path.getmtime(audio_file), channels)
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise EOFError("Unexpected end of the decoded audio")
+    return data
+
+
+class PCMStream:
+    """
+    16-bit PCM audio decoded by ffmpeg into a pipe, read chunk by chunk
+    Resampling and mixing the channels down happen in the same pass, and
+    nothing is written to disk. Use as a context manager:
+
+        with PCMStream("call.m4a", sample_rate=16000) as stream:
+            for chunk in stream:
+                ...
+
+    Chunks have shape (num_frames,) for mono audio and (num_frames,
+    num_channels) otherwise. 16-bit PCM WAVE files are read directly.
+    """
+
+    def __init__(
+        self, source, sample_rate=None, channels=1, chunk_frames=1 << 16
+    ):
+        self.source = source
+        self.requested_rate = sample_rate
+        self.requested_channels = channels
+        self.chunk_frames = chunk_frames
+        self.process = None
+        self.file = None
+        self.sample_rate = None
+        self.channels = None
+
+    def __enter__(self):
+        can_read_directly = PCMAudio.is_pcm16_wav(self.source)
+        if can_read_directly:
+            _, channels, rate, _, offset, size = read_wav_header(self.source)
+            can_read_directly = self.requested_rate in (
+                None,
+                rate,
+            ) and self.requested_channels in (None, channels)
+
+        if can_read_directly:
+            self.file = open(self.source, "rb")
+            self.file.seek(offset)
+            self.sample_rate, self.channels = rate, channels
+            self._remaining = size
+            return self
+
+        self.process = sp.Popen(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", self.source]
+            + ffmpeg_pcm_args(self.requested_rate, self.requested_channels)
+            + ["-f", "wav", "pipe:1"],
+            stdout=sp.PIPE,
+        )
+        self.file = self.process.stdout
+        try:
+            self._read_pipe_header()
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def _read_pipe_header(self):
+        # the sizes in the header are meaningless when writing to a pipe, so
+        # the data is read until the end of the stream
+        _read_exact(self.file, 12)
+        while True:
+            chunk_id, size = struct.unpack("<4sI", _read_exact(self.file, 8))
+            if chunk_id == b"data":
+                self._remaining = None
+                return
+            data = _read_exact(self.file, size + size % 2)
+            if chunk_id == b"fmt ":
+                self.channels, self.sample_rate = struct.unpack(
+                    "<HI", data[2:8]
+                )
+
+    def __iter__(self):
+        frame_size = 2 * self.channels
+        while True:
+            size = self.chunk_frames * frame_size
+            if self._remaining is not None:
+                size = min(size, self._remaining)
+            data = self.file.read(size) if size else b""
+            if self._remaining is not None:
+                self._remaining -= len(data)
+            data = data[: len(data) - len(data) % frame_size]
+            if not data:
+                break
+            chunk = np.frombuffer(data, dtype="<i2")
+            yield (
+                chunk
+                if self.channels == 1
+                else chunk.reshape(-1, self.channels)
+            )
+
+        if self.process is not None and self.process.wait() != 0:
+            raise sp.CalledProcessError(
+                self.process.returncode, self.process.args
+            )
+
+    def close(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+        if self.file is not None:
+            self.file.close()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_wav(wav_file, samples, sample_rate):
+    """
+    Write 16-bit samples of shape (num_frames,) or (num_frames, num_channels)
+    to a WAVE file
+    """
+    samples = np.asarray(samples, dtype="<i2")
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    with wave.open(str(wav_file), "wb") as f:
+        f.setnchannels(samples.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.ascontiguousarray(samples).tobytes())
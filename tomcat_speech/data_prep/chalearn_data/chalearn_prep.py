@@ -6,10 +6,12 @@ import json
 import sys
 from collections import OrderedDict
 
+import numpy as np
 import torch
 from torch import nn
 from torchtext.data import get_tokenizer
 
+from tomcat_speech.data_prep.acoustic_summaries import AcousticSummaries
 from tomcat_speech.data_prep.audio_extraction import (
     ExtractAudio,
 )
@@ -19,6 +21,8 @@ from tomcat_speech.data_prep.data_prep_helpers import (
     get_gender_avgs,
     clean_up_word,
     get_max_num_acoustic_frames,
+    pack_frames,
+    read_files_concurrently,
     transform_acoustic_item,
 )
 
@@ -37,6 +41,7 @@ class ChalearnPrep:
         use_cols=None,
         add_avging=True,
         avgd=False,
+        num_workers=None,
     ):
         self.path = chalearn_path
         self.train_path = chalearn_path + "/train"
@@ -78,6 +83,7 @@ class ChalearnPrep:
             f_end,
             use_cols=use_cols,
             avgd=avgd,
+            num_workers=num_workers,
         )
         self.train_dict = OrderedDict(self.train_dict)
         self.dev_dict, self.dev_acoustic_lengths = make_acoustic_dict_chalearn(
@@ -85,6 +91,7 @@ class ChalearnPrep:
             f_end,
             use_cols=use_cols,
             avgd=avgd,
+            num_workers=num_workers,
         )
         self.dev_dict = OrderedDict(self.dev_dict)
         # self.test_dict, self.test_acoustic_lengths = make_acoustic_dict_chalearn(
@@ -522,40 +529,50 @@ def create_gold_tsv_chalearn(gold_file, utts_file, gender_file, save_name):
 
 
 def make_acoustic_dict_chalearn(
-    acoustic_path, f_end="_IS10.csv", use_cols=None, avgd=True
+    acoustic_path,
+    f_end="_IS10.csv",
+    use_cols=None,
+    avgd=True,
+    num_workers=None,
 ):
     """
     makes a dict of clip_id: data for use in MELD objects
     f_end: end of acoustic file names
     use_cols: if set, should be a list [] of column names to include
     n_to_skip : the number of columns at the start to ignore (e.g. name, time)
+    num_workers: the number of threads reading the files
     """
     acoustic_dict = {}
     # acoustic_lengths = []
     acoustic_lengths = {}
-    # find acoustic features files
-    for f in os.listdir(acoustic_path):
-        if f.endswith(f_end):
-            # set the separator--non-averaged files are ;SV
-            separator = ";"
-
-            # read in the file as a dataframe
-            if use_cols is not None:
-                feats = pd.read_csv(
-                    acoustic_path + "/" + f, usecols=use_cols, sep=separator
-                )
-            else:
-                feats = pd.read_csv(acoustic_path + "/" + f, sep=separator)
-                if not avgd:
-                    feats.drop(["name", "frameTime"], axis=1, inplace=True)
 
-            # get the dialogue and utterance IDs
-            id = f.split("_IS10")[0]
+    # set the separator--non-averaged files are ;SV
+    separator = ";"
 
-            # save the dataframe to a dict with (dialogue, utt) as key
-            if feats.shape[0] > 0:
-                acoustic_dict[id] = feats.values.tolist()
-                acoustic_lengths[id] = feats.shape[0]
+    def read_feats(f):
+        # read in the file as a dataframe
+        if use_cols is not None:
+            feats = pd.read_csv(
+                acoustic_path + "/" + f, usecols=use_cols, sep=separator
+            )
+        else:
+            feats = pd.read_csv(acoustic_path + "/" + f, sep=separator)
+            if not avgd:
+                feats.drop(["name", "frameTime"], axis=1, inplace=True)
+        return feats
+
+    # find acoustic features files
+    feats_files = [f for f in os.listdir(acoustic_path) if f.endswith(f_end)]
+    for f, feats in read_files_concurrently(
+        feats_files, read_feats, num_workers
+    ):
+        # get the dialogue and utterance IDs
+        id = f.split("_IS10")[0]
+
+        # save the dataframe to a dict with (dialogue, utt) as key
+        if feats.shape[0] > 0:
+            acoustic_dict[id] = feats.values.tolist()
+            acoustic_lengths[id] = feats.shape[0]
 
     # sort acoustic lengths so they are in the same order as other data
     acoustic_lengths = [
@@ -595,6 +612,12 @@ def make_acoustic_set_chalearn(
     all_acoustic = []
     usable_utts = []
 
+    if add_avging and not avgd:
+        # average the frames of all utterances at once
+        summaries = AcousticSummaries.from_frames(
+            acoustic_dict, stats=("mean",)
+        )
+
     # for all items with audio + gold label
     for idx, item in enumerate(valid_utts):
         item_id = item.split(".mp4")[0]
@@ -608,28 +631,28 @@ def make_acoustic_set_chalearn(
             usable_utts.append(item_id)
 
             if not avgd and not add_avging:
-                # set intermediate acoustic holder
-                acoustic_holder = [[0] * acoustic_length] * longest_acoustic
-
-                # add the acoustic features to the holder of features
-                for i, feats in enumerate(acoustic_data):
-                    # for now, using longest acoustic file in TRAIN only
-                    if i >= longest_acoustic:
-                        break
-                    # needed because some files allegedly had length 0
-                    for j, feat in enumerate(feats):
-                        acoustic_holder[i][j] = feat
+                # frames are packed once all utterances are known
+                continue
+            elif avgd:
+                acoustic_holder = acoustic_data
             else:
-                if avgd:
-                    acoustic_holder = acoustic_data
-                elif add_avging:
-                    acoustic_holder = torch.mean(
-                        torch.tensor(acoustic_data), dim=0
-                    )
+                acoustic_holder = summaries.get(item_id).astype(np.float32)
 
             # add features as tensor to acoustic data
             all_acoustic.append(torch.tensor(acoustic_holder))
 
+    if not avgd and not add_avging:
+        # write the frames of all utterances to a single padded buffer
+        # for now, using longest acoustic file in TRAIN only
+        all_acoustic = torch.from_numpy(
+            pack_frames(
+                [acoustic_dict[item_id] for item_id in usable_utts],
+                longest_acoustic,
+                acoustic_length,
+            )
+        )
+        return all_acoustic, usable_utts
+
     # pad the sequence and reshape it to proper format
     # this is here to keep the formatting for acoustic RNN
     all_acoustic = nn.utils.rnn.pad_sequence(all_acoustic)
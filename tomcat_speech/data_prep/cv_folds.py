@@ -0,0 +1,101 @@
+# cross-validation folds that only keep the indices of the items of a dataset
+# the train, dev and test data of a fold are views (torch Subsets) of the
+# dataset, so switching folds does not copy any data
+
+import numpy as np
+from torch.utils.data import Subset
+
+
+class CVFolds:
+    """
+    Split the items of a dataset into folds for cross-validation
+    When fold n is the test fold, fold n-1 is the dev fold (the last fold
+    for n=0), and all the others are used for training
+    num_items : the number of items in the dataset
+    num_folds : the number of folds
+    labels : the label of each item, to keep the same proportion of each
+        label in every fold (stratified k-fold)
+    groups : the group (e.g. speaker) of each item, to keep all the items
+        of a group in the same fold (grouped k-fold)
+    seed : seed of the shuffling (the global numpy seed is used if None)
+    """
+
+    def __init__(
+        self, num_items, num_folds, labels=None, groups=None, seed=None
+    ):
+        self.num_items = num_items
+        self.num_folds = num_folds
+        rng = np.random if seed is None else np.random.RandomState(seed)
+
+        if num_folds == 1:
+            # no need to shuffle the data if there is a single fold
+            self.folds = [np.arange(num_items)]
+        elif groups is not None:
+            self.folds = self.group_folds(groups, rng)
+        elif labels is not None:
+            self.folds = self.stratified_folds(labels, rng)
+        else:
+            # consecutive chunks of a random permutation, the last fold
+            # getting the remainder
+            indices = rng.permutation(num_items)
+            fold_len = num_items // num_folds
+            bounds = [fold_len * i for i in range(1, num_folds)]
+            self.folds = np.split(indices, bounds)
+
+        self._splits = {}
+
+    def stratified_folds(self, labels, rng):
+        # deal the shuffled items of each label to the folds in turn
+        labels = np.asarray(labels)
+        indices = rng.permutation(self.num_items)
+        indices = indices[np.argsort(labels[indices], kind="stable")]
+        fold_nums = np.arange(self.num_items) % self.num_folds
+        return [indices[fold_nums == i] for i in range(self.num_folds)]
+
+    def group_folds(self, groups, rng):
+        # put the groups, in random order, in the smallest fold so far
+        codes, uniques = _factorize(groups)
+        group_sizes = np.bincount(codes, minlength=len(uniques))
+        fold_of_group = np.zeros(len(uniques), dtype=np.int64)
+        fold_sizes = np.zeros(self.num_folds, dtype=np.int64)
+        for group in rng.permutation(len(uniques)):
+            fold = np.argmin(fold_sizes)
+            fold_of_group[group] = fold
+            fold_sizes[fold] += group_sizes[group]
+        fold_nums = fold_of_group[codes]
+        return [np.flatnonzero(fold_nums == i) for i in range(self.num_folds)]
+
+    def __len__(self):
+        return self.num_folds
+
+    def split(self, n):
+        """
+        Get the indices of the (train, dev, test) items when n is the test
+        fold
+        """
+        if n not in self._splits:
+            dev = n - 1 if n - 1 >= 0 else self.num_folds - 1
+            train = [
+                fold
+                for i, fold in enumerate(self.folds)
+                if i != n and i != dev
+            ]
+            train = np.concatenate(train) if train else np.array([], dtype=int)
+            self._splits[n] = (train, self.folds[dev], self.folds[n])
+        return self._splits[n]
+
+    def subsets(self, dataset, n):
+        """
+        Get views of the (train, dev, test) items of a dataset (or list)
+        when n is the test fold
+        """
+        return tuple(
+            Subset(dataset, indices.tolist()) for indices in self.split(n)
+        )
+
+
+def _factorize(values):
+    uniques, codes = np.unique(
+        np.asarray([str(value) for value in values]), return_inverse=True
+    )
+    return codes.ravel(), uniques
@@ -6,14 +6,20 @@ import math
 import os
 import random
 import sys
-from collections import OrderedDict
+import warnings
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 import torch
 from torch import nn
 from torch.utils.data import Dataset
 from sklearn.feature_selection import SelectKBest, chi2
 
+from tomcat_speech.data_prep.acoustic_summaries import AcousticSummaries
+from tomcat_speech.data_prep.text_normalization import normalize_text
+
 import statistics
 
 
@@ -128,79 +134,97 @@ class Glove(object):
         return torch.mean(self.data, dim=0)
 
 
-class MinMaxScaleRange:
+class MinMaxScaler:
     """
-    A class to calculate mins and maxes for each feature in the data in order to
-    use min-max scaling
+    Min-max scaling of each feature (column) of the data, on whole arrays
+    The mins and maxes can be accumulated over many files with partial_fit,
+    and saved so that new data is scaled the same way at inference time
+    Missing values are ignored when fitting and stay missing
     """
 
-    def __init__(
-        self,
-    ):
-        self.mins = {}
-        self.maxes = {}
-
-    def update(self, key, val):
-        if (
-            key in self.mins.keys() and val < self.mins[key]
-        ) or key not in self.mins.keys():
-            self.mins[key] = val
-        if (
-            key in self.maxes.keys() and val > self.maxes[key]
-        ) or key not in self.maxes.keys():
-            self.maxes[key] = val
+    def __init__(self, lower=0.0, upper=1.0):
+        self.lower = lower
+        self.upper = upper
+        self.mins = None
+        self.maxes = None
 
-    def contains(self, key):
-        if key in self.mins.keys():
-            return True
+    def partial_fit(self, data):
+        """
+        Update the mins and maxes with a (num_items, num_features) array
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if data.size == 0:
+            return self
+        data = data.reshape(-1, data.shape[-1])
+        # columns with only missing values have no min or max yet
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mins = np.nanmin(data, axis=0)
+            maxes = np.nanmax(data, axis=0)
+        if self.mins is None:
+            self.mins, self.maxes = mins, maxes
         else:
-            return False
+            self.mins = np.fmin(self.mins, mins)
+            self.maxes = np.fmax(self.maxes, maxes)
+        return self
 
-    def min(self, key):
-        try:
-            return self.mins[key]
-        except KeyError:
-            return "The key {0} does not exist in mins".format(key)
+    def fit(self, data):
+        self.mins = None
+        self.maxes = None
+        return self.partial_fit(data)
 
-    def max(self, key):
-        try:
-            return self.maxes[key]
-        except KeyError:
-            return "The key {0} does not exist in maxes".format(key)
+    def transform(self, data):
+        """
+        Scale an array whose last dimension holds the features to
+        [lower, upper]; features that never varied are set to upper
+        """
+        if self.mins is None:
+            raise ValueError("The scaler has not been fit")
+        data = np.asarray(data, dtype=np.float64)
+        ranges = self.maxes - self.mins
+        constant = ranges == 0
+        scaled = (data - self.mins) / np.where(constant, 1.0, ranges)
+        scaled = self.lower + (self.upper - self.lower) * scaled
+        return np.where(constant & ~np.isnan(data), self.upper, scaled)
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+    def inverse_transform(self, data):
+        """
+        Get the unscaled values of scaled data; features that never varied
+        get their only value
+        """
+        if self.mins is None:
+            raise ValueError("The scaler has not been fit")
+        data = np.asarray(data, dtype=np.float64)
+        scaled = (data - self.lower) / (self.upper - self.lower)
+        return self.mins + scaled * (self.maxes - self.mins)
+
+    def save(self, path):
+        np.savez(
+            path,
+            mins=self.mins,
+            maxes=self.maxes,
+            bounds=np.array([self.lower, self.upper]),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as stats:
+            scaler = cls(*stats["bounds"].tolist())
+            scaler.mins = stats["mins"]
+            scaler.maxes = stats["maxes"]
+        return scaler
 
 
 # helper functions
 
 
 def clean_up_word(word):
-    word = word.replace("\x92", "'")
-    word = word.replace("\x91", "")
-    word = word.replace("\x97", "-")
-    # clean up word by putting in lowercase + removing punct
-    punct = [
-        ",",
-        ".",
-        "!",
-        "?",
-        ";",
-        ":",
-        "'",
-        '"',
-        "-",
-        "$",
-        "’",
-        "…",
-        "[",
-        "]",
-        "(",
-        ")",
-    ]
-    for char in word:
-        if char in punct:
-            word = word.replace(char, " ")
-    if word.strip() == "":
-        word = "<UNK>"
-    return word
+    # clean up word by removing punct
+    # see text_normalization to normalize a whole column at once
+    return normalize_text(word)
 
 
 def create_data_folds(data, perc_train, perc_test):
@@ -350,6 +374,21 @@ def get_max_num_acoustic_frames(acoustic_set):
     return longest
 
 
+def pack_frames(frames_list, longest, num_feats):
+    """
+    Put the frames of many utterances in one float32 array of shape
+    (num_utts, longest, num_feats), padded with 0s
+    frames_list : the frames of each utterance (2D lists, arrays or dfs)
+    Utterances with more than longest frames are truncated
+    """
+    packed = np.zeros((len(frames_list), longest, num_feats), dtype=np.float32)
+    for i, frames in enumerate(frames_list):
+        frames = np.asarray(frames[:longest], dtype=np.float32)
+        if frames.size > 0:
+            packed[i, : len(frames)] = frames[:, :num_feats]
+    return packed
+
+
 def get_speaker_gender(idx2gender_path):
     """
     Get the gender of each speaker in the list
@@ -379,6 +418,53 @@ def get_speaker_to_index_dict(speaker_set):
     return speaker2idx
 
 
+def read_files_concurrently(
+    paths, read_file, num_workers=None, max_in_flight=None
+):
+    """
+    Read many files (e.g. the acoustic feature files of a dataset) with a
+    pool of threads
+    read_file : function that reads a path and returns its contents
+    num_workers : the number of threads (as many as ThreadPoolExecutor
+        uses by default if None)
+    max_in_flight : the most files being read or waiting to be used at once
+        (2 per thread if None), so memory stays bounded
+    Yields (path, contents) in the order of paths
+    """
+    if num_workers is None:
+        num_workers = min(32, (os.cpu_count() or 1) + 4)
+    if max_in_flight is None:
+        max_in_flight = 2 * num_workers
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+        for path in paths:
+            if len(pending) >= max_in_flight:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+            pending.append((path, pool.submit(read_file, path)))
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+
+
+def get_asist_file_key(f):
+    """
+    Get the (sid, mission) key of an ASIST acoustic file from its name
+    """
+    label = f.split("_")
+    if label[1] == "mission":
+        sid = label[0]
+        mission_id = label[2]
+    else:
+        try:
+            sid = int(label[1])
+        except ValueError:
+            sid = int(label[1].split("-")[1])
+        mission_id = 0  # later iterations of this should have mission IDs
+    # callid = f.split("_")[2]  # asist data has format sid_mission_num
+    return sid, mission_id
+
 
 def make_acoustic_dict(
     acoustic_path,
@@ -386,48 +472,44 @@ def make_acoustic_dict(
     use_cols=None,
     data_type="clinical",
     files_to_get=None,
+    num_workers=None,
 ):
     """
     makes a dict of (sid, call): data for use in ClinicalDataset objects
     f_end: end of acoustic file names
     use_cols: if set, should be a list [] of column names to include
+    num_workers: the number of threads reading the files
     """
     acoustic_dict = {}
-    for f in os.listdir(acoustic_path):
-        if f.endswith(f_end):
-            if (
-                files_to_get is None
-                or "_".join(f.split("_")[:2]) in files_to_get
-            ):
-                if use_cols is not None:
-                    try:
-                        feats = pd.read_csv(
-                            acoustic_path + "/" + f, usecols=use_cols
-                        )
-                    except ValueError:
-                        # todo: add warning
-                        feats = []
-                else:
-                    feats = pd.read_csv(acoustic_path + "/" + f)
-                if data_type == "asist":
-                    label = f.split("_")
-                    if label[1] == "mission":
-                        sid = label[0]
-                        mission_id = label[2]
-                    else:
-                        try:
-                            sid = int(label[1])
-                        except ValueError:
-                            sid = int(label[1].split("-")[1])
-                        mission_id = 0  # later iterations of this should have mission IDs
-                    acoustic_dict[(sid, mission_id)] = feats
-                    # callid = f.split("_")[2]  # asist data has format sid_mission_num
-                else:
-                    sid = f.split("_")[0]
-                    # clinical data has format sid_callid
-                    # meld has format dia_utt
-                    callid = f.split("_")[1]
-                    acoustic_dict[(sid, callid)] = feats
+
+    def read_feats(f):
+        if use_cols is not None:
+            try:
+                return pd.read_csv(acoustic_path + "/" + f, usecols=use_cols)
+            except ValueError:
+                # todo: add warning
+                return []
+        return pd.read_csv(acoustic_path + "/" + f)
+
+    feats_files = [
+        f
+        for f in os.listdir(acoustic_path)
+        if f.endswith(f_end)
+        and (
+            files_to_get is None or "_".join(f.split("_")[:2]) in files_to_get
+        )
+    ]
+    for f, feats in read_files_concurrently(
+        feats_files, read_feats, num_workers
+    ):
+        if data_type == "asist":
+            acoustic_dict[get_asist_file_key(f)] = feats
+        else:
+            sid = f.split("_")[0]
+            # clinical data has format sid_callid
+            # meld has format dia_utt
+            callid = f.split("_")[1]
+            acoustic_dict[(sid, callid)] = feats
     return acoustic_dict
 
 
@@ -465,6 +547,12 @@ def make_acoustic_set(
     all_acoustic = []
     usable_utts = []
 
+    if add_avging and not avgd:
+        # average the frames of all utterances at once
+        summaries = AcousticSummaries.from_frames(
+            acoustic_dict, stats=("mean",)
+        )
+
     # for all items with audio + gold label
     for idx, item in enumerate(valid_dia_utt):
         # if that dialogue and utterance appears has an acoustic feats file
@@ -479,32 +567,34 @@ def make_acoustic_set(
             usable_utts.append((item.split("_")[0], item.split("_")[1]))
 
             if not avgd and not add_avging:
-                # set intermediate acoustic holder
-                acoustic_holder = [[0] * acoustic_length] * longest_acoustic
-
-                # add the acoustic features to the holder of features
-                for i, feats in enumerate(acoustic_data):
-                    # for now, using longest acoustic file in TRAIN only
-                    if i >= longest_acoustic:
-                        break
-                    # needed because some files allegedly had length 0
-                    for j, feat in enumerate(feats):
-                        acoustic_holder[i][j] = feat
+                # frames are packed once all utterances are known
+                continue
+            elif avgd:
+                acoustic_holder = acoustic_data
             else:
-                if avgd:
-                    acoustic_holder = acoustic_data
-                elif add_avging:
-                    acoustic_holder = torch.mean(
-                        torch.tensor(acoustic_data), dim=0
-                    )
+                acoustic_holder = summaries.get(
+                    (item.split("_")[0], item.split("_")[1])
+                ).astype(np.float32)
 
-                    # get average of all non-padding vectors
-                    # nonzero_avg = get_nonzero_avg(torch.tensor(acoustic_data))
-                    # acoustic_holder = nonzero_avg
+                # get average of all non-padding vectors
+                # nonzero_avg = get_nonzero_avg(torch.tensor(acoustic_data))
+                # acoustic_holder = nonzero_avg
 
             # add features as tensor to acoustic data
             all_acoustic.append(torch.tensor(acoustic_holder))
 
+    if not avgd and not add_avging:
+        # write the frames of all utterances to a single padded buffer
+        # for now, using longest acoustic file in TRAIN only
+        all_acoustic = torch.from_numpy(
+            pack_frames(
+                [acoustic_dict[key] for key in usable_utts],
+                longest_acoustic,
+                acoustic_length,
+            )
+        )
+        return all_acoustic, usable_utts
+
     # pad the sequence and reshape it to proper format
     # this is here to keep the formatting for acoustic RNN
     all_acoustic = nn.utils.rnn.pad_sequence(all_acoustic)
@@ -529,7 +619,17 @@ def make_glove_dict(glove_path):
     """creates a dict of word: embedding pairs
     :param glove_path: the path to our glove file
     (includes name of file and extension)
+    a .npz file saved by glove_subsetting.save_subset is read directly
     """
+    if glove_path.endswith(".npz"):
+        with np.load(glove_path) as glove_file:
+            return dict(
+                zip(
+                    glove_file["words"].tolist(),
+                    glove_file["vectors"].tolist(),
+                )
+            )
+
     glove_dict = {}
     with open(glove_path) as glove_file:
         for line in glove_file:
@@ -546,17 +646,6 @@ def perform_feature_selection(xs, ys, num_to_keep):
     return new_xs
 
 
-def scale_feature(value, min_val, max_val, lower=0.0, upper=1.0):
-    # scales a single feature using min-max normalization
-    if min_val == max_val:
-        return upper
-    else:
-        # the result will be a value in [lower, upper]
-        return lower + (upper - lower) * (value - min_val) / (
-            max_val - min_val
-        )
-
-
 def transform_acoustic_item(item, acoustic_means, acoustic_stdev):
     """
     Use gender averages and stdev to transform an acoustic item
@@ -0,0 +1,112 @@
+# dialogue-level data for models that use the context of an utterance
+# the utterances of all dialogues are stored once, back to back, with the
+# offsets where each dialogue starts (as in a CSR matrix); batches are made
+# of whole dialogues of similar length, so dialogues are only padded to the
+# longest one in their batch
+
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import Dataset, Sampler
+
+
+def get_dialogue_offsets(dialogue_ids):
+    """
+    Get the offsets of the dialogues in a sequence of utterances
+    dialogue_ids : the dialogue of each utterance; the utterances of a
+        dialogue must be next to each other
+    Returns a (num_dialogues + 1,) array: the utterances of dialogue i are
+    those from offsets[i] to offsets[i + 1]
+    """
+    dialogue_ids = np.asarray(dialogue_ids)
+    if len(dialogue_ids) == 0:
+        return np.zeros(1, dtype=np.int64)
+    starts = np.flatnonzero(dialogue_ids[1:] != dialogue_ids[:-1]) + 1
+    return np.concatenate([[0], starts, [len(dialogue_ids)]]).astype(np.int64)
+
+
+class DialogueDataset(Dataset):
+    """
+    A dataset with one item per dialogue
+    utterance_data : list of utterance datums (tuples of tensors or numbers,
+        e.g. MeldPrep.train_data), with the utterances of each dialogue
+        next to each other
+    offsets : offsets of the dialogues in utterance_data (see
+        get_dialogue_offsets)
+    Each field of the datums is kept as one (num_utts, ...) tensor, and an
+    item is a tuple of views of these tensors
+    """
+
+    def __init__(self, utterance_data, offsets):
+        self.offsets = torch.as_tensor(offsets, dtype=torch.long)
+        self.fields = [_stack(list(field)) for field in zip(*utterance_data)]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return tuple(field[start:end] for field in self.fields)
+
+    @property
+    def lengths(self):
+        # the number of utterances in each dialogue
+        return self.offsets[1:] - self.offsets[:-1]
+
+
+def _stack(values):
+    if not torch.is_tensor(values[0]):
+        return torch.tensor(values)
+    if all(value.shape == values[0].shape for value in values):
+        return torch.stack(values)
+    # pad items of different lengths (e.g. acoustic frames) on their first
+    # dimension
+    return nn.utils.rnn.pad_sequence(values, batch_first=True)
+
+
+def collate_dialogues(batch):
+    """
+    Put dialogues together in a batch: each field becomes a (batch_size,
+    longest_dialogue, ...) tensor, padded with 0s. The number of utterances
+    in each dialogue is added at the end.
+    """
+    lengths = torch.tensor([len(dialogue[0]) for dialogue in batch])
+    fields = [
+        nn.utils.rnn.pad_sequence(list(field), batch_first=True)
+        for field in zip(*batch)
+    ]
+    return fields + [lengths]
+
+
+class DialogueBucketSampler(Sampler):
+    """
+    Batches of whole dialogues of similar length, to use as the batch_sampler
+    of a DataLoader (with collate_dialogues as its collate_fn)
+    The dialogues are sorted by length (in random order within each length)
+    and cut into batches of batch_size dialogues, and the batches are
+    shuffled every epoch
+    lengths : the number of utterances in each dialogue
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, generator=None):
+        self.lengths = torch.as_tensor(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.generator = generator
+
+    def __iter__(self):
+        if self.shuffle:
+            order = torch.randperm(len(self.lengths), generator=self.generator)
+            order = order[torch.argsort(self.lengths[order], stable=True)]
+        else:
+            order = torch.argsort(self.lengths, stable=True)
+
+        batches = torch.split(order, self.batch_size)
+        if self.shuffle:
+            shuffled = torch.randperm(len(batches), generator=self.generator)
+            batches = [batches[i] for i in shuffled]
+        for batch in batches:
+            yield batch.tolist()
+
+    def __len__(self):
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
@@ -1,12 +1,32 @@
 # get the subset of GloVe that relates to the vocabulary present in the texts
 # this should allow for faster usage later
+# the first subset of a GloVe file builds an index of the offset of each of
+# its lines (saved next to it), so later subsets only read the rows they need
 
 import os
+import fnmatch
+import warnings
+from functools import lru_cache
 
 import pandas as pd
 import numpy as np
 from tomcat_speech.data_prep.data_prep_helpers import clean_up_word
 
+# columns holding the text in the MELD, MUStARD, Chalearn and ASIST files,
+# and in the word-level LIvES files
+TEXT_COLUMNS = ["Utterance", "utterance", "utt", "word"]
+
+# the files holding the text of each corpus, with their separator:
+# averaged ASIST/LIvES features, MELD, MUStARD and Chalearn transcripts
+# the other .csv files of these directories are mostly openSMILE features
+# separated by ";", so they are left out of the directory walk
+TEXT_FILES = [
+    ("*_avgd.csv", ","),
+    ("*_sent_emo.csv", ","),
+    ("mustard_utts*.tsv", "\t"),
+    ("gold_and_utts.tsv", "\t"),
+]
+
 
 def get_all_vocab(data_dir):
     """
@@ -27,30 +47,179 @@ def get_all_vocab(data_dir):
     return all_vocab
 
 
-def subset_glove(glove_path, vocab_set, vec_len=100, add_unk=True):
-    with open(glove_path, "r") as glove:
-        subset = []
-        num_items = 0
-        if add_unk:
-            unk_vec = np.zeros(vec_len)
+def get_tokens(text):
+    """
+    Get the tokens of a text as any of the corpus preparation classes may
+    look them up in GloVe: split after clean_up_word, with and without
+    lowercasing, and with the basic_english tokenizer
+    """
+    cleaned = clean_up_word(text)
+    tokens = set(cleaned.split())
+    tokens.update(cleaned.lower().split())
+
+    tokens.update(get_basic_english()(text))
+    return tokens
+
+
+@lru_cache()
+def get_basic_english():
+    # the tokenizer used to prepare MELD, MUStARD and Chalearn; torchtext is
+    # only needed once there is text to tokenize
+    from torchtext.data import get_tokenizer
+
+    return get_tokenizer("basic_english")
+
+
+def get_separator(text_file):
+    """
+    Get the separator of a known text file, or None to have pandas detect
+    it
+    """
+    for pattern, sep in TEXT_FILES:
+        if fnmatch.fnmatch(os.path.basename(text_file), pattern):
+            return sep
+    return None
+
+
+def is_text_file(filename):
+    return filename.endswith(".vtt") or get_separator(filename) is not None
+
+
+def iter_texts(text_file, chunksize=10000):
+    """
+    Get the texts in a MELD/MUStARD/Chalearn/ASIST/LIvES file, chunk by chunk
+    Zoom .vtt transcripts are also read; the separator of files not in
+    TEXT_FILES is detected, and files without any of the TEXT_COLUMNS yield
+    nothing
+    """
+    if text_file.endswith(".vtt"):
+        from tomcat_speech.data_prep.asist_data.asist_pipeline import (
+            read_zoom_vtt,
+        )
+
+        yield from read_zoom_vtt(text_file)["utt"].dropna().astype(str)
+        return
+
+    sep = get_separator(text_file)
+    engine = "c" if sep is not None else "python"
+    header = pd.read_csv(text_file, sep=sep, engine=engine, nrows=0).columns
+    columns = [col for col in TEXT_COLUMNS if col in header]
+    if not columns:
+        warnings.warn(f"{text_file} has no text column, skipping it")
+        return
+    for chunk in pd.read_csv(
+        text_file,
+        sep=sep,
+        engine=engine,
+        usecols=columns[:1],
+        chunksize=chunksize,
+    ):
+        yield from chunk[columns[0]].dropna().astype(str)
+
+
+def collect_vocab(paths):
+    """
+    Get the vocabulary of a list of text files and directories, e.g. the
+    MELD, MUStARD, Chalearn and ASIST data directories, in a single pass over
+    each file
+    Only the TEXT_FILES and .vtt transcripts of the directories are read
+    """
+    text_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                text_files.extend(
+                    os.path.join(root, f)
+                    for f in sorted(files)
+                    if is_text_file(f)
+                )
+        else:
+            text_files.append(path)
+
+    all_vocab = set()
+    for text_file in text_files:
+        for text in iter_texts(text_file):
+            all_vocab.update(get_tokens(text))
+    return all_vocab
+
+
+def index_glove(glove_path):
+    """
+    Get a dict of word: offset of its line in a GloVe text file
+    The index is saved in glove_path + ".idx.npz" (an array of words and an
+    int64 array of offsets) when the directory is writable, and rebuilt only
+    when the GloVe file changes
+    """
+    index_path = glove_path + ".idx.npz"
+    stat = os.stat(glove_path)
+    key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    if os.path.exists(index_path):
+        with np.load(index_path) as saved:
+            if np.array_equal(saved["key"], key):
+                return dict(
+                    zip(saved["words"].tolist(), saved["offsets"].tolist())
+                )
+
+    index = {}
+    offset = 0
+    with open(glove_path, "rb") as glove:
         for line in glove:
-            vals = line.split()
-            if vals[0] in vocab_set:
-                num_items += 1
-                subset.append(vals)
-                if add_unk:
-                    unk_vec = unk_vec + np.array(
-                        [float(item) for item in vals[1:]]
-                    )
+            word = line.split(b" ", 1)[0].decode("utf-8", errors="replace")
+            index.setdefault(word, offset)
+            offset += len(line)
+
+    try:
+        np.savez(
+            index_path,
+            key=key,
+            words=np.array(list(index), dtype=str),
+            offsets=np.array(list(index.values()), dtype=np.int64),
+        )
+    except OSError:
+        # a read-only GloVe directory only means indexing again next time
+        pass
+    return index
+
+
+def read_glove_rows(glove_path, vocab_set):
+    """
+    Get the rows of a GloVe text file for the words in vocab_set, in the
+    order of the file, as lists of strings (word followed by its values)
+    """
+    index = index_glove(glove_path)
+    offsets = sorted(index[wd] for wd in vocab_set if wd in index)
+    rows = []
+    with open(glove_path, "rb") as glove:
+        for offset in offsets:
+            glove.seek(offset)
+            rows.append(glove.readline().decode("utf-8").rstrip().split(" "))
+    return rows
+
+
+def subset_glove(glove_path, vocab_set, vec_len=100, add_unk=True):
+    subset = read_glove_rows(glove_path, vocab_set)
     if add_unk:
-        unk_vec = unk_vec / num_items
-        unk_vec = ["<UNK>"] + unk_vec.tolist()
-        unk_vec = [str(item) for item in unk_vec]
-        subset.append(unk_vec)
+        if subset:
+            vectors = np.array([row[1:] for row in subset], dtype=np.float64)
+            unk_vec = vectors.mean(axis=0)
+        else:
+            unk_vec = np.zeros(vec_len)
+        subset.append(["<UNK>"] + [str(item) for item in unk_vec.tolist()])
     return subset
 
 
 def save_subset(subset, save_path):
+    """
+    Save a subset of GloVe as text, or in binary format (an array of words
+    and a float32 array of vectors) if save_path ends in .npz
+    """
+    if save_path.endswith(".npz"):
+        np.savez(
+            save_path,
+            words=np.array([item[0] for item in subset]),
+            vectors=np.array([item[1:] for item in subset], dtype=np.float32),
+        )
+        return
     with open(save_path, "w") as gfile:
         for item in subset:
             gfile.write(" ".join(item))
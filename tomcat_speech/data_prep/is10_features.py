@@ -0,0 +1,633 @@
+"""NumPy implementation of the IS10 low-level descriptors used by our models.
+
+The models only use ten of the low-level descriptors computed by openSMILE's
+IS10_paraling configuration (see IS10_COLUMNS). This module computes them
+without openSMILE, following the processing chain of openSMILE 3.0:
+
+- pcm_loudness: loudness of 25 ms frames (hop 10 ms).
+- F0finEnv and voicingFinalUnclipped: subharmonic summation pitch detection
+  on 60 ms Gaussian-windowed frames (hop 10 ms), followed by openSMILE's
+  pitch smoother and F0 envelope.
+- jitterLocal and shimmerLocal: cycle-to-cycle variation of the period
+  lengths and amplitudes within each voiced pitch frame.
+
+All descriptors are smoothed with a 3-frame moving average (the "_sma"
+suffix), and the "_de" columns are their regression deltas over 5 frames.
+
+The descriptors can be computed frame by frame on a stream of audio (see
+IS10Extractor), or in one go on a whole recording (see
+extract_is10_features), with identical results. Any sample rate is
+supported, as in openSMILE.
+
+Compared with openSMILE 3.0 (IS10_paraling) on synthetic voiced signals at
+16, 44.1 and 48 kHz, loudness and F0 envelope (and their deltas) differed by
+about 1e-5 at most. Voicing matched within the same tolerance except in the
+frames where two F0 candidates are almost tied, where it can differ by much
+more. Jitter and shimmer are estimated by a simpler cross-correlation period
+search than openSMILE's, so they follow the same scale but not the exact
+values, and so do their deltas. The last few frames of a recording can also
+differ, since openSMILE handles the end of the stream slightly differently.
+scripts/validate_is10_features compares the output of this module with
+openSMILE's for a given recording.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+IS10_COLUMNS = [
+    "pcm_loudness_sma",
+    "F0finEnv_sma",
+    "voicingFinalUnclipped_sma",
+    "jitterLocal_sma",
+    "shimmerLocal_sma",
+    "pcm_loudness_sma_de",
+    "F0finEnv_sma_de",
+    "voicingFinalUnclipped_sma_de",
+    "jitterLocal_sma_de",
+    "shimmerLocal_sma_de",
+]
+
+# Frame step, loudness frame and pitch frame lengths in seconds.
+FRAME_STEP = 0.01
+LOUDNESS_FRAME = 0.025
+PITCH_FRAME = 0.06
+
+# Lowest frequency of the octave scale on which subharmonic summation is
+# performed. The scale goes up to the Nyquist frequency, with as many points
+# as the FFT has bins.
+OCTAVE_MIN_F = 20.0
+
+# Subharmonic summation parameters.
+SHS_HARMONICS = 15
+SHS_COMPRESSION = 0.85
+SHS_CANDIDATES = 6
+MIN_F0 = 52.0
+MAX_F0 = 620.0
+VOICING_THRESHOLD = 0.70
+
+# Jitter and shimmer parameters.
+PERIOD_SEARCH_RANGE = 0.2
+MIN_PERIOD_CC = 0.5
+MIN_NUM_PERIODS = 2
+
+# Number of frames of context needed on each side of a frame to compute its
+# smoothed values (1) and their deltas (2 more).
+CONTEXT = 3
+
+# Maximum number of frames analyzed at once, which bounds the memory used
+# when processing long chunks of audio (e.g. whole files).
+BLOCK_FRAMES = 1000
+
+
+@lru_cache()
+def octave_scale_matrix(sample_rate: int, fft_size: int) -> np.ndarray:
+    """Returns the matrix that maps a magnitude spectrum to the octave scale.
+
+    openSMILE interpolates the spectrum with a natural cubic spline whose
+    knots are the log2 frequencies of the FFT bins (bin 0 being put at half
+    the frequency of bin 1). Since the spline is linear in the knot values,
+    it is precomputed here as a matrix."""
+
+    n = fft_size // 2 + 1
+    octaves = np.log2(sample_rate / 2 / OCTAVE_MIN_F)
+    freqs = np.arange(n) * sample_rate / fft_size
+    freqs[0] = freqs[1] / 2
+    x = np.log2(freqs)
+    h = np.diff(x)
+
+    # Second derivatives at the interior knots, as a linear function of the
+    # knot values (they are 0 at both ends for a natural spline).
+    a = np.zeros((n - 2, n - 2))
+    i = np.arange(n - 2)
+    a[i, i] = (h[:-1] + h[1:]) / 3
+    a[i[1:], i[1:] - 1] = h[1:-1] / 6
+    a[i[:-1], i[:-1] + 1] = h[1:-1] / 6
+    b = np.zeros((n - 2, n))
+    b[i, i] = 1 / h[:-1]
+    b[i, i + 1] = -1 / h[:-1] - 1 / h[1:]
+    b[i, i + 2] = 1 / h[1:]
+    m = np.zeros((n, n))
+    m[1:-1] = np.linalg.solve(a, b)
+
+    targets = np.log2(OCTAVE_MIN_F) + np.arange(n) * octaves / (n - 1)
+    k = np.clip(np.searchsorted(x, targets) - 1, 0, n - 2)
+    hk = h[k]
+    t1 = (x[k + 1] - targets) / hk
+    t0 = (targets - x[k]) / hk
+
+    rows = np.arange(n)
+    matrix = (hk**2 / 6)[:, None] * (
+        (t1**3 - t1)[:, None] * m[k] + (t0**3 - t0)[:, None] * m[k + 1]
+    )
+    matrix[rows, k] += t1
+    matrix[rows, k + 1] += t0
+    return matrix
+
+
+@lru_cache()
+def _pitch_constants(sample_rate: int):
+    frame_size = int(round(PITCH_FRAME * sample_rate))
+    fft_size = 1 << (frame_size - 1).bit_length()
+
+    i = np.arange(frame_size)
+    half = (frame_size - 1) / 2
+    window = np.exp(-0.5 * ((i - half) / (0.25 * half)) ** 2)
+
+    # Points of the octave scale, and their spacing in octaves (openSMILE
+    # uses two slightly different spacings for the frequencies of the points
+    # and for the other computations).
+    n = fft_size // 2 + 1
+    octaves = np.log2(sample_rate / 2 / OCTAVE_MIN_F)
+    k = np.arange(n)
+    spacing = octaves / (n - 1)
+    step = octaves / n
+
+    auditory_weights = (
+        0.5 + np.arctan(3 * ((k + 2) * step - np.log2(1.3))) / np.pi
+    )
+    shifts = [
+        int(np.floor(np.log2(h) / step)) for h in range(1, SHS_HARMONICS + 1)
+    ]
+    return frame_size, fft_size, window, auditory_weights, shifts, spacing
+
+
+def enhance_peaks(magnitudes: np.ndarray) -> np.ndarray:
+    """Zeroes the bins of each spectrum that are at least 3 bins away from
+    both neighbouring peaks."""
+
+    m = magnitudes
+    n = m.shape[1]
+    is_peak = np.zeros(m.shape, dtype=bool)
+    is_peak[:, 1:-1] = (m[:, 1:-1] > m[:, :-2]) & (m[:, 1:-1] > m[:, 2:])
+    is_peak[:, 0] = m[:, 0] > m[:, 1]
+    is_peak[:, -1] = m[:, -1] > m[:, -2]
+
+    j = np.arange(n)
+    previous_peak = np.maximum.accumulate(np.where(is_peak, j, -n), axis=1)
+    next_peak = np.minimum.accumulate(
+        np.where(is_peak, j, 2 * n)[:, ::-1], axis=1
+    )[:, ::-1]
+    valley = (
+        (previous_peak >= 0)
+        & (next_peak < n)
+        & (j - previous_peak >= 3)
+        & (next_peak - j >= 3)
+    )
+    return np.where(valley, 0.0, m)
+
+
+def smooth_spectrum(m: np.ndarray) -> np.ndarray:
+    s = m.copy()
+    s[:, 1:-1] = 0.25 * m[:, :-2] + 0.5 * m[:, 1:-1] + 0.25 * m[:, 2:]
+    s[:, 0] = 0.5 * m[:, 0] + 0.25 * m[:, 1]
+    return s
+
+
+def detect_pitch(frames: np.ndarray, sample_rate: int):
+    """Returns the F0 candidate (in Hz, 0 if none was found) and the voicing
+    probability of each row of a 2D array of pitch frames."""
+
+    frame_size, fft_size, window, weights, shifts, spacing = _pitch_constants(
+        sample_rate
+    )
+
+    spectrum = np.abs(np.fft.rfft(frames * window, fft_size, axis=1))
+    spectrum = smooth_spectrum(enhance_peaks(spectrum))
+    octaves = spectrum @ octave_scale_matrix(sample_rate, fft_size).T
+    octaves = np.maximum(octaves, 0) * weights
+
+    # Subharmonic summation.
+    n = octaves.shape[1]
+    shs = np.zeros_like(octaves)
+    for h, shift in enumerate(shifts):
+        shs[:, : n - shift] += SHS_COMPRESSION**h * octaves[:, shift:]
+
+    # Parabolic refinement of the local maxima.
+    a, b, c = shs[:, :-2], shs[:, 1:-1], shs[:, 2:]
+    is_peak = (b > a) & (b > c)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d = np.where(is_peak, 0.5 * (a - c) / (a - 2 * b + c), 0.0)
+    value = b - 0.25 * (a - c) * d
+    value = np.where(is_peak, value, -np.inf)
+    f0 = 2 ** (np.log2(OCTAVE_MIN_F) + (np.arange(1, n - 1) + d) * spacing)
+
+    # Only the SHS_CANDIDATES highest peaks are F0 candidates, of which those
+    # outside of the F0 range are discarded.
+    lowest = np.partition(value, -SHS_CANDIDATES, axis=1)[
+        :, -SHS_CANDIDATES, None
+    ]
+    valid = is_peak & (value >= lowest) & (f0 >= MIN_F0) & (f0 <= MAX_F0)
+
+    best = np.argmax(np.where(valid, value, -np.inf), axis=1)
+    rows = np.arange(len(frames))
+    voiced = valid[rows, best]
+    pitch = np.where(voiced, f0[rows, best], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        voicing = np.where(
+            voiced, 1 - shs.mean(axis=1) / value[rows, best], 0.0
+        )
+    return pitch, voicing
+
+
+def period_perturbations(frames: np.ndarray, f0: np.ndarray, sample_rate: int):
+    """Returns the local jitter and shimmer of each row of a 2D array of
+    voiced pitch frames, given their F0.
+
+    Consecutive periods are found by looking for the best match of the
+    current period within +/- 20% of the expected period length, with
+    sub-sample precision. The search stops at the first match whose
+    normalized cross-correlation is below MIN_PERIOD_CC. All frames are
+    searched at once, one period at a time, computing the cross-correlations
+    with the FFT."""
+
+    n, size = frames.shape
+    jitter, shimmer = np.zeros(n), np.zeros(n)
+    if n == 0:
+        return jitter, shimmer
+
+    t0 = sample_rate / f0
+    length = np.rint(t0).astype(int)
+    max_length = int(length.max())
+    max_candidates = int(np.ceil(2 * PERIOD_SEARCH_RANGE * t0.max())) + 2
+    segment_size = max_candidates + max_length - 1
+    fft_size = 1 << (segment_size - 1).bit_length()
+
+    energy = np.zeros((n, size + 1))
+    np.cumsum(frames**2, axis=1, out=energy[:, 1:])
+
+    max_periods = int(size / ((1 - PERIOD_SEARCH_RANGE) * t0.min())) + 1
+    periods = np.zeros((n, max_periods))
+    amplitudes = np.zeros((n, max_periods))
+    counts = np.zeros(n, dtype=int)
+    position = np.zeros(n)
+    active = np.arange(n)
+
+    while len(active):
+        start = np.rint(position[active]).astype(int)
+        lo = np.floor(start + t0[active] * (1 - PERIOD_SEARCH_RANGE))
+        hi = np.ceil(start + t0[active] * (1 + PERIOD_SEARCH_RANGE))
+        lo, hi = lo.astype(int), hi.astype(int)
+        fits = hi + length[active] <= size
+        active, start, lo, hi = active[fits], start[fits], lo[fits], hi[fits]
+        if not len(active):
+            break
+        f = frames[active]
+        ln = length[active][:, None]
+        rows = np.arange(len(active))[:, None]
+
+        j = np.arange(max_length)
+        reference = np.where(
+            j < ln, f[rows, np.minimum(start[:, None] + j, size - 1)], 0.0
+        )
+        segment = f[
+            rows, np.minimum(lo[:, None] + np.arange(segment_size), size - 1)
+        ]
+        products = np.fft.irfft(
+            np.fft.rfft(segment, fft_size)
+            * np.conj(np.fft.rfft(reference, fft_size)),
+            fft_size,
+        )[:, :max_candidates]
+
+        c = np.arange(max_candidates)
+        candidate_start = np.minimum(lo[:, None] + c, size - ln)
+        candidate_energy = (
+            energy[active[:, None], candidate_start + ln]
+            - energy[active[:, None], candidate_start]
+        )
+        reference_energy = (
+            energy[active, start + ln[:, 0]] - energy[active, start]
+        )
+        norms = np.sqrt(
+            np.maximum(candidate_energy * reference_energy[:, None], 0)
+        )
+        cc = products / np.maximum(norms, 1e-12)
+        num_candidates = (hi - lo + 1)[:, None]
+        cc[c >= num_candidates] = -np.inf
+
+        k = np.argmax(cc, axis=1)
+        found = cc[rows[:, 0], k] >= MIN_PERIOD_CC
+
+        # Parabolic interpolation of the best match.
+        inner = (k > 0) & (k < num_candidates[:, 0] - 1)
+        a = cc[rows[:, 0], np.maximum(k - 1, 0)]
+        b = cc[rows[:, 0], k]
+        d = cc[rows[:, 0], np.minimum(k + 1, max_candidates - 1)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            denominator = np.where(inner, a - 2 * b + d, 0.0)
+            offset = np.where(
+                denominator != 0, 0.5 * (a - d) / denominator, 0.0
+            )
+
+        active, lo, k, offset = (
+            active[found],
+            lo[found],
+            k[found],
+            offset[found],
+        )
+        end = lo + k + offset
+        periods[active, counts[active]] = end - position[active]
+        amplitudes[active, counts[active]] = np.abs(reference[found]).max(
+            axis=1
+        )
+        counts[active] += 1
+        position[active] = end
+
+    valid = counts >= MIN_NUM_PERIODS
+    periods, amplitudes, counts = (
+        periods[valid],
+        amplitudes[valid],
+        counts[valid],
+    )
+    in_range = np.arange(max_periods) < counts[:, None]
+    diff_in_range = in_range[:, 1:]
+
+    def perturbation(x):
+        mean = np.where(in_range, x, 0).sum(axis=1) / counts
+        mean_diff = np.where(diff_in_range, np.abs(np.diff(x, axis=1)), 0).sum(
+            axis=1
+        ) / (counts - 1)
+        return mean_diff / np.maximum(mean, 1e-12)
+
+    jitter[valid] = perturbation(periods)
+    shimmer[valid] = perturbation(amplitudes)
+    return jitter, shimmer
+
+
+def smooth_pitch(pitch, voicing, previous_voiced: bool, next_voiced):
+    """openSMILE's pitch smoother: F0 is only kept in frames whose voicing is
+    above VOICING_THRESHOLD, and not in isolated voiced frames. The voicing
+    of the frames before and after the given ones is needed for the latter."""
+
+    voiced = voicing > VOICING_THRESHOLD
+    before = np.concatenate([[previous_voiced], voiced[:-1]])
+    after = np.concatenate([voiced[1:], [next_voiced]])
+    return np.where(voiced & (before | after), pitch, 0.0)
+
+
+def moving_average(x: np.ndarray, nonzero: bool = False) -> np.ndarray:
+    """3-frame moving average of the rows of x, replicating the first and
+    last rows at the edges. If nonzero is True, zeros stay zero and are
+    excluded from the average of their neighbours."""
+
+    padded = np.concatenate([x[:1], x, x[-1:]])
+    if not nonzero:
+        return (padded[:-2] + padded[1:-1] + padded[2:]) / 3
+
+    counts = (
+        (padded[:-2] != 0).astype(float)
+        + (padded[1:-1] != 0)
+        + (padded[2:] != 0)
+    )
+    sums = padded[:-2] + padded[1:-1] + padded[2:]
+    return np.where(x != 0, sums / np.maximum(counts, 1), 0.0)
+
+
+def delta(x: np.ndarray) -> np.ndarray:
+    """Regression deltas of the rows of x over a window of 5 frames,
+    replicating the first and last rows at the edges."""
+
+    padded = np.concatenate([x[:1], x[:1], x, x[-1:], x[-1:]])
+    return (padded[3:-1] - padded[1:-3] + 2 * (padded[4:] - padded[:-4])) / 10
+
+
+def segment_delta(x: np.ndarray) -> np.ndarray:
+    """Like delta, but only within segments of nonzero values, outside of
+    which the deltas are 0. Segment boundaries are replicated like the
+    edges."""
+
+    nonzero = x != 0
+    n = len(x)
+    i = np.arange(n)[:, None]
+
+    # First and last index of the segment of each frame.
+    first = np.maximum.accumulate(np.where(~nonzero, i, -1), axis=0) + 1
+    last = (
+        np.minimum.accumulate(np.where(~nonzero, i, n)[::-1], axis=0)[::-1] - 1
+    )
+    columns = np.arange(x.shape[1])
+
+    def at(offset):
+        return x[np.clip(i + offset, first, last), columns]
+
+    d = (at(1) - at(-1) + 2 * (at(2) - at(-2))) / 10
+    d[first == i] = 0.0
+    return np.where(nonzero, d, 0.0)
+
+
+def extract_is10_features(samples: np.ndarray, sample_rate: int):
+    """Returns the IS10 descriptors of a whole recording (16-bit integer
+    samples) as a 2D array, one row per frame."""
+    extractor = IS10Extractor(sample_rate)
+    return np.concatenate([extractor.process(samples), extractor.flush()])
+
+
+def extract_is10_features_from_file(path: str, sample_rate: int = None):
+    """Returns the IS10 descriptors of an audio or video file, one row per
+    frame. Files other than 16-bit PCM WAVE are decoded by ffmpeg straight
+    into the extractor (resampled to sample_rate if given), without writing
+    any intermediate file. Channels are averaged."""
+    from tomcat_speech.data_prep.audio_io import PCMStream
+
+    with PCMStream(path, sample_rate=sample_rate, channels=None) as stream:
+        extractor = IS10Extractor(stream.sample_rate)
+        rows = [
+            extractor.process(chunk if chunk.ndim == 1 else chunk.mean(1))
+            for chunk in stream
+        ]
+    return np.concatenate(rows + [extractor.flush()])
+
+
+def save_is10_csv(path: str, csv_path: str):
+    """Computes the IS10 descriptors of an audio or video file and saves
+    them to a CSV file in the format of openSMILE's -lldcsvoutput option
+    (restricted to IS10_COLUMNS)."""
+    import pandas as pd
+
+    features = extract_is10_features_from_file(path)
+
+    df = pd.DataFrame(features, columns=IS10_COLUMNS)
+    df.insert(0, "frameTime", np.arange(len(df)) * FRAME_STEP)
+    df.insert(0, "name", "'unknown'")
+    df.to_csv(csv_path, sep=";", index=False, float_format="%.6e")
+
+
+class IS10Extractor(object):
+    """Computes the IS10 descriptors of a stream of audio, frame by frame.
+
+    Audio is passed to `process` in chunks of any size, as 16-bit integer
+    samples (or bytes). Each call returns the rows of descriptors (in the
+    order of IS10_COLUMNS) that could be completed with the audio received so
+    far, which lag a few frames behind the audio. Frame i starts at sample
+    i * frame_step, like the frameTime column of openSMILE's output. Calling
+    `flush` at the end of the stream returns the remaining rows.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.frame_step = int(round(FRAME_STEP * sample_rate))
+        self.loudness_frame_size = int(round(LOUDNESS_FRAME * sample_rate))
+        self.pitch_frame_size = _pitch_constants(sample_rate)[0]
+
+        # openSMILE 3.0 only takes the first sample of each (Hamming
+        # windowed) frame into account to compute the loudness.
+        window = np.hamming(self.loudness_frame_size)
+        self._loudness_scale = window[0] / window.sum() / 1e-6
+
+        # Samples from the start of the first frame whose jitter has not been
+        # computed yet, and the absolute position of the first of them.
+        self._samples = np.zeros(0)
+        self._samples_start = 0
+
+        # Index of the next pitch frame, of the first frame whose F0 has not
+        # been smoothed yet, and of the next row to return.
+        self.num_frames = 0
+        self.num_smoothed = 0
+        self.num_returned = 0
+
+        # Loudness, pitch and voicing of the frames not smoothed yet.
+        self._loudness = np.zeros(0)
+        self._pitch = np.zeros(0)
+        self._voicing = np.zeros(0)
+        self._previous_voiced = False
+
+        self._f0_envelope = 0.0
+
+        # Unsmoothed descriptors (loudness, F0 envelope, voicing, jitter and
+        # shimmer) of the last frames, starting at frame _lld_start.
+        self._lld = np.zeros((0, 5))
+        self._lld_start = 0
+
+    def process(self, chunk) -> np.ndarray:
+        if isinstance(chunk, bytes):
+            chunk = np.frombuffer(chunk, dtype=np.int16)
+
+        block_size = BLOCK_FRAMES * self.frame_step
+        rows = [np.zeros((0, len(IS10_COLUMNS)))]
+        for i in range(0, len(chunk), block_size):
+            block = np.asarray(chunk[i : i + block_size], dtype=np.float64)
+            self._samples = np.concatenate([self._samples, block / 32767])
+            self._analyze_frames()
+            rows.append(self._emit(final=False))
+        return np.concatenate(rows)
+
+    def flush(self) -> np.ndarray:
+        self._smooth(final=True)
+        return self._emit(final=True)
+
+    def _analyze_frames(self):
+        end = self._samples_start + len(self._samples)
+        n = (end - self.pitch_frame_size) // self.frame_step + 1
+        if n <= self.num_frames:
+            return
+
+        starts = (
+            np.arange(self.num_frames, n) * self.frame_step
+            - self._samples_start
+        )
+        frames = np.lib.stride_tricks.sliding_window_view(
+            self._samples, self.pitch_frame_size
+        )[starts]
+        pitch, voicing = detect_pitch(frames, self.sample_rate)
+        if self.num_frames == 0:
+            # openSMILE's smoother outputs nothing useful for the first frame.
+            voicing[0] = 0.0
+
+        self._loudness = np.concatenate(
+            [
+                self._loudness,
+                (self._loudness_scale * self._samples[starts] ** 2) ** 0.3,
+            ]
+        )
+        self._pitch = np.concatenate([self._pitch, pitch])
+        self._voicing = np.concatenate([self._voicing, voicing])
+        self.num_frames = n
+        self._smooth(final=False)
+
+    def _smooth(self, final: bool):
+        # The smoothed F0 of a frame depends on the voicing of the next one.
+        n = len(self._voicing) if final else len(self._voicing) - 1
+        if n <= 0:
+            return
+
+        next_voiced = (
+            self._voicing[n] > VOICING_THRESHOLD
+            if n < len(self._voicing)
+            else False
+        )
+        f0 = smooth_pitch(
+            self._pitch[:n],
+            self._voicing[:n],
+            self._previous_voiced,
+            next_voiced,
+        )
+
+        rows = np.zeros((n, 5))
+        rows[:, 0] = self._loudness[:n]
+        rows[:, 2] = self._voicing[:n]
+
+        # The F0 envelope only changes in voiced frames, and is held in
+        # between.
+        voiced = np.flatnonzero(f0)
+        envelope = np.zeros(len(voiced) + 1)
+        envelope[0] = self._f0_envelope
+        for i, frame in enumerate(voiced):
+            self._f0_envelope = (
+                f0[frame]
+                if self._f0_envelope == 0
+                else 0.75 * self._f0_envelope + 0.25 * f0[frame]
+            )
+            envelope[i + 1] = self._f0_envelope
+        rows[:, 1] = envelope[np.cumsum(f0 > 0)]
+
+        starts = (
+            self.num_smoothed + voiced
+        ) * self.frame_step - self._samples_start
+        frames = np.lib.stride_tricks.sliding_window_view(
+            self._samples, self.pitch_frame_size
+        )[starts]
+        rows[voiced, 3], rows[voiced, 4] = period_perturbations(
+            frames, f0[voiced], self.sample_rate
+        )
+
+        self._lld = np.concatenate([self._lld, rows])
+        self._previous_voiced = self._voicing[n - 1] > VOICING_THRESHOLD
+        self._loudness = self._loudness[n:]
+        self._pitch = self._pitch[n:]
+        self._voicing = self._voicing[n:]
+        self.num_smoothed += n
+
+        # Only the audio of frames yet to be smoothed is still needed.
+        drop = self.num_smoothed * self.frame_step - self._samples_start
+        self._samples = self._samples[drop:]
+        self._samples_start += drop
+
+    def _emit(self, final: bool) -> np.ndarray:
+        end = self.num_smoothed if final else self.num_smoothed - CONTEXT
+        if end <= self.num_returned or len(self._lld) == 0:
+            return np.zeros((0, len(IS10_COLUMNS)))
+
+        # The last frames are only complete at the end of the stream, since
+        # the edges are replicated.
+        lld = self._lld
+        smoothed = np.concatenate(
+            [
+                moving_average(lld[:, :3]),
+                moving_average(lld[:, 3:], nonzero=True),
+            ],
+            axis=1,
+        )
+        deltas = np.concatenate(
+            [delta(smoothed[:, :3]), segment_delta(smoothed[:, 3:])], axis=1
+        )
+        features = np.concatenate([smoothed, deltas], axis=1)
+
+        first = self.num_returned - self._lld_start
+        rows = features[first : end - self._lld_start]
+        self.num_returned = end
+
+        # Keep the context needed by the next rows.
+        keep = max(0, self.num_returned - CONTEXT - self._lld_start)
+        self._lld = self._lld[keep:]
+        self._lld_start += keep
+        return rows
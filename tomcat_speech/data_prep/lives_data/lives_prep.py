@@ -7,15 +7,13 @@ from torch.utils.data import Dataset
 from collections import OrderedDict
 import pandas as pd
 import numpy as np
-import functools
-import operator
 
+from tomcat_speech.data_prep.cv_folds import CVFolds
 from tomcat_speech.data_prep.data_prep_helpers import (
-    MinMaxScaleRange,
+    MinMaxScaler,
     get_longest_utterance,
     clean_up_word,
     get_avg_vec,
-    scale_feature,
 )
 
 
@@ -31,6 +29,7 @@ class ClinicalDataset(Dataset):
         sequence_prep=None,
         truncate_from="start",
         alignment=None,
+        fold_by=None,
     ):
         """
         :param acoustic_dict: dict of {(sid, call) : data}
@@ -40,6 +39,8 @@ class ClinicalDataset(Dataset):
         :param norm: the type of data normalization
         :param sequence_prep: the way sequences are handled, options: truncate, pad, None
         :param truncate_from: whether to truncate from start or end of file
+        :param fold_by: how to make the CV folds: None (randomly), label
+            (stratified) or speaker (all calls of a participant together)
         """
         self.cols_to_skip = cols_to_skip
         self.acoustic_dict = OrderedDict(acoustic_dict)
@@ -51,10 +52,9 @@ class ClinicalDataset(Dataset):
         self.alignment = alignment
 
         if norm == "minmax":
-            # currently uses index-keyed min-max for features
-            # should we change it later?
-            self.min_max_scaler = MinMaxScaleRange()
+            self.min_max_scaler = MinMaxScaler()
             self.get_min_max_scales()
+            self.minmax_scale()
 
         self.valid_files = self.ys_df["sid"].tolist()
         self.skipped_files = []
@@ -74,24 +74,30 @@ class ClinicalDataset(Dataset):
         self.y_data = self.create_ordered_ys()
         self.data = self.combine_xs_and_ys()
         self.splits = splits
-        self.data_for_model_input = self.get_data_splits()
+        self.fold_by = fold_by
+        self.folds = self.get_data_splits()
 
         # for working with an individual split
-        self.current_split = []
-        self.current_split_num = 0
-        self.val_split = []
-        self.remaining_splits = []
-
         self.set_split(0)
 
     def get_min_max_scales(self):
+        # get mins and maxes of the acoustic features across all calls
         for call in self.acoustic_dict.values():
-            for row in call.itertuples():
-                for i, wd in enumerate(row):
-                    if i >= self.cols_to_skip + 1:
-                        self.min_max_scaler.update(
-                            (i - (self.cols_to_skip + 1)), wd
-                        )
+            self.min_max_scaler.partial_fit(
+                call.iloc[:, self.cols_to_skip :].to_numpy(dtype=np.float64)
+            )
+
+    def minmax_scale(self):
+        # scale the acoustic features of each call in a single pass
+        for key, call in self.acoustic_dict.items():
+            # the scaled features are floats even where the raw ones are ints
+            call = call.astype(
+                {col: np.float64 for col in call.columns[self.cols_to_skip :]}
+            )
+            call.iloc[:, self.cols_to_skip :] = self.min_max_scaler.transform(
+                call.iloc[:, self.cols_to_skip :]
+            )
+            self.acoustic_dict[key] = call
 
     def __len__(self):
         return len(self.current_split)
@@ -101,49 +107,25 @@ class ClinicalDataset(Dataset):
 
     def set_split(self, n):
         # set the split; n is the TEST split, n-1 is DEV split
-        self.current_split = self.data_for_model_input[n]
+        (
+            self.remaining_splits,
+            self.val_split,
+            self.current_split,
+        ) = self.folds.subsets(self.data, n)
         self.current_split_num = n
-        if n - 1 >= 0:
-            prev = n - 1
-        else:
-            prev = max(self.data_for_model_input.keys())
-        self.val_split = self.data_for_model_input[prev]
-        remaining_splits = [
-            val
-            for key, val in self.data_for_model_input.items()
-            if (key != n and key != prev)
-        ]
-        self.remaining_splits = functools.reduce(
-            operator.iconcat, remaining_splits, []
-        )
 
     def get_data_splits(self):
-        data_dict = {}
-        # calculate length of data
-        total_len = len(self.data)
-        # calculate length of each split based on number
-        split_len = int(total_len / self.splits)
-        # random permutation of indices
-        indices = np.random.permutation(total_len)
-        # get split indices
-        c = 0
-        # for all but final split
-        for split in range(self.splits - 1):
-            split_data = []
-            split_idx = indices[split_len * c : split_len * (c + 1)]
-            # get data for each of the indices
-            for i in split_idx:
-                split_data.append(self.data[i])
-            # add to dict of splits
-            data_dict[c] = split_data
-            c += 1
-        # for final split do the same
-        split_idx = indices[split_len * c :]
-        split_data = []
-        for i in split_idx:
-            split_data.append(self.data[i])
-        data_dict[c] = split_data
-        return data_dict
+        # split the indices of the data into folds
+        labels = self.y_data if self.fold_by == "label" else None
+        groups = None
+        if self.fold_by == "speaker":
+            # all calls of a participant go in the same fold
+            groups = [
+                key[0]
+                for key in self.acoustic_dict.keys()
+                if key[0] in self.valid_files and key not in self.skipped_files
+            ]
+        return CVFolds(len(self.data), self.splits, labels, groups)
 
     def combine_data_utt_level(self):
         """
@@ -215,9 +197,6 @@ class ClinicalDataset(Dataset):
                         # save the acoustic information in remaining columns
                         row_vals = row.values[start_idx:].tolist()
 
-                        # if using min-max scaling, scale the data
-                        if self.norm == "minmax":
-                            self.minmax_scale(row_vals, lower=0, upper=1)
 
                         # add acoustic information to intermediate holder
                         utt_acoustic.append(row_vals)
@@ -332,9 +311,6 @@ class ClinicalDataset(Dataset):
                     # save the acoustic information in remaining columns
                     row_vals = row.values[start_idx:].tolist()
 
-                    # if using min-max scaling, scale the data
-                    if self.norm == "minmax":
-                        self.minmax_scale(row_vals, lower=0, upper=1)
                     # add acoustic information to intermediate holder
                     intermediate_acoustic.append(row_vals)
 
@@ -421,19 +397,6 @@ class ClinicalDataset(Dataset):
 
         return all_data
 
-    def minmax_scale(self, df, lower=0, upper=1):
-        # perform min-max scaling
-        for i, val in enumerate(df):
-            new_val = scale_feature(
-                val,
-                self.min_max_scaler.min(i),
-                self.min_max_scaler.max(i),
-                lower,
-                upper,
-            )
-            df[i] = new_val
-        return df
-
     def truncate_seq(self, starting_size=1e10, minimum=1000):
         """
         truncate the sequence of data
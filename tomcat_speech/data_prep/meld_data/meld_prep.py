@@ -13,8 +13,14 @@ from tomcat_speech.data_prep.data_prep_helpers import (
     get_class_weights,
     get_gender_avgs,
     make_acoustic_set,
+    read_files_concurrently,
     transform_acoustic_item,
 )
+from tomcat_speech.data_prep.dialogue_data import (
+    DialogueDataset,
+    get_dialogue_offsets,
+)
+from tomcat_speech.data_prep.text_normalization import normalize_column
 from collections import OrderedDict
 
 from torchtext.data import get_tokenizer
@@ -34,6 +40,7 @@ class MeldPrep:
         use_cols=None,
         add_avging=True,
         avgd=False,
+        num_workers=None,
     ):
         self.path = meld_path
         self.train_path = meld_path + "/train"
@@ -83,6 +90,7 @@ class MeldPrep:
             f_end,
             use_cols=use_cols,
             avgd=avgd,
+            num_workers=num_workers,
         )
         self.train_dict = OrderedDict(self.train_dict)
         self.dev_dict, self.dev_acoustic_lengths = make_acoustic_dict_meld(
@@ -90,6 +98,7 @@ class MeldPrep:
             f_end,
             use_cols=use_cols,
             avgd=avgd,
+            num_workers=num_workers,
         )
         self.dev_dict = OrderedDict(self.dev_dict)
         self.test_dict, self.test_acoustic_lengths = make_acoustic_dict_meld(
@@ -97,6 +106,7 @@ class MeldPrep:
             f_end,
             use_cols=use_cols,
             avgd=avgd,
+            num_workers=num_workers,
         )
         self.test_dict = OrderedDict(self.test_dict)
 
@@ -174,6 +184,17 @@ class MeldPrep:
             self.test_data_file, self.test_usable_utts, glove
         )
 
+        # get where each dialogue starts in the data of each set
+        self.train_dia_offsets = self.get_dia_offsets(
+            self.train_data_file, self.train_usable_utts
+        )
+        self.dev_dia_offsets = self.get_dia_offsets(
+            self.dev_data_file, self.dev_usable_utts
+        )
+        self.test_dia_offsets = self.get_dia_offsets(
+            self.test_data_file, self.test_usable_utts
+        )
+
         # set emotion and sentiment weights
         self.emotion_weights = get_class_weights(self.train_y_emo)
         self.sentiment_weights = get_class_weights(self.train_y_sent)
@@ -305,10 +326,9 @@ class MeldPrep:
         all_utts_df = pd.concat(
             [train_utts_df, dev_utts_df, test_utts_df], axis=0
         )
-        all_utts = all_utts_df["Utterance"].tolist()
+        all_utts = normalize_column(all_utts_df["Utterance"]).tolist()
 
         for i, item in enumerate(all_utts):
-            item = clean_up_word(item)
             item = self.tokenizer(item)
             if len(item) > longest:
                 longest = len(item)
@@ -338,6 +358,8 @@ class MeldPrep:
         # create holder for sequence lengths information
         utt_lengths = []
 
+        all_utts_list = set(all_utts_list)
+
         for idx, row in all_utts_df.iterrows():
 
             # check to make sure this utterance is used
@@ -390,83 +412,62 @@ class MeldPrep:
         """
         Prepare the tensors of utterances + speakers, emotion and sentiment scores
         This preserves dialogue structure for use within networks
-        todo: add usage of this back into the class as needed
-            or (better) combine with make_meld_data_tensors
+        The utterances of all dialogues are kept back to back, and the
+        offsets of the dialogues say where each one starts
         :param text_path: the FULL path to a csv containing the text (in column 0)
         :param all_utts_list: a list of all usable utterances
         :param glove: an instance of class Glove
-        :return:
+        :return: the outputs of make_meld_data_tensors (with the utterances
+            in a single tensor) + the dialogue offsets
         """
-        # holders for the data
-        all_utts = []
-        all_speakers = []
-        all_emotions = []
-        all_sentiments = []
-
         all_utts_df = pd.read_csv(text_path)
-        dialogue = 0
-
-        # dialogue-level holders
-        utts = [[0] * self.longest_utt] * self.longest_dia
-        spks = [0] * self.longest_dia
-        emos = [[0] * 7] * self.longest_dia
-        sents = [[0] * 3] * self.longest_dia
-
-        for idx, row in all_utts_df.iterrows():
 
-            # check to make sure this utterance is used
-            dia_num, utt_num = row["DiaID_UttID"].split("_")[:2]
-            if (dia_num, utt_num) in all_utts_list:
-
-                dia_id = row["Dialogue_ID"]
-                utt_id = row["Utterance_ID"]
-                utt = row["Utterance"]
-                utt = [clean_up_word(wd) for wd in utt.strip().split(" ")]
-
-                spk_id = row["Speaker"]
-                emo = row["Emotion"]
-                sent = row["Sentiment"]
-
-                # utterance-level holder
-                idxs = [0] * self.longest_utt
-
-                # convert words to indices for glove
-                for ix, wd in enumerate(utt):
-                    if wd in glove.wd2idx.keys():
-                        idxs[ix] = glove.wd2idx[wd]
-                    else:
-                        idxs[ix] = glove.wd2idx["<UNK>"]
-
-                if dialogue == dia_id:
-                    utts[utt_id] = idxs
-                    spks[utt_id] = spk_id
-                    emos[utt_id][emo] = 1  # assign 1 to the emotion tagged
-                    sents[utt_id][sent] = 1  # assign 1 to the sentiment tagged
-                else:
-                    all_utts.append(torch.tensor(utts))
-                    all_speakers.append(spks)
-                    all_emotions.append(emos)
-                    all_sentiments.append(sents)
-
-                    dialogue = dia_id
-
-                    # dialogue-level holders
-                    utts = [[0] * self.longest_utt] * self.longest_dia
-                    spks = [0] * self.longest_dia
-                    emos = [[0] * 7] * self.longest_dia
-                    sents = [[0] * 3] * self.longest_dia
-
-                    utts[utt_id] = idxs
-                    spks[utt_id] = spk_id
-                    emos[utt_id][emo] = 1  # assign 1 to the emotion tagged
-                    sents[utt_id][sent] = 1  # assign 1 to the sentiment tagged
+        (
+            all_utts,
+            all_speakers,
+            all_genders,
+            all_emotions,
+            all_sentiments,
+            utt_lengths,
+        ) = self.make_meld_data_tensors(all_utts_df, all_utts_list, glove)
 
-        all_speakers = torch.tensor(all_speakers)
-        all_emotions = torch.tensor(all_emotions)
-        all_sentiments = torch.tensor(all_sentiments)
+        dia_offsets = self.get_dia_offsets(all_utts_df, all_utts_list)
 
         # return data
-        return all_utts, all_speakers, all_emotions, all_sentiments
+        return (
+            torch.stack(all_utts),
+            all_speakers,
+            all_genders,
+            all_emotions,
+            all_sentiments,
+            utt_lengths,
+            dia_offsets,
+        )
+
+    @staticmethod
+    def get_dia_offsets(all_utts_df, all_utts_list):
+        """
+        Get the offsets of the dialogues among the usable utterances
+        :param all_utts_df: the df containing the utterances
+        :param all_utts_list: a list of all usable utterances
+        """
+        all_utts_list = set(all_utts_list)
+        used = [
+            tuple(item.split("_")[:2]) in all_utts_list
+            for item in all_utts_df["DiaID_UttID"]
+        ]
+        return get_dialogue_offsets(all_utts_df.loc[used, "Dialogue_ID"])
+
+    def make_dialogue_datasets(self):
+        """
+        Get the train, dev and test data with one item per dialogue, to
+        batch with DialogueBucketSampler and collate_dialogues
+        """
+        return (
+            DialogueDataset(self.train_data, self.train_dia_offsets),
+            DialogueDataset(self.dev_data, self.dev_dia_offsets),
+            DialogueDataset(self.test_data, self.test_dia_offsets),
+        )
 
 
 # helper functions
@@ -476,49 +477,59 @@ def make_acoustic_dict_meld(
     files_to_get=None,
     use_cols=None,
     avgd=True,
+    num_workers=None,
 ):
     """
     makes a dict of (dia, utt): data for use in MELD objects
     f_end: end of acoustic file names
     use_cols: if set, should be a list [] of column names to include
     n_to_skip : the number of columns at the start to ignore (e.g. name, time)
+    num_workers: the number of threads reading the files
     """
     acoustic_dict = {}
     # acoustic_lengths = []
     acoustic_lengths = {}
+
+    # set the separator--averaged files are actually CSV, others are ;SV
+    if avgd:
+        separator = ","
+    else:
+        separator = ";"
+
+    def read_feats(f):
+        # read in the file as a dataframe
+        if use_cols is not None:
+            feats = pd.read_csv(
+                acoustic_path + "/" + f,
+                usecols=use_cols,
+                sep=separator,
+            )
+        else:
+            feats = pd.read_csv(acoustic_path + "/" + f, sep=separator)
+            if not avgd:
+                feats.drop(["name", "frameTime"], axis=1, inplace=True)
+        return feats
+
     # find acoustic features files
-    for f in os.listdir(acoustic_path):
-        if f.endswith(f_end):
-            # set the separator--averaged files are actually CSV, others are ;SV
-            if avgd:
-                separator = ","
-            else:
-                separator = ";"
-
-            # read in the file as a dataframe
-            if (
-                files_to_get is None
-                or "_".join(f.split("_")[:2]) in files_to_get
-            ):
-                if use_cols is not None:
-                    feats = pd.read_csv(
-                        acoustic_path + "/" + f,
-                        usecols=use_cols,
-                        sep=separator,
-                    )
-                else:
-                    feats = pd.read_csv(acoustic_path + "/" + f, sep=separator)
-                    if not avgd:
-                        feats.drop(["name", "frameTime"], axis=1, inplace=True)
-
-                # get the dialogue and utterance IDs
-                dia_id = f.split("_")[0]
-                utt_id = f.split("_")[1]
-
-                # save the dataframe to a dict with (dialogue, utt) as key
-                if feats.shape[0] > 0:
-                    acoustic_dict[(dia_id, utt_id)] = feats.values.tolist()
-                    acoustic_lengths[(dia_id, utt_id)] = feats.shape[0]
+    feats_files = [
+        f
+        for f in os.listdir(acoustic_path)
+        if f.endswith(f_end)
+        and (
+            files_to_get is None or "_".join(f.split("_")[:2]) in files_to_get
+        )
+    ]
+    for f, feats in read_files_concurrently(
+        feats_files, read_feats, num_workers
+    ):
+        # get the dialogue and utterance IDs
+        dia_id = f.split("_")[0]
+        utt_id = f.split("_")[1]
+
+        # save the dataframe to a dict with (dialogue, utt) as key
+        if feats.shape[0] > 0:
+            acoustic_dict[(dia_id, utt_id)] = feats.values.tolist()
+            acoustic_lengths[(dia_id, utt_id)] = feats.shape[0]
 
     # sort acoustic lengths so they are in the same order as other data
     acoustic_lengths = [
@@ -44,6 +44,7 @@ class MustardPrep:
         use_cols=None,
         add_avging=True,
         avgd=False,
+        num_workers=None,
     ):
         # path to dataset
         self.path = mustard_path
@@ -67,7 +68,8 @@ class MustardPrep:
             files_to_get=set(self.train["clip_id"].tolist()),
             f_end=f_end,
             use_cols=use_cols,
-            avgd=avgd
+            avgd=avgd,
+            num_workers=num_workers,
             # data_type="mustard",
         )
         self.train_dict = OrderedDict(self.train_dict)
@@ -76,7 +78,8 @@ class MustardPrep:
             files_to_get=set(self.dev["clip_id"].tolist()),
             f_end=f_end,
             use_cols=use_cols,
-            avgd=avgd
+            avgd=avgd,
+            num_workers=num_workers,
             # data_type="mustard",
         )
         self.dev_dict = OrderedDict(self.dev_dict)
@@ -85,7 +88,8 @@ class MustardPrep:
             files_to_get=set(self.test["clip_id"].tolist()),
             f_end=f_end,
             use_cols=use_cols,
-            avgd=avgd
+            avgd=avgd,
+            num_workers=num_workers,
             # data_type="mustard",
         )
         self.test_dict = OrderedDict(self.test_dict)
@@ -0,0 +1,166 @@
+# the preprocessing state of a trained model (vocabulary, speakers, genders
+# and acoustic normalization statistics), saved next to the model at
+# training time so that new data can be encoded the same way at inference
+# time without rebuilding a dataset
+
+import json
+
+import numpy as np
+
+from tomcat_speech.data_prep.data_prep_helpers import MinMaxScaler
+
+# genders as in get_speaker_gender; 0 (unknown) uses the stats of all items
+GENDERS = (0, 1, 2)
+
+
+class PreprocessingArtifacts:
+    """
+    wd2idx : dict of word: index of the embeddings of the model
+    acoustic_columns : the names of the acoustic features, in input order
+    speaker2idx : dict of speaker: index used for speaker embeddings
+    speaker2gender : dict of speaker: gender (0 = unknown, 1 = F, 2 = M)
+    means, stds : dict of gender: (num_feats,) array of the acoustic means
+        and standard deviations of the training data (0 = all items)
+    min_max_scaler : a fitted MinMaxScaler, if minmax norm was used
+    """
+
+    def __init__(
+        self,
+        wd2idx,
+        acoustic_columns,
+        speaker2idx=None,
+        speaker2gender=None,
+        means=None,
+        stds=None,
+        min_max_scaler=None,
+    ):
+        self.wd2idx = wd2idx
+        self.acoustic_columns = list(acoustic_columns)
+        self.speaker2idx = speaker2idx or {}
+        self.speaker2gender = speaker2gender or {}
+        self.means = means or {}
+        self.stds = stds or {}
+        self.min_max_scaler = min_max_scaler
+
+    @classmethod
+    def from_meld(cls, data, glove, acoustic_columns):
+        """
+        Get the artifacts of a MeldPrep made with averaged acoustic features
+        and the glove it was made with
+        """
+        if len(data.train_acoustic.shape) != 2:
+            raise ValueError(
+                "Preprocessing artifacts need averaged acoustic features "
+                "(avgd or add_avging)"
+            )
+        means = {
+            0: data.all_acoustic_means,
+            1: data.female_acoustic_means,
+            2: data.male_acoustic_means,
+        }
+        stds = {
+            0: data.all_acoustic_deviations,
+            1: data.female_deviations,
+            2: data.male_deviations,
+        }
+        speaker2gender = {
+            str(spkr): int(gender)
+            for spkr, gender in data.speaker2gender.items()
+        }
+        return cls(
+            glove.wd2idx,
+            acoustic_columns,
+            speaker2idx={spkr: int(spkr) for spkr in speaker2gender},
+            speaker2gender=speaker2gender,
+            means={gender: _to_vector(mean) for gender, mean in means.items()},
+            stds={gender: _to_vector(std) for gender, std in stds.items()},
+            min_max_scaler=MinMaxScaler().fit(
+                np.asarray(data.train_acoustic, dtype=np.float64)
+            ),
+        )
+
+    @classmethod
+    def from_asist(cls, data, acoustic_columns):
+        """
+        Get the artifacts of an AsistDataset with averaged acoustic features
+        The stats are those of the features before the dataset normalized
+        them, as the featurizer gets them
+        """
+        acoustic = np.stack(
+            [np.asarray(item, dtype=np.float64) for item in data.x_acoustic]
+        )
+        if acoustic.ndim != 2:
+            raise ValueError(
+                "Preprocessing artifacts need averaged acoustic features"
+            )
+        if data.norm == "minmax":
+            acoustic = data.min_max_scaler.inverse_transform(acoustic)
+        elif data.norm is not None:
+            raise ValueError(f"Unknown norm {data.norm}")
+        return cls(
+            data.glove.wd2idx,
+            acoustic_columns,
+            speaker2idx={spkr: i for i, spkr in enumerate(data.speakers)},
+            means={0: acoustic.mean(axis=0)},
+            stds={0: acoustic.std(axis=0, ddof=1)},
+            min_max_scaler=getattr(data, "min_max_scaler", None),
+        )
+
+    def save(self, path):
+        # the tables are saved as json, and the vocabulary and stats as
+        # arrays
+        header = {
+            "acoustic_columns": self.acoustic_columns,
+            "speaker2idx": self.speaker2idx,
+            "speaker2gender": self.speaker2gender,
+        }
+        # several words may share an index (e.g. <UNK>)
+        arrays = {
+            "words": np.array(list(self.wd2idx.keys())),
+            "word_idxs": np.array(list(self.wd2idx.values()), dtype=np.int64),
+        }
+        for gender, mean in self.means.items():
+            arrays[f"mean_{gender}"] = mean
+        for gender, std in self.stds.items():
+            arrays[f"std_{gender}"] = std
+        if self.min_max_scaler is not None:
+            arrays["mins"] = self.min_max_scaler.mins
+            arrays["maxes"] = self.min_max_scaler.maxes
+            arrays["bounds"] = np.array(
+                [self.min_max_scaler.lower, self.min_max_scaler.upper]
+            )
+        np.savez(path, header=np.array(json.dumps(header)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            header = json.loads(str(saved["header"]))
+            wd2idx = dict(
+                zip(saved["words"].tolist(), saved["word_idxs"].tolist())
+            )
+            means, stds = {}, {}
+            for gender in GENDERS:
+                if f"mean_{gender}" in saved.files:
+                    means[gender] = saved[f"mean_{gender}"]
+                if f"std_{gender}" in saved.files:
+                    stds[gender] = saved[f"std_{gender}"]
+            min_max_scaler = None
+            if "mins" in saved.files:
+                min_max_scaler = MinMaxScaler(*saved["bounds"].tolist())
+                min_max_scaler.mins = saved["mins"]
+                min_max_scaler.maxes = saved["maxes"]
+
+        return cls(
+            wd2idx,
+            header["acoustic_columns"],
+            speaker2idx=header["speaker2idx"],
+            speaker2gender=header["speaker2gender"],
+            means=means,
+            stds=stds,
+            min_max_scaler=min_max_scaler,
+        )
+
+
+def _to_vector(stat):
+    # a (num_feats,) float64 array from a tensor of stats
+    return np.asarray(stat, dtype=np.float64).reshape(-1)
@@ -2,16 +2,19 @@
 
 import os
 
+import numpy as np
 import torch
 from torch import nn
 from torchtext.data import get_tokenizer
 
+from tomcat_speech.data_prep.acoustic_summaries import AcousticSummaries
 from tomcat_speech.data_prep.audio_extraction import ExtractAudio
 import pandas as pd
 
 from tomcat_speech.data_prep.data_prep_helpers import (
     get_class_weights,
     get_gender_avgs,
+    read_files_concurrently,
 )
 from tomcat_speech.data_prep.data_prep_helpers import create_data_folds_list
 
@@ -32,6 +35,7 @@ class RavdessPrep:
         use_cols=None,
         add_avging=True,
         avgd=False,
+        num_workers=None,
     ):
         # path to dataset--all within acoustic files for ravdess
         self.path = ravdess_path
@@ -41,7 +45,13 @@ class RavdessPrep:
 
         # get data tensors
         self.all_data = make_ravdess_data_tensors(
-            self.path, glove, f_end, use_cols, add_avging=add_avging, avgd=avgd
+            self.path,
+            glove,
+            f_end,
+            use_cols,
+            add_avging=add_avging,
+            avgd=avgd,
+            num_workers=num_workers,
         )
 
         (
@@ -92,17 +102,20 @@ def make_ravdess_data_tensors(
     use_cols=None,
     add_avging=True,
     avgd=False,
+    num_workers=None,
 ):
     """
     makes data tensors for use in RAVDESS objects
     f_end: end of acoustic file names
     use_cols: if set, should be a list [] of column names to include
     n_to_skip : the number of columns at the start to ignore (e.g. name, time)
+    num_workers: the number of threads reading the files
     # todo: must add acoustic normalization
     # fixme: acoustic padding needed for this to work
     """
     # holder for the data
     acoustic_holder = []
+    acoustic_files = []
     acoustic_lengths = []
     emotions = []
     intensities = []
@@ -121,58 +134,58 @@ def make_ravdess_data_tensors(
     # one to get the longest acoustic df
     # the other to organize data tensors
 
+    # set the separator
+    separator = ";"
+
+    def read_feats(f):
+        # read in the file as a dataframe
+        if use_cols is not None:
+            feats = pd.read_csv(
+                acoustic_path + "/" + f, usecols=use_cols, sep=separator
+            )
+        else:
+            feats = pd.read_csv(acoustic_path + "/" + f, sep=separator)
+            if not avgd:
+                feats.drop(["name", "frameTime"], axis=1, inplace=True)
+        return feats
+
     # find acoustic features files
-    for f in os.listdir(acoustic_path):
-        if f.endswith(f_end):
-            # set the separator
-            separator = ";"
-
-            # read in the file as a dataframe
-            if use_cols is not None:
-                feats = pd.read_csv(
-                    acoustic_path + "/" + f, usecols=use_cols, sep=separator
-                )
-            else:
-                feats = pd.read_csv(acoustic_path + "/" + f, sep=separator)
-                if not avgd:
-                    feats.drop(["name", "frameTime"], axis=1, inplace=True)
-
-            # get the labels
-            all_labels = f.split("_")[0]
-            labels_list = all_labels.split("-")
-
-            emotion = int(labels_list[2]) - 1  # to make it zero-based
-            intensity = int(labels_list[3]) - 1  # to make it zero based
-            utterance = int(labels_list[4])
-            repetition = int(labels_list[5])
-            speaker = int(labels_list[6])
-            if speaker % 2 == 0:
-                gender = 1
-            else:
-                gender = 2
-
-            if utterance % 2 == 0:
-                utt = utt_2
-            else:
-                utt = utt_1
-
-            # save the dataframe to a dict with (dialogue, utt) as key
-            if feats.shape[0] > 0:
-                # order of items: acoustic, utt, spkr, gender, emotion
-                #   intensity, repetition #, utt_length, acoustic_length
-                if add_avging:
-                    acoustic_holder.append(
-                        torch.mean(torch.tensor(feats.values.tolist()), dim=0)
-                    )
-                else:
-                    acoustic_holder.append(torch.tensor(feats.values.tolist()))
-                utterances.append(utt)
-                speakers.append(speaker)
-                genders.append(gender)
-                emotions.append(emotion)
-                intensities.append(intensity)
-                repetitions.append(repetition)
-                acoustic_lengths.append(feats.shape[0])
+    feats_files = [f for f in os.listdir(acoustic_path) if f.endswith(f_end)]
+    for f, feats in read_files_concurrently(
+        feats_files, read_feats, num_workers
+    ):
+        # get the labels
+        all_labels = f.split("_")[0]
+        labels_list = all_labels.split("-")
+
+        emotion = int(labels_list[2]) - 1  # to make it zero-based
+        intensity = int(labels_list[3]) - 1  # to make it zero based
+        utterance = int(labels_list[4])
+        repetition = int(labels_list[5])
+        speaker = int(labels_list[6])
+        if speaker % 2 == 0:
+            gender = 1
+        else:
+            gender = 2
+
+        if utterance % 2 == 0:
+            utt = utt_2
+        else:
+            utt = utt_1
+
+        # save the dataframe to a dict with (dialogue, utt) as key
+        if feats.shape[0] > 0:
+            # order of items: acoustic, utt, spkr, gender, emotion
+            #   intensity, repetition #, utt_length, acoustic_length
+            acoustic_holder.append(feats.to_numpy(dtype=np.float32))
+            acoustic_files.append(f)
+            utterances.append(utt)
+            speakers.append(speaker)
+            genders.append(gender)
+            emotions.append(emotion)
+            intensities.append(intensity)
+            repetitions.append(repetition)
+            acoustic_lengths.append(feats.shape[0])
 
     # convert data to torch tensors
     utterances = torch.tensor(utterances)
@@ -183,7 +196,19 @@ def make_ravdess_data_tensors(
     repetitions = torch.tensor(repetitions)
     acoustic_lengths = torch.tensor(acoustic_lengths)
 
-    if not add_avging:
+    if add_avging:
+        # average the frames of all files at once
+        summaries = AcousticSummaries.from_frames(
+            dict(zip(acoustic_files, acoustic_holder)), stats=("mean",)
+        )
+        acoustic_holder = [
+            torch.tensor(summaries.get(f), dtype=torch.float32)
+            for f in acoustic_files
+        ]
+    else:
+        acoustic_holder = [
+            torch.from_numpy(feats) for feats in acoustic_holder
+        ]
         acoustic_holder = nn.utils.rnn.pad_sequence(
             acoustic_holder, batch_first=True, padding_value=0
         )
@@ -0,0 +1,88 @@
+# normalize the text of utterances before looking their words up in GloVe
+# the same normalization is used to prepare the datasets and at inference
+# time; each distinct utterance is only normalized once
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# replaced with a space
+PUNCTUATION = ",.!?;:'\"-$’…[]()"
+
+# \x91, \x92 and \x97 are windows-1252 quotes and dashes found in some of the
+# transcripts; the last two become punctuation
+_TRANSLATION = str.maketrans(
+    {
+        "\x91": "",
+        "\x92": " ",
+        "\x97": " ",
+        **{char: " " for char in PUNCTUATION},
+    }
+)
+
+
+@lru_cache(maxsize=1 << 17)
+def normalize_text(text, lower=False):
+    """
+    Replace the punctuation in a word or utterance with spaces
+    Returns <UNK> if nothing else is left (<unk> if lower)
+    """
+    text = text.translate(_TRANSLATION)
+    if text.strip() == "":
+        text = "<UNK>"
+    if lower:
+        text = text.lower()
+    return text
+
+
+@lru_cache(maxsize=1 << 17)
+def get_words(text):
+    """
+    Get the words of an utterance as the ASIST data and models use them
+    (normalized, lowercased and split on single spaces)
+    """
+    return tuple(normalize_text(text, lower=True).strip().split(" "))
+
+
+def normalize_column(column, lower=False):
+    """
+    Normalize a whole pandas column of words or utterances at once, the same
+    way as normalize_text, working on each distinct value only once
+    Missing values are left as they are
+    """
+    uniques = pd.unique(column.dropna())
+    normalized = pd.Series(uniques, dtype=object).astype(str)
+    normalized = normalized.str.translate(_TRANSLATION)
+    normalized[normalized.str.strip() == ""] = "<UNK>"
+    if lower:
+        normalized = normalized.str.lower()
+    return column.map(dict(zip(uniques, normalized)))
+
+
+def get_word_indices(utts, wd2idx, length=None):
+    """
+    Get the indices of the words of many utterances at once
+    utts : list, array or pandas column of utterances
+    wd2idx : dict of word: index, with an index for <UNK>
+    length : the number of words to keep (that of the longest utterance if
+        None)
+    Returns a (num_utts, length) int64 array of indices padded with 0s, and
+    the number of words in each utterance; missing utterances are encoded
+    as empty ones
+    """
+    utts = pd.Series(np.asarray(utts, dtype=object)).fillna("")
+    codes, uniques = pd.factorize(utts)
+    unk = wd2idx["<UNK>"]
+    encoded = [
+        [wd2idx.get(wd, unk) for wd in get_words(utt)] for utt in uniques
+    ]
+    lengths = np.array([len(wds) for wds in encoded], dtype=np.int64)
+    if length is None:
+        length = lengths.max(initial=0)
+
+    indices = np.zeros((len(encoded), length), dtype=np.int64)
+    for i, wds in enumerate(encoded):
+        wds = wds[:length]
+        indices[i, : len(wds)] = wds
+    return indices[codes], lengths[codes]
@@ -57,6 +57,41 @@ class BaseGRU(nn.Module):
         return output
 
 
+class AcousticStreamState(object):
+    """
+    State of the acoustic encoder of a model for one stream of acoustic
+    feature vectors (e.g. the audio of one participant), carried across the
+    chunks of the stream so that each chunk is only processed once
+    """
+
+    def __init__(self):
+        # (h, c) of the acoustic LSTM after the last chunk
+        self.hidden = None
+        # sum of the feature vectors so far, for models that average them
+        self.total = None
+        self.num_frames = 0
+
+    def update(self, acoustic_rnn, acoustic_chunk, average=False):
+        """
+        Feed a chunk of feature vectors (num_frames x audio_dim) through the
+        acoustic LSTM starting from the current state, or add it to the
+        running sum if the model averages the vectors instead
+        """
+        acoustic_chunk = acoustic_chunk.reshape(
+            1, -1, acoustic_chunk.shape[-1]
+        )
+        if acoustic_chunk.shape[1] == 0:
+            return self
+
+        if average:
+            total = acoustic_chunk.sum(dim=1)
+            self.total = total if self.total is None else self.total + total
+        else:
+            _, self.hidden = acoustic_rnn(acoustic_chunk, self.hidden)
+        self.num_frames += acoustic_chunk.shape[1]
+        return self
+
+
 class EarlyFusionMultimodalModel(nn.Module):
     """
     An encoder to take a sequence of inputs and produce a sequence of intermediate representations
@@ -97,16 +132,17 @@ class EarlyFusionMultimodalModel(nn.Module):
         )
 
         # set the size of the input into the fc layers
-        if params.avgd_acoustic or params.add_avging:
-            self.fc_input_dim = params.text_gru_hidden_dim + params.audio_dim
-            # self.fc_input_dim = params.text_gru_hidden_dim + 20
-
+        # the acoustic fc layers take the averaged feature vector or the
+        # last hidden state of the acoustic LSTM, and always give an
+        # audio_dim vector
+        self.avg_acoustic = params.avgd_acoustic or params.add_avging
+        self.fc_input_dim = params.text_gru_hidden_dim + params.audio_dim
+        # self.fc_input_dim = params.text_gru_hidden_dim + 20
+
+        if self.avg_acoustic:
+            self.acoustic_fc_1 = nn.Linear(params.audio_dim, 100)
         else:
-            self.fc_input_dim = (
-                params.text_gru_hidden_dim + params.acoustic_gru_hidden_dim
-            )
-
-        self.acoustic_fc_1 = nn.Linear(params.audio_dim, 100)
+            self.acoustic_fc_1 = nn.Linear(params.acoustic_gru_hidden_dim, 100)
         # self.acoustic_fc_2 = nn.Linear(100, 20)
         self.acoustic_fc_2 = nn.Linear(100, params.audio_dim)
 
@@ -167,6 +203,43 @@ class EarlyFusionMultimodalModel(nn.Module):
         gender_input=None,
         get_prob_dist=False
     ):
+        encoded_text = self._encode_text(text_input, length_input)
+
+        if acoustic_len_input is not None:
+            # print(acoustic_input.shape)
+            # acoustic_input = self.acoustic_batch_norm(acoustic_input.permute(0, 2, 1))
+            # print(acoustic_input.shape)
+            # acoustic_input = acoustic_input.permute(0, 2, 1)
+            packed_acoustic = nn.utils.rnn.pack_padded_sequence(
+                acoustic_input,
+                acoustic_len_input,
+                batch_first=True,
+                enforce_sorted=False,
+            )
+
+            # print(packed_acoustic.data.shape)
+            (
+                packed_acoustic_output,
+                (acoustic_hidden, acoustic_cell),
+            ) = self.acoustic_rnn(packed_acoustic)
+            encoded_acoustic = F.dropout(acoustic_hidden[-1], self.dropout)
+            # encoded_acoustic = acoustic_hidden[-1]
+
+        else:
+            if len(acoustic_input.shape) > 2:
+                encoded_acoustic = acoustic_input.squeeze()
+            else:
+                encoded_acoustic = acoustic_input
+
+        return self._classify(
+            encoded_acoustic,
+            encoded_text,
+            speaker_input,
+            gender_input,
+            get_prob_dist,
+        )
+
+    def _encode_text(self, text_input, length_input):
         # using pretrained embeddings, so detach to not update weights
         # embs: (batch_size, seq_len, emb_dim)
         embs = F.dropout(self.embedding(text_input), 0.1).detach()
@@ -180,13 +253,6 @@ class EarlyFusionMultimodalModel(nn.Module):
         # all_embs = self.text_batch_norm(all_embs.permute(0, 2, 1))
         # all_embs = all_embs.permute(0, 2, 1)
 
-        # get speaker embeddings, if needed
-        if speaker_input is not None:
-            speaker_embs = self.speaker_embedding(speaker_input).squeeze(dim=1)
-            # speaker_embs = self.speaker_batch_norm(speaker_embs)
-        if gender_input is not None:
-            gender_embs = self.gender_embedding(gender_input)
-
         # packed = nn.utils.rnn.pack_padded_sequence(embs, length_input, batch_first=True, enforce_sorted=False)
         packed = nn.utils.rnn.pack_padded_sequence(
             all_embs, length_input, batch_first=True, enforce_sorted=False
@@ -218,31 +284,22 @@ class EarlyFusionMultimodalModel(nn.Module):
 
         # print(encoded_text.shape)
 
-        if acoustic_len_input is not None:
-            # print(acoustic_input.shape)
-            # acoustic_input = self.acoustic_batch_norm(acoustic_input.permute(0, 2, 1))
-            # print(acoustic_input.shape)
-            # acoustic_input = acoustic_input.permute(0, 2, 1)
-            packed_acoustic = nn.utils.rnn.pack_padded_sequence(
-                acoustic_input,
-                acoustic_len_input,
-                batch_first=True,
-                enforce_sorted=False,
-            )
-
-            # print(packed_acoustic.data.shape)
-            (
-                packed_acoustic_output,
-                (acoustic_hidden, acoustic_cell),
-            ) = self.acoustic_rnn(packed_acoustic)
-            encoded_acoustic = F.dropout(acoustic_hidden[-1], self.dropout)
-            # encoded_acoustic = acoustic_hidden[-1]
+        return encoded_text
 
-        else:
-            if len(acoustic_input.shape) > 2:
-                encoded_acoustic = acoustic_input.squeeze()
-            else:
-                encoded_acoustic = acoustic_input
+    def _classify(
+        self,
+        encoded_acoustic,
+        encoded_text,
+        speaker_input=None,
+        gender_input=None,
+        get_prob_dist=False,
+    ):
+        # get speaker embeddings, if needed
+        if speaker_input is not None:
+            speaker_embs = self.speaker_embedding(speaker_input).squeeze(dim=1)
+            # speaker_embs = self.speaker_batch_norm(speaker_embs)
+        if gender_input is not None:
+            gender_embs = self.gender_embedding(gender_input)
 
         encoded_acoustic = torch.tanh(
             F.dropout(self.acoustic_fc_1(encoded_acoustic), self.dropout)
@@ -287,6 +344,50 @@ class EarlyFusionMultimodalModel(nn.Module):
         # return the output
         return output
 
+    def update_acoustic_state(self, acoustic_chunk, state=None):
+        """
+        Feed the next chunk of acoustic feature vectors of a stream
+        (num_frames x audio_dim) through the acoustic encoder, starting from
+        the state left by the previous chunks (a new state if None)
+        Returns the updated state, one of which should be kept per stream
+        """
+        if state is None:
+            state = AcousticStreamState()
+        return state.update(
+            self.acoustic_rnn, acoustic_chunk, average=self.avg_acoustic
+        )
+
+    def predict_from_state(
+        self,
+        state,
+        text_input,
+        length_input,
+        speaker_input=None,
+        gender_input=None,
+        get_prob_dist=False,
+    ):
+        """
+        Get the prediction for a stream from the state of its acoustic
+        encoder, so a running prediction can be made after every chunk
+        without going over the previous chunks again
+        Once the whole utterance has been fed, this gives the same output as
+        forward (given the same random state, since dropout is applied)
+        """
+        encoded_text = self._encode_text(text_input, length_input)
+
+        if self.avg_acoustic:
+            encoded_acoustic = state.total / state.num_frames
+        else:
+            encoded_acoustic = F.dropout(state.hidden[0][-1], self.dropout)
+
+        return self._classify(
+            encoded_acoustic,
+            encoded_text,
+            speaker_input,
+            gender_input,
+            get_prob_dist,
+        )
+
 
 class LateFusionMultimodalModel(nn.Module):
     """
@@ -512,13 +613,6 @@ class AudioOnlyRNN(nn.Module):
         text_input=None,
         length_input=None,
     ):
-        # get speaker embeddings, if needed
-        if speaker_input is not None:
-            speaker_embs = self.speaker_embedding(speaker_input).squeeze(dim=1)
-            # speaker_embs = self.speaker_batch_norm(speaker_embs)
-        if gender_input is not None:
-            gender_embs = self.gender_embedding(gender_input)
-
         # normalize
         # acoustic_input = self.acoustic_batch_norm(acoustic_input)
         # pack acoustic input
@@ -534,6 +628,18 @@ class AudioOnlyRNN(nn.Module):
 
         encoded_acoustic = F.dropout(hidden[-1], 0.3)
 
+        return self._classify(encoded_acoustic, speaker_input, gender_input)
+
+    def _classify(
+        self, encoded_acoustic, speaker_input=None, gender_input=None
+    ):
+        # get speaker embeddings, if needed
+        if speaker_input is not None:
+            speaker_embs = self.speaker_embedding(speaker_input).squeeze(dim=1)
+            # speaker_embs = self.speaker_batch_norm(speaker_embs)
+        if gender_input is not None:
+            gender_embs = self.gender_embedding(gender_input)
+
         # encoded_acoustic = torch.tanh(F.dropout(self.acoustic_fc_1(encoded_acoustic), self.dropout))
         # encoded_acoustic = torch.tanh(F.dropout(self.acoustic_fc_2(encoded_acoustic), self.dropout))
 
@@ -555,6 +661,30 @@ class AudioOnlyRNN(nn.Module):
         # return the output
         return output
 
+    def update_acoustic_state(self, acoustic_chunk, state=None):
+        """
+        Feed the next chunk of acoustic feature vectors of a stream
+        (num_frames x audio_dim) through the acoustic LSTM, starting from the
+        state left by the previous chunks (a new state if None)
+        Returns the updated state, one of which should be kept per stream
+        """
+        if state is None:
+            state = AcousticStreamState()
+        return state.update(self.acoustic_rnn, acoustic_chunk)
+
+    def predict_from_state(
+        self, state, speaker_input=None, gender_input=None
+    ):
+        """
+        Get the prediction for a stream from the state of its acoustic LSTM,
+        so a running prediction can be made after every chunk without going
+        over the previous chunks again
+        Once the whole sequence has been fed, this gives the same output as
+        forward (given the same random state, since dropout is applied)
+        """
+        encoded_acoustic = F.dropout(state.hidden[0][-1], 0.3)
+        return self._classify(encoded_acoustic, speaker_input, gender_input)
+
 
 class TextOnlyCNN(nn.Module):
     """
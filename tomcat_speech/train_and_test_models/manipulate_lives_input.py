@@ -44,20 +44,10 @@ for item in os.listdir(trs_path):
                 )
             )
 
-            # uncomment the first time using
-            # extraction.expand_words("{0}/{1}.tsv".format(save_path, item_name),
-            #                         "{0}/{1}-expanded.csv".format(save_path, item_name))
-
-            # read in the saved csv
-            expanded_wds_df = pd.read_csv(
-                "{0}/{1}-expanded.csv".format(save_path, item_name), sep="\t"
-            )
-
-            # combine the files
-            combined = pd.merge(audio_df, expanded_wds_df, on="frameTime")
-
             # average across words and save as new csv
-            wd_avgd = extraction.avg_feats_across_words(combined)
+            wd_avgd = extraction.avg_feats_per_word(
+                audio_df, "{0}/{1}.tsv".format(save_path, item_name)
+            )
             wd_avgd.to_csv(
                 "{0}/{1}_avgd.csv".format(save_path, acoustic_savename)
             )
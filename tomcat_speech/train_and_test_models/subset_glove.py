@@ -3,14 +3,21 @@
 import data_prep.glove_subsetting as glove
 
 # set paths
-vocab_path = "/Volumes/LIvES/multimodal_data/"
+# directories with the text of each corpus
+vocab_paths = [
+    "/Volumes/LIvES/multimodal_data/",
+    "../../datasets/multimodal_datasets/MELD_formatted",
+    "../../datasets/multimodal_datasets/MUStARD",
+    "../../datasets/multimodal_datasets/Chalearn",
+    "../../datasets/multimodal_datasets/asist",
+]
 glove_path = "../../glove.twitter.27B/glove.twitter.27B.50d.txt"
 save_path = "../../glove.shorter.50d.txt"
 short_path = save_path
 vec_length = 50
 
 # get the set of all vocab from files
-vset = glove.get_all_vocab(vocab_path)
+vset = glove.collect_vocab(vocab_paths)
 # get subset of glove using this
 subset = glove.subset_glove(glove_path, vset, vec_len=vec_length)
 # save this subset
@@ -5,6 +5,11 @@
 from tomcat_speech.data_prep.asist_data.asist_dataset_creation import (
     AsistDataset,
 )
+from tomcat_speech.data_prep.asist_data.asist_pipeline import ACOUSTIC_COLUMNS
+from tomcat_speech.data_prep.asist_data.asist_store import AsistStore
+from tomcat_speech.data_prep.preprocessing_artifacts import (
+    PreprocessingArtifacts,
+)
 from tomcat_speech.models.train_and_test_models import *
 from tomcat_speech.models.input_models import *
 
@@ -51,6 +56,9 @@ glove_file = "../../glove.short.300d.txt"  # todo: change this?
 input_dir = "output/asist_audio"
 # to test the data--this doesn't contain real outcomes
 y_path = "output/asist_audio/asist_ys/all_ys.csv"
+# directory of a store of the encoded trials in input_dir; if set, only the
+# trials added to input_dir since the last run are read and encoded
+asist_store_path = None
 # set number of splits
 num_splits = 3
 # set model name and model type
@@ -89,11 +97,12 @@ if __name__ == "__main__":
 
     # 1. IMPORT AUDIO AND TEXT
     # make acoustic dict
-    acoustic_dict = make_acoustic_dict(
-        input_dir, "_avgd.csv", data_type="asist"
-    )
+    if asist_store_path is None:
+        acoustic_dict = make_acoustic_dict(
+            input_dir, "_avgd.csv", data_type="asist"
+        )
 
-    print("Acoustic dict created")
+        print("Acoustic dict created")
 
     # 1b. IMPORT SENTIMENT SCORES FOR INPUTS IF DESIRED
     if len(sys.argv) > 1 and sys.argv[1] == "use_sentiment_analyzer":
@@ -132,18 +141,38 @@ if __name__ == "__main__":
     print("Glove object created")
 
     # 3. MAKE DATASET
-    data = AsistDataset(
-        acoustic_dict,
-        glove,
-        cols_to_skip=cols_to_skip,
-        ys_path=y_path,
-        splits=3,
-        sequence_prep="pad",
-        truncate_from="start",
-        norm=None,
-    )
+    if asist_store_path is not None:
+        # add the new trials to the store
+        store = AsistStore(asist_store_path, glove)
+        new_trials = store.update(input_dir, "_avgd.csv")
+        print(f"{len(new_trials)} new trials added to the store")
+
+        data = AsistDataset.from_store(
+            store,
+            ys_path=y_path,
+            splits=3,
+            sequence_prep="pad",
+            norm=None,
+        )
+    else:
+        data = AsistDataset(
+            acoustic_dict,
+            glove,
+            cols_to_skip=cols_to_skip,
+            ys_path=y_path,
+            splits=3,
+            sequence_prep="pad",
+            truncate_from="start",
+            norm=None,
+        )
     print("Dataset created")
 
+    # save what is needed to encode new data the same way at inference
+    # time (see scripts/run_asist_analysis --preprocessing)
+    PreprocessingArtifacts.from_asist(data, ACOUSTIC_COLUMNS).save(
+        f"{model_save_path}/preprocessing.npz"
+    )
+
     # 6. CREATE NN
     # get set of pretrained embeddings and their shape
     pretrained_embeddings = glove.data
@@ -14,6 +14,10 @@ from tomcat_speech.models.input_models import *
 from tomcat_speech.data_prep.data_prep_helpers import *
 from tomcat_speech.data_prep.meld_data.meld_prep import *
 from tomcat_speech.data_prep.mustard_data.mustard_prep import *
+from tomcat_speech.data_prep.asist_data.asist_pipeline import ACOUSTIC_COLUMNS
+from tomcat_speech.data_prep.preprocessing_artifacts import (
+    PreprocessingArtifacts,
+)
 
 # Import parameters for model
 from tomcat_speech.models.parameters.multitask_params import params
@@ -85,21 +89,18 @@ if __name__ == "__main__":
         acoustic_length=params.audio_dim,
         glove=glove,
         add_avging=params.add_avging,
-        use_cols=[
-            "pcm_loudness_sma",
-            "F0finEnv_sma",
-            "voicingFinalUnclipped_sma",
-            "jitterLocal_sma",
-            "shimmerLocal_sma",
-            "pcm_loudness_sma_de",
-            "F0finEnv_sma_de",
-            "voicingFinalUnclipped_sma_de",
-            "jitterLocal_sma_de",
-            "shimmerLocal_sma_de",
-        ],
+        use_cols=ACOUSTIC_COLUMNS,
         avgd=avgd_acoustic,
     )
 
+    # save what is needed to encode new data the same way at inference
+    # time (see scripts/run_asist_analysis --preprocessing), which only
+    # handles averaged acoustic features
+    if avgd_acoustic_in_network:
+        PreprocessingArtifacts.from_meld(data, glove, ACOUSTIC_COLUMNS).save(
+            f"{model_save_path}/preprocessing.npz"
+        )
+
     # add class weights to device
     data.emotion_weights = data.emotion_weights.to(device)
     data.sentiment_weights = data.sentiment_weights.to(device)